@@ -0,0 +1,59 @@
+from bitcoin_tools.core.base58check import encode_check, encode_check_batch, decode_check_batch
+from hashlib import sha256
+from os import urandom
+from timeit import default_timer as timer
+
+try:
+    from base58 import b58encode, b58decode
+except ImportError:
+    b58encode = b58decode = None
+
+###########################################################
+# Base58Check: per-address base58 package vs batch codec  #
+###########################################################
+# ---------------------------------------------------------------------------------------------------------------------
+# Times the encoding and decoding of Bitcoin addresses, both following the per-address path (base58 package, checksum
+# computed by the caller) and with the batch codec, and checks that both produce exactly the same results.
+# ---------------------------------------------------------------------------------------------------------------------
+
+N_ADDRS = 50000
+
+# Version byte (mainnet / testnet) followed by a random RIPEMD-160 hash.
+payloads = [chr(0 if i % 2 else 111) + urandom(20) for i in range(N_ADDRS)]
+
+start = timer()
+addrs = encode_check_batch(payloads)
+encode_time = timer() - start
+
+start = timer()
+decoded = decode_check_batch(addrs)
+decode_time = timer() - start
+
+assert decoded == payloads
+assert addrs[:100] == [encode_check(p) for p in payloads[:100]]
+
+print "batch codec"
+print "\t encoding: " + str(N_ADDRS / encode_time) + " addr/s"
+print "\t decoding: " + str(N_ADDRS / decode_time) + " addr/s"
+
+if b58encode is None:
+    print "base58 is not installed, the per-address path will not be benchmarked."
+else:
+    start = timer()
+    ref_addrs = [b58encode(p + sha256(sha256(p).digest()).digest()[:4]) for p in payloads]
+    ref_encode_time = timer() - start
+
+    start = timer()
+    ref_decoded = []
+    for addr in ref_addrs:
+        data = b58decode(addr)
+        assert sha256(sha256(data[:-4]).digest()).digest()[:4] == data[-4:]
+        ref_decoded.append(data[:-4])
+    ref_decode_time = timer() - start
+
+    print "base58 package (per address)"
+    print "\t encoding: " + str(N_ADDRS / ref_encode_time) + " addr/s"
+    print "\t decoding: " + str(N_ADDRS / ref_decode_time) + " addr/s"
+
+    assert ref_addrs == addrs and ref_decoded == decoded, "Codecs disagree."
+    print "Both codecs produce identical addresses."
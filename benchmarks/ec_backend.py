@@ -0,0 +1,47 @@
+from bitcoin_tools.core import ec_backend
+from bitcoin_tools.core.keys import ecdsa_tx_sign, get_uncompressed_pk, serialize_pk
+from ecdsa import SigningKey, SECP256k1
+from timeit import default_timer as timer
+
+###########################################################
+# Elliptic curve backends: pure-Python ecdsa vs coincurve #
+###########################################################
+# ---------------------------------------------------------------------------------------------------------------------
+# Times transaction signing and public key decompression with every available backend, and checks that all of them
+# produce exactly the same signatures and keys.
+# ---------------------------------------------------------------------------------------------------------------------
+
+N_SIGS = 200
+N_KEYS = 2000
+
+sks = [SigningKey.from_secret_exponent(i + 1, curve=SECP256k1) for i in range(N_SIGS)]
+txs = ["%0200x" % (i * 0x9e3779b97f4a7c15) for i in range(N_SIGS)]
+compressed_pks = [serialize_pk(sk.get_verifying_key()) for sk in sks] * (N_KEYS / N_SIGS)
+
+backends = [ec_backend.ECDSA]
+if ec_backend.is_coincurve_installed():
+    backends.append(ec_backend.COINCURVE)
+else:
+    print "coincurve is not installed, only the ecdsa backend will be benchmarked."
+
+results = dict()
+for backend in backends:
+    ec_backend.set_backend(backend)
+
+    start = timer()
+    sigs = [ecdsa_tx_sign(tx, sk) for tx, sk in zip(txs, sks)]
+    sign_time = timer() - start
+
+    start = timer()
+    uncompressed_pks = [get_uncompressed_pk(pk) for pk in compressed_pks]
+    decompress_time = timer() - start
+
+    results[backend] = (sigs, uncompressed_pks)
+
+    print backend
+    print "\t signatures: " + str(N_SIGS / sign_time) + " sig/s"
+    print "\t decompressions: " + str(N_KEYS / decompress_time) + " keys/s"
+
+if len(results) > 1:
+    assert results[ec_backend.ECDSA] == results[ec_backend.COINCURVE], "Backends disagree."
+    print "Both backends produce identical signatures and keys."
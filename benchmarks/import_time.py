@@ -0,0 +1,49 @@
+from subprocess import check_output
+from sys import executable, exit
+
+###########################################################
+# Start-up time: importing the library modules            #
+###########################################################
+# ---------------------------------------------------------------------------------------------------------------------
+# Times the import of the main modules of the library, each one in a fresh interpreter, and checks that none of them
+# loads the heavy (or optional) dependencies they do not need straight away: those are only loaded on first use.
+# Exits with a non-zero status if any module loads any of them.
+# ---------------------------------------------------------------------------------------------------------------------
+
+N_RUNS = 5
+
+# Modules, together with the dependencies they must not load on import.
+HEAVY = ['plyvel', 'matplotlib', 'numpy', 'qrcode', 'PIL', 'coincurve', 'urllib2', 'httplib', 'bitcoin_tools.conf']
+MODULES = [('bitcoin_tools.core.keys', HEAVY),
+           ('bitcoin_tools.core.script', HEAVY),
+           ('bitcoin_tools.core.transaction', HEAVY),
+           ('bitcoin_tools.core.bip32', HEAVY),
+           ('bitcoin_tools.core.vault', HEAVY),
+           ('bitcoin_tools.wallet', HEAVY),
+           ('bitcoin_tools.analysis.status.utils', ['plyvel', 'matplotlib', 'numpy', 'qrcode', 'PIL']),
+           ('bitcoin_tools.analysis.plots', ['matplotlib', 'numpy'])]
+
+SCRIPT = """
+import sys
+from timeit import default_timer as timer
+start = timer()
+import %s
+print timer() - start
+print ' '.join(m for m in %r if sys.modules.get(m) is not None)
+"""
+
+failed = False
+for module, heavy in MODULES:
+    times = []
+    for _ in range(N_RUNS):
+        out = check_output([executable, "-c", SCRIPT % (module, heavy)]).splitlines()
+        times.append(float(out[0]))
+        loaded = out[1].split() if len(out) > 1 else []
+
+    print module
+    print "\t import time: " + str(min(times) * 1000) + " ms (best of " + str(N_RUNS) + ")"
+    if loaded:
+        print "\t loads on import: " + ", ".join(loaded)
+        failed = True
+
+exit(1 if failed else 0)
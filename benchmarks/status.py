@@ -0,0 +1,201 @@
+from bitcoin_tools.analysis.plots import get_cdf
+from bitcoin_tools.analysis.status.data_dump import transaction_dump, utxo_dump
+from bitcoin_tools.analysis.status.data_processing import get_samples
+from bitcoin_tools.analysis.status.plots import plots_from_samples
+from bitcoin_tools.analysis.status.synthetic import generate_chainstate
+from bitcoin_tools.analysis.status.utils import parse_ldb, decode_utxo, deobfuscate_value, aggregate_dust_np
+import bitcoin_tools.conf as conf
+from binascii import hexlify
+from datetime import datetime
+from getopt import getopt
+from multiprocessing import Process, Queue
+from os import path, walk
+from resource import getrusage, RUSAGE_SELF
+from shutil import rmtree
+from subprocess import check_output, CalledProcessError
+from sys import argv
+from tempfile import mkdtemp
+from timeit import default_timer as timer
+import ujson
+
+###########################################################
+# STATUS: chainstate decoding and analysis hot paths      #
+###########################################################
+# ---------------------------------------------------------------------------------------------------------------------
+# Generates a synthetic chainstate (see analysis/status/synthetic.py) at several scales and times every stage of the
+# STATUS pipeline over it, from the chainstate parsing to the chart rendering. Each stage runs in its own process, so
+# its peak memory usage can be reported as well. Results can be stored as JSON and compared between commits:
+#
+#   python benchmarks/status.py -s 10000,100000 -o before.json
+#   python benchmarks/status.py -s 10000,100000 -o after.json
+#   python benchmarks/status.py -c before.json,after.json
+# ---------------------------------------------------------------------------------------------------------------------
+
+SCALES = [10000, 100000]
+SEED = 0
+
+CHAINSTATE = "chainstate"
+F_UTXOS = "decoded_utxos.json"
+F_PARSED_TXS = "parsed_txs.json"
+F_PARSED_UTXOS = "parsed_utxos.json"
+F_DUST = "dust.json"
+UTXO_ATTRIBUTES = ['tx_height', 'amount', 'index', 'out_type', 'utxo_data_len', 'register_len']
+
+
+def count_lines(fin_name):
+    with open(conf.data_path + fin_name) as f:
+        return sum(1 for _ in f)
+
+
+def bench_parse_ldb(chainstate):
+    start = timer()
+    parse_ldb(F_UTXOS, fin_name=chainstate)
+    return timer() - start, count_lines(F_UTXOS)
+
+
+def bench_decode_utxo(chainstate):
+    import plyvel
+
+    # Only the decoding is timed: coins are read and deobfuscated beforehand.
+    db = plyvel.DB(chainstate, compression=None)
+    o_key = hexlify(db.get(b'\x0e\x00obfuscate_key'))[2:]
+    coins = [(hexlify(key), deobfuscate_value(o_key, hexlify(value))) for key, value in db.iterator(prefix=b'C')]
+    db.close()
+
+    start = timer()
+    for outpoint, coin in coins:
+        decode_utxo(coin, outpoint)
+    return timer() - start, len(coins)
+
+
+def bench_transaction_dump(_):
+    start = timer()
+    transaction_dump(F_UTXOS, F_PARSED_TXS)
+    return timer() - start, count_lines(F_UTXOS)
+
+
+def bench_utxo_dump(_):
+    start = timer()
+    utxo_dump(F_UTXOS, F_PARSED_UTXOS, 'bitcoin', count_p2sh=True)
+    return timer() - start, count_lines(F_UTXOS)
+
+
+def bench_aggregate_dust_np(_):
+    start = timer()
+    aggregate_dust_np(F_PARSED_UTXOS, fout_name=F_DUST)
+    return timer() - start, count_lines(F_PARSED_UTXOS)
+
+
+def bench_get_samples(_):
+    start = timer()
+    samples = get_samples(UTXO_ATTRIBUTES, fin_name=F_PARSED_UTXOS)
+    return timer() - start, len(samples[UTXO_ATTRIBUTES[0]])
+
+
+def bench_get_cdf(_):
+    samples = get_samples(UTXO_ATTRIBUTES, fin_name=F_PARSED_UTXOS)
+
+    start = timer()
+    for attribute in UTXO_ATTRIBUTES:
+        get_cdf(samples[attribute], normalize=True)
+    return timer() - start, len(samples[UTXO_ATTRIBUTES[0]])
+
+
+def bench_plots(_):
+    samples = get_samples(UTXO_ATTRIBUTES, fin_name=F_PARSED_UTXOS)
+    cdfs = [get_cdf(samples[attribute], normalize=True) for attribute in UTXO_ATTRIBUTES]
+
+    start = timer()
+    for attribute, (xs, ys) in zip(UTXO_ATTRIBUTES, cdfs):
+        plots_from_samples(xs=xs, ys=ys, xlabel=attribute, log_axis='x', save_fig="utxo_" + attribute)
+    return timer() - start, len(samples[UTXO_ATTRIBUTES[0]])
+
+
+# Stages run in order, since each of them reads the output of the previous ones.
+STAGES = [("parse_ldb", bench_parse_ldb), ("decode_utxo", bench_decode_utxo),
+          ("transaction_dump", bench_transaction_dump), ("utxo_dump", bench_utxo_dump),
+          ("aggregate_dust_np", bench_aggregate_dust_np), ("get_samples", bench_get_samples),
+          ("get_cdf", bench_get_cdf), ("plots", bench_plots)]
+
+
+def run_stage(stage, chainstate, queue):
+    seconds, records = stage(chainstate)
+    queue.put({"seconds": seconds, "records": records, "records_per_s": records / seconds,
+               "peak_rss_kb": getrusage(RUSAGE_SELF).ru_maxrss})
+
+
+def run_scale(n_utxos, work_dir):
+    chainstate = path.join(work_dir, CHAINSTATE)
+    start = timer()
+    generate_chainstate(chainstate, n_utxos, seed=SEED)
+    print "%d UTXOs (chainstate generated in %.2f s)" % (n_utxos, timer() - start)
+
+    results = {"chainstate_bytes": sum(path.getsize(path.join(d, f)) for d, _, fs in walk(chainstate) for f in fs)}
+    for name, stage in STAGES:
+        queue = Queue()
+        p = Process(target=run_stage, args=(stage, chainstate, queue))
+        p.start()
+        result = queue.get()
+        p.join()
+
+        results[name] = result
+        print "\t %-18s %8.3f s %12.0f records/s %8d KB peak RSS" % (name, result["seconds"],
+                                                                     result["records_per_s"], result["peak_rss_kb"])
+
+    return results
+
+
+def get_commit():
+    try:
+        return check_output(["git", "rev-parse", "--short", "HEAD"], cwd=path.dirname(path.abspath(__file__))).strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def compare(old_name, new_name):
+    old = ujson.load(open(old_name))
+    new = ujson.load(open(new_name))
+
+    print "%s (%s) vs %s (%s)" % (old_name, old["commit"], new_name, new["commit"])
+    for scale in sorted(set(old["scales"]) & set(new["scales"]), key=int):
+        print scale + " UTXOs"
+        for name, _ in STAGES:
+            if name in old["scales"][scale] and name in new["scales"][scale]:
+                o, n = old["scales"][scale][name], new["scales"][scale][name]
+                print "\t %-18s %8.3f s -> %8.3f s (x%.2f) %8d KB -> %8d KB peak RSS" % (
+                    name, o["seconds"], n["seconds"], o["seconds"] / n["seconds"], o["peak_rss_kb"], n["peak_rss_kb"])
+
+
+if __name__ == '__main__':
+    scales = SCALES
+    fout_name = None
+    compare_names = None
+
+    opts, _ = getopt(argv[1:], 's:o:c:', ['scales=', 'output=', 'compare='])
+
+    for opt, arg in opts:
+        if opt in ['-s', '--scales']:
+            scales = [int(s) for s in arg.split(',')]
+        elif opt in ['-o', '--output']:
+            fout_name = arg
+        elif opt in ['-c', '--compare']:
+            compare_names = arg.split(',')
+
+    if compare_names:
+        compare(*compare_names)
+
+    else:
+        report = {"commit": get_commit(), "date": datetime.now().isoformat(), "seed": SEED, "scales": dict()}
+
+        for n_utxos in scales:
+            # Every scale works on its own data and figures dirs, which are removed afterwards.
+            work_dir = mkdtemp()
+            conf.data_path = conf.figs_path = work_dir + "/"
+            try:
+                report["scales"][str(n_utxos)] = run_scale(n_utxos, work_dir)
+            finally:
+                rmtree(work_dir)
+
+        if fout_name:
+            with open(fout_name, 'w') as fout:
+                ujson.dump(report, fout, indent=2)
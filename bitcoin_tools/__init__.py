@@ -1,7 +1,24 @@
-try:
-    import bitcoin_tools.conf as CFG
-except ImportError:
-    raise Exception("You don't have a configuration file. Make a copy of sample_conf.py")
+class _Config(object):
+    """ Gives access to the configuration file (conf.py), which is only loaded the first time one of its parameters is
+    read. Modules that do not use any of them (e.g. keys or transaction handling) can be imported without it.
+    """
 
-if CFG.address_vault is None:
-    raise Exception("Address vault not found in your config file.")
+    def __init__(self):
+        self._conf = None
+
+    def __getattr__(self, name):
+        if self._conf is None:
+            try:
+                import bitcoin_tools.conf as conf
+            except ImportError:
+                raise Exception("You don't have a configuration file. Make a copy of sample_conf.py")
+
+            if conf.address_vault is None:
+                raise Exception("Address vault not found in your config file.")
+
+            self._conf = conf
+
+        return getattr(self._conf, name)
+
+
+CFG = _Config()
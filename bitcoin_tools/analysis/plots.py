@@ -1,15 +1,41 @@
 import os
-import matplotlib as mpl
-if not "DISPLAY" in os.environ.keys():
-    mpl.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
 from bitcoin_tools import CFG
+from multiprocessing import Pool, cpu_count
 
 label_size = 11
-mpl.rcParams['xtick.labelsize'] = label_size
-mpl.rcParams['ytick.labelsize'] = label_size
-mpl.rcParams['legend.numpoints'] = 1
+
+# CDFs with more points than CDF_THRESHOLD are downsampled before being plotted, keeping their shape within
+# CDF_TOLERANCE (see downsample_cdf).
+CDF_THRESHOLD = 10000
+CDF_TOLERANCE = 0.001
+
+# matplotlib (pyplot), loaded by get_pyplot the first time a plot is made. Loading it (and choosing its backend) takes
+# longer than loading the rest of the library, and most of the analysis does not plot anything.
+_plt = None
+
+
+def get_pyplot():
+    """ Gets matplotlib's pyplot, importing and setting it up (backend and default font sizes) on first use.
+
+    :return: The pyplot module.
+    :rtype: module
+    """
+
+    global _plt
+
+    if _plt is None:
+        import matplotlib as mpl
+        if not "DISPLAY" in os.environ.keys():
+            mpl.use('Agg')
+        import matplotlib.pyplot as plt
+
+        mpl.rcParams['xtick.labelsize'] = label_size
+        mpl.rcParams['ytick.labelsize'] = label_size
+        mpl.rcParams['legend.numpoints'] = 1
+
+        _plt = plt
+
+    return _plt
 
 
 def get_counts(samples, normalize=False):
@@ -22,6 +48,8 @@ def get_counts(samples, normalize=False):
     counts
     """
 
+    import numpy as np
+
     xs, ys = np.unique(samples, return_counts=True)
 
     if normalize:
@@ -41,12 +69,110 @@ def get_cdf(samples, normalize=False):
     occurrence counts (number of samples with value <= xi).
     """
 
+    import numpy as np
+
     [xs, ys] = get_counts(samples, normalize)
     ys = np.cumsum(ys)
 
     return [xs, ys]
 
 
+def get_cdf_from_counts(counts, normalize=False):
+    """
+    Compute the cumulative count over already counted samples (see get_cdf).
+
+    :param counts: dictionary with the number of occurrences of each value.
+    :param normalize: boolean, indicates if counts have to be normalized
+    :return: list of two lists: first list returns x values (sorted values in counts), second list returns cumulative
+    occurrence counts (number of samples with value <= xi).
+    """
+
+    import numpy as np
+
+    xs = sorted(counts.keys())
+    ys = np.cumsum([counts[x] for x in xs])
+
+    if normalize and len(ys):
+        ys = ys / float(ys[-1])
+
+    return [np.array(xs), ys]
+
+
+def downsample_cdf(xs, ys, tolerance=CDF_TOLERANCE, threshold=CDF_THRESHOLD):
+    """
+    Downsamples a CDF (from get_cdf) keeping its shape within a given tolerance (relative to the range of each axis).
+    The downsampled CDF holds:
+
+        - the first point reaching each cumulative level (levels spaced tolerance times the y range), so the vertical
+        distance to the original CDF is bounded by the tolerance,
+        - the first point of each log-x interval (intervals spaced tolerance times the log-x range), so the shape is
+        also kept in log-x charts, where most of the points may lie in a small share of the y range,
+        - both ends of every jump larger than a level, so no steep step gets smoothed, and
+        - the first and last points.
+
+    The number of points is therefore bounded by roughly 3 / tolerance.
+
+    :param xs: list with the (increasing) x values of the CDF.
+    :param ys: list with the cumulative counts of the CDF.
+    :param tolerance: float, maximum distance (relative to the range of each axis) between the original CDF and the
+    downsampled one.
+    :param threshold: integer, number of points above which the CDF is downsampled.
+    :return: list of two lists, x values and cumulative counts of the downsampled CDF (or the given values, if they have
+    fewer points than threshold or are not a CDF).
+    """
+
+    import numpy as np
+
+    if len(xs) <= threshold:
+        return [xs, ys]
+
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    steps = np.diff(ys)
+
+    # Only CDFs (non-decreasing cumulative counts over increasing numeric values) are downsampled.
+    if xs.dtype.kind not in 'biuf' or (steps < 0).any():
+        return [xs, ys]
+
+    indexes = [[0, len(xs) - 1]]
+
+    y_step = (ys[-1] - ys[0]) * tolerance
+    if y_step > 0:
+        indexes.append(np.searchsorted(ys, np.arange(ys[0], ys[-1], y_step)))
+
+        jumps = np.nonzero(steps > y_step)[0]
+        indexes.extend([jumps, jumps + 1])
+
+    first_positive = np.searchsorted(xs, 0, side='right')
+    if first_positive < len(xs) - 1:
+        log_min, log_max = np.log10(xs[first_positive]), np.log10(xs[-1])
+        if log_max > log_min:
+            indexes.append(np.searchsorted(xs, 10 ** np.arange(log_min, log_max, (log_max - log_min) * tolerance)))
+
+    # Bins are computed over floats, so rounding may place the last ones past the end.
+    indexes = np.unique(np.clip(np.concatenate(indexes).astype(int), 0, len(xs) - 1))
+
+    return [xs[indexes], ys[indexes]]
+
+
+def downsample_cdfs(xs, ys):
+    """
+    Downsamples a set of CDFs, as plotted by plot_distribution (see downsample_cdf).
+
+    :param xs: either a list with x values or a list of lists, representing different CDFs.
+    :param ys: either a list with y values or a list of lists, representing different CDFs.
+    :return: list of two lists, the x and y values of the downsampled CDFs (in the same format they were given).
+    """
+
+    import numpy as np
+
+    if not (isinstance(xs[0], list) or isinstance(xs[0], np.ndarray)):
+        return downsample_cdf(xs, ys)
+    else:
+        cdfs = [downsample_cdf(x, y) for x, y in zip(xs, ys)]
+        return [[x for x, _ in cdfs], [y for _, y in cdfs]]
+
+
 def plot_distribution(xs, ys, title, xlabel, ylabel, log_axis=None, save_fig=False, legend=None, legend_loc=1,
                       font_size=20, y_sup_lim=None):
     """
@@ -70,6 +196,12 @@ def plot_distribution(xs, ys, title, xlabel, ylabel, log_axis=None, save_fig=Fal
     :type: None
     """
 
+    import numpy as np
+    plt = get_pyplot()
+
+    # Large CDFs are drawn (and stored) with a bounded number of points.
+    xs, ys = downsample_cdfs(xs, ys)
+
     plt.figure()
     ax = plt.subplot(111)
 
@@ -126,6 +258,9 @@ def plot_pie(values, labels, title, colors, save_fig=False, font_size=20, labels
     :param font_size: integer, title, xlabel and ylabel font size
     """
 
+    import numpy as np
+    plt = get_pyplot()
+
     plt.figure()
     ax = plt.subplot(111)
 
@@ -149,5 +284,64 @@ def plot_pie(values, labels, title, colors, save_fig=False, font_size=20, labels
     # Output result
     if save_fig:
         plt.savefig(CFG.figs_path + save_fig + '.pdf', format='pdf', dpi=600)
+        plt.close()
     else:
         plt.show()
+
+
+def _init_render_worker():
+    # Workers only save figures to disk, so they use a non-interactive backend regardless of the display.
+    import matplotlib as mpl
+    mpl.use('Agg', warn=False, force=True)
+
+
+class PlotQueue:
+    """ Queue of figures (plot_distribution and plot_pie calls) rendered and saved by a pool of worker processes, in the
+    background, while the calling process goes on with the analysis. Figures are only rendered in the calling process
+    if a single process is used.
+
+    Jobs are sent to the workers with all their data, so large CDFs should be downsampled first (see downsample_cdf).
+    """
+
+    def __init__(self, processes=None):
+        if processes is None:
+            processes = cpu_count()
+
+        self.processes = processes
+        self._pool = None
+        self._results = []
+
+    def put(self, f, *args, **kwargs):
+        """ Queues a figure to be rendered.
+
+        :param f: Plotting function (plot_distribution or plot_pie), which must save the figure.
+        :type f: function
+        :param args: Positional arguments of f.
+        :param kwargs: Keyword arguments of f.
+        :return: None
+        :rtype: None
+        """
+
+        if self.processes == 1:
+            f(*args, **kwargs)
+        else:
+            if self._pool is None:
+                self._pool = Pool(self.processes, _init_render_worker)
+            self._results.append(self._pool.apply_async(f, args, kwargs))
+
+    def join(self):
+        """ Waits until all the queued figures have been rendered. Errors raised while rendering are raised here.
+
+        :return: None
+        :rtype: None
+        """
+
+        if self._pool is not None:
+            try:
+                for result in self._results:
+                    result.get()
+            finally:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+                self._results = []
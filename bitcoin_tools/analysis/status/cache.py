@@ -0,0 +1,231 @@
+from bitcoin_tools.analysis.status import CFG
+from cPickle import dump, load, HIGHEST_PROTOCOL
+from functools import wraps
+from hashlib import sha256
+from inspect import getcallargs, getsourcefile
+from os import getpid, listdir, makedirs, path, remove, rename
+from sys import modules
+from types import CodeType, ModuleType
+
+# Dir (under CFG.data_path) where aggregates are cached.
+CACHE_DIR = "/cache/"
+
+# Bytes read at once while fingerprinting an input file (see fingerprint).
+FINGERPRINT_BLOCK = 2**20
+
+# Arguments that do not change the result of an aggregate (so they are not part of its key).
+IGNORED_ARGS = ['stage', 'queue']
+
+_enabled = True
+
+# Fingerprints computed so far by this process, by file path, size and modification time.
+_fingerprints = dict()
+
+
+def is_enabled():
+    """ Checks whether aggregates are being cached (and cached ones reused) or not.
+
+    :return: True if the cache is enabled, False otherwise.
+    :rtype: bool
+    """
+
+    return _enabled
+
+
+def set_enabled(enabled):
+    """ Enables or disables the aggregate cache. Cached aggregates are kept while the cache is disabled.
+
+    :param enabled: Whether aggregates are cached or not.
+    :type enabled: bool
+    :return: None
+    :rtype: None
+    """
+
+    global _enabled
+
+    _enabled = enabled
+
+
+def clear_cache():
+    """ Removes every cached aggregate.
+
+    :return: None
+    :rtype: None
+    """
+
+    cache_dir = CFG.data_path + CACHE_DIR
+    if path.isdir(cache_dir):
+        for f in listdir(cache_dir):
+            remove(cache_dir + f)
+
+
+def fingerprint(fin_name):
+    """
+    Fingerprints an input file (under CFG.data_path) by its contents, so a file regenerated from the same data (e.g. by
+    parsing the same chainstate snapshot again) keeps its fingerprint. Hashing a file is way faster than parsing it, and
+    it is only done once per process unless the file changes.
+
+    :param fin_name: Input file name.
+    :type fin_name: str
+    :return: The fingerprint of the file.
+    :rtype: hex str
+    """
+
+    fin_path = path.abspath(CFG.data_path + fin_name)
+    file_id = (fin_path, path.getsize(fin_path), path.getmtime(fin_path))
+
+    if file_id not in _fingerprints:
+        h = sha256()
+        with open(fin_path, 'rb') as fin:
+            block = fin.read(FINGERPRINT_BLOCK)
+            while block:
+                h.update(block)
+                block = fin.read(FINGERPRINT_BLOCK)
+        _fingerprints[file_id] = h.hexdigest()
+
+    return _fingerprints[file_id]
+
+
+def _get_code_key(code):
+    # Code objects nested in the constants (e.g. a lambda defined inside a filter) are keyed by their own code, since
+    # their repr includes their address.
+    consts = [_get_code_key(c) if isinstance(c, CodeType) else repr(c) for c in code.co_consts]
+    return sha256(code.co_code + repr(consts) + repr(code.co_names)).hexdigest()
+
+
+def _is_param(value):
+    # Globals read by a function that may change its result: plain data (e.g. thresholds) and other functions. Any other
+    # object (modules, classes, caches...) is left aside, since its repr is not stable across runs.
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_param(v) for v in value)
+    elif isinstance(value, dict):
+        return all(_is_param(k) and _is_param(v) for k, v in value.items())
+    else:
+        return value is None or isinstance(value, (bool, int, long, float, str, unicode)) or hasattr(value, 'func_code')
+
+
+def _get_arg_key(value, seen=None):
+    # Functions (such as the filters of the analysis, usually lambdas) are identified by their code and the values they
+    # enclose, default to, or read from their module globals (e.g. a threshold defined at module level), since their
+    # repr changes on every run.
+    if hasattr(value, 'func_code'):
+        if seen is None:
+            seen = set()
+        if id(value) in seen:
+            # Recursive functions.
+            return "function"
+        seen.add(id(value))
+
+        code = value.func_code
+        closure = [_get_arg_key(cell.cell_contents, seen) for cell in value.func_closure or []]
+        defaults = _get_arg_key(value.func_defaults or (), seen)
+        global_values = [(name, _get_arg_key(value.func_globals[name], seen)) for name in code.co_names
+                         if name in value.func_globals and _is_param(value.func_globals[name])]
+        return "function:" + sha256(_get_code_key(code) + repr(closure) + repr(defaults) +
+                                    repr(global_values)).hexdigest()
+    elif isinstance(value, (list, tuple)):
+        return [_get_arg_key(v, seen) for v in value]
+    elif isinstance(value, dict):
+        return sorted((repr(k), _get_arg_key(v, seen)) for k, v in value.items())
+    else:
+        return repr(value)
+
+
+def _get_source_version(module_name):
+    module = modules.get(module_name)
+    source = getsourcefile(module) if module is not None else None
+
+    if source is None:
+        return None
+
+    with open(source, 'rb') as fin:
+        return sha256(fin.read()).hexdigest()
+
+
+def _get_code_version(f):
+    # Aggregates are invalidated whenever the module computing them changes, or any module of the package it uses (the
+    # ones whose functions, classes or submodules it references), but the config file.
+    dependencies = set([f.__module__])
+    for value in f.func_globals.values():
+        name = value.__name__ if isinstance(value, ModuleType) else getattr(value, '__module__', None)
+        if isinstance(name, str) and name.startswith("bitcoin_tools.") and name != CFG.__name__:
+            dependencies.add(name)
+
+    versions = [(name, _get_source_version(name)) for name in sorted(dependencies)]
+    versions.append(("code", _get_code_key(f.func_code)))
+
+    return sha256(repr(versions)).hexdigest()
+
+
+def cached(*fin_args, **options):
+    """
+    Decorates a function computing an aggregate from one or more input files (under CFG.data_path), so its result is
+    cached in disk and reused by any later call over the same inputs. Results are keyed by the fingerprint of the input
+    files, the name of the function, the rest of its arguments, the parameters it depends on and the version of its
+    code, so they are invalidated when any of them changes.
+
+    Module-level parameters read by the function (e.g. the fee range of the dust analysis) have to be given as params,
+    since they are not part of its arguments nor (if defined elsewhere) of its module.
+
+    :param fin_args: Names of the arguments of the function holding input file names (or lists of them).
+    :type fin_args: str
+    :param params: Function returning the parameters the result depends on, by name (evaluated on every call). Passed
+    as keyword argument. None by default.
+    :type params: function
+    :return: The decorator.
+    :rtype: function
+    """
+
+    params = options.pop('params', None)
+    if options:
+        raise Exception("Unknown options " + ", ".join(sorted(options)))
+
+    def decorator(f):
+        # The version is computed on the first call, once every module the function uses has been loaded.
+        version = []
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return f(*args, **kwargs)
+
+            if not version:
+                version.append(_get_code_version(f))
+
+            key = [f.__module__, f.__name__, version[0]]
+            if params is not None:
+                key.append(('params', _get_arg_key(params())))
+            for name, value in sorted(getcallargs(f, *args, **kwargs).items()):
+                if name in fin_args:
+                    fin_names = value if isinstance(value, (list, tuple)) else [value]
+                    key.append((name, [fingerprint(fin_name) for fin_name in fin_names]))
+                elif name not in IGNORED_ARGS:
+                    key.append((name, _get_arg_key(value)))
+
+            cache_dir = CFG.data_path + CACHE_DIR
+            cache_file = cache_dir + f.__name__ + "-" + sha256(repr(key)).hexdigest() + ".pickle"
+
+            if path.isfile(cache_file):
+                with open(cache_file, 'rb') as fin:
+                    return load(fin)
+
+            result = f(*args, **kwargs)
+
+            # Results are written to a temporary file first (one per process, since several ones may be computing the
+            # same aggregate), so no half written result is ever loaded.
+            if not path.isdir(cache_dir):
+                try:
+                    makedirs(cache_dir)
+                except OSError:
+                    # Created by another process in the meantime.
+                    pass
+            tmp_file = cache_file + "." + str(getpid()) + ".tmp"
+            with open(tmp_file, 'wb') as fout:
+                dump(result, fout, HIGHEST_PROTOCOL)
+            rename(tmp_file, cache_file)
+
+            return result
+
+        return wrapper
+
+    return decorator
@@ -1,11 +1,14 @@
 from bitcoin_tools import CFG
 from bitcoin_tools.analysis.status import FEE_STEP
-from bitcoin_tools.analysis.status.utils import check_multisig, get_min_input_size, roundup_rate, check_multisig_type, \
-    get_serialized_size_fast, get_est_input_size, load_estimation_data, check_native_segwit
+from bitcoin_tools.analysis.status.utils import check_multisig, get_min_input_size, roundup_rate, get_non_std_types, \
+    get_serialized_size_fast, get_est_input_size, load_estimation_data, decompress_scripts
 import ujson
 
+# Number of UTXOs processed at once by utxo_dump.
+DUMP_CHUNK_SIZE = 50000
 
-def transaction_dump(fin_name, fout_name):
+
+def transaction_dump(fin_name, fout_name, stage=None):
     """
     Reads from a parsed utxo file and dumps additional metadata related to transactions.
 
@@ -13,6 +16,8 @@ def transaction_dump(fin_name, fout_name):
     :type fin_name: str
     :param fout_name: Name of the file where the final data will be stored.
     :type fout_name: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
     :return: None
     :rtype: None
     """
@@ -39,7 +44,10 @@ def transaction_dump(fin_name, fout_name):
         else:
             # Save previous transaction data
             if tx:
-                fout.write(ujson.dumps(tx) + '\n')
+                tx_line = ujson.dumps(tx) + '\n'
+                fout.write(tx_line)
+                if stage is not None:
+                    stage.update(0, 0, len(tx_line))
 
             # Create the new transaction
             tx['tx_id'] = utxo.get('tx_id')
@@ -49,14 +57,19 @@ def transaction_dump(fin_name, fout_name):
             tx['height'] = utxo["height"]
             tx['coinbase'] = utxo["coinbase"]
 
+        if stage is not None:
+            stage.update(1, len(line))
+
     fout.write(ujson.dumps(tx) + '\n')
     fin.close()
     fout.close()
 
 
-def utxo_dump(fin_name, fout_name, coin, count_p2sh=False, non_std_only=False):
+def utxo_dump(fin_name, fout_name, coin, count_p2sh=False, non_std_only=False, full_scripts=False, processes=None,
+              stage=None):
     """
-    Reads from a parsed utxo file and dumps additional metadata related to utxos.
+    Reads from a parsed utxo file and dumps additional metadata related to utxos. UTXOs are processed in chunks of
+    DUMP_CHUNK_SIZE.
 
     :param non_std_only: Whether or not run the analysis only with non-standard outputs
     :type non_std_only: bool
@@ -67,6 +80,12 @@ def utxo_dump(fin_name, fout_name, coin, count_p2sh=False, non_std_only=False):
     :param fout_name: Name of the file where the final data will be stored.
     :type fout_name: str
     :param coin: Currency that will be analysed 
+    :param full_scripts: Whether or not the (decompressed) scriptPubKey of every UTXO is exported (as "script").
+    :type full_scripts: bool
+    :param processes: Number of worker processes used to decompress scripts (all the available cores by default).
+    :type processes: int
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
     :return: None
     :rtype: None
     """
@@ -78,16 +97,41 @@ def utxo_dump(fin_name, fout_name, coin, count_p2sh=False, non_std_only=False):
     # Output file
     fout = open(CFG.data_path + fout_name, 'w')
 
+    estimation_data = load_estimation_data(coin)
+
+    chunk = []
+    for line in fin:
+        chunk.append(ujson.loads(line[:-1]))
+
+        if len(chunk) == DUMP_CHUNK_SIZE:
+            _dump_chunk(chunk, fout, coin, count_p2sh, non_std_only, estimation_data, full_scripts, processes, stage)
+            chunk = []
+
+        if stage is not None:
+            stage.update(1, len(line))
+
+    _dump_chunk(chunk, fout, coin, count_p2sh, non_std_only, estimation_data, full_scripts, processes, stage)
+
+    fin.close()
+    fout.close()
+
+
+def _dump_chunk(utxos, fout, coin, count_p2sh, non_std_only, estimation_data, full_scripts, processes, stage):
+    # Computes the metadata of a chunk of utxos (see utxo_dump) and stores it in fout.
+
     # Standard UTXO types
     std_types = [0, 1, 2, 3, 4, 5]
 
-    p2pkh_pksize, p2sh_scriptsize, nonstd_scriptsize, p2wsh_scriptsize, max_height = load_estimation_data(coin)
+    p2pkh_pksize, p2sh_scriptsize, nonstd_scriptsize, p2wsh_scriptsize, max_height = estimation_data
 
-    for line in fin:
-        utxo = ujson.loads(line[:-1])
+    # Non-standard scripts are classified at once for the whole chunk (see get_non_std_types).
+    non_std = [i for i, utxo in enumerate(utxos) if utxo["out"]["out_type"] not in std_types]
+    non_std_types = dict(zip(non_std, get_non_std_types([utxos[i]["out"]["data"] for i in non_std])))
+
+    results = []
+    for i, utxo in enumerate(utxos):
         tx_id = utxo.get('tx_id')
         out = utxo.get("out")
-
         # Checks whether we are looking for every type of UTXO or just for non-standard ones.
         if not non_std_only or (non_std_only and out["out_type"] not in std_types and not check_multisig(out['data'])):
 
@@ -113,17 +157,7 @@ def utxo_dump(fin_name, fout_name, coin, count_p2sh=False, non_std_only=False):
                 np_est = roundup_rate(raw_np_est, FEE_STEP)
 
                 # Adds multisig type info
-                if out["out_type"] in [0, 1, 2, 3, 4, 5]:
-                    non_std_type = "std"
-                else:
-                    multisig = check_multisig_type(out["data"])
-                    segwit = check_native_segwit(out["data"])
-                    if multisig:
-                        non_std_type = multisig
-                    elif segwit[0]:
-                        non_std_type = segwit[1]
-                    else:
-                        non_std_type = False
+                non_std_type = non_std_types.get(i, "std")
 
                 # Builds the output dictionary
                 result = {"tx_id": tx_id,
@@ -145,8 +179,19 @@ def utxo_dump(fin_name, fout_name, coin, count_p2sh=False, non_std_only=False):
                 # result["est_size"] = get_est_input_size(out, utxo["height"], p2pkh_pksize, p2sh_scriptsize,
                 #                                         nonstd_scriptsize, p2wsh_scriptsize)}
 
-                # Updates the dictionary with the remaining data from out, and stores it in disk.
+                # Updates the dictionary with the remaining data from out.
                 result.update(out)
-                fout.write(ujson.dumps(result) + '\n')
-    fin.close()
-    fout.close()
+                results.append(result)
+
+    # Scripts are decompressed at once for the whole chunk, so uncompressed P2PK keys are decompressed in batches (see
+    # decompress_scripts).
+    if full_scripts:
+        scripts = decompress_scripts([r["data"] for r in results], [r["out_type"] for r in results], processes)
+        for result, script in zip(results, scripts):
+            result["script"] = script
+
+    for result in results:
+        result_line = ujson.dumps(result) + '\n'
+        fout.write(result_line)
+        if stage is not None:
+            stage.update(0, 0, len(result_line))
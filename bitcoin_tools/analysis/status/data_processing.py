@@ -1,8 +1,10 @@
 from bitcoin_tools.analysis.status import *
+from bitcoin_tools.analysis.status.cache import cached
+from math import floor, log10
 import ujson
 
 
-def get_samples(x_attribute, fin_name):
+def get_samples(x_attribute, fin_name, stage=None):
     """
     Reads data from .json files and creates a list with the attribute of interest values.
 
@@ -10,6 +12,8 @@ def get_samples(x_attribute, fin_name):
     :type x_attribute: str or list
     :param fin_name: Input file from which data is loaded.
     :type fin_name: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
     :return: A dictionary with x_attribute as keys and a list of the requested samples as values.
     :rtype: dict
     """
@@ -30,12 +34,15 @@ def get_samples(x_attribute, fin_name):
         for attribute in samples:
             samples[attribute].append(data[attribute])
 
+        if stage is not None:
+            stage.update(1, len(line))
+
     fin.close()
 
     return samples
 
 
-def get_filtered_samples(x_attribute, fin_name, filtr):
+def get_filtered_samples(x_attribute, fin_name, filtr, stage=None):
     """
     Reads data from .json files and creates a list with the attribute of interest values.
 
@@ -45,6 +52,8 @@ def get_filtered_samples(x_attribute, fin_name, filtr):
     :type fin_name: str
     :param filtr: Function to filter samples (returns a boolean value for a given sample)
     :type filtr: function or list of functions
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
     :return: A list of the requested samples filtered using all the given filters.
     :rtype: list
     """
@@ -75,11 +84,132 @@ def get_filtered_samples(x_attribute, fin_name, filtr):
                     samples[i].append(data[x_attribute])
                 else:
                     samples.append(data[x_attribute])
+
+        if stage is not None:
+            stage.update(1, len(line))
     fin.close()
 
     return samples
 
 
+def round_value(value, precision):
+    """
+    Rounds (down) a numeric value to a given number of significant digits. Non numeric values are left untouched.
+
+    :param value: Value to be rounded.
+    :type value: int or float
+    :param precision: Number of significant digits.
+    :type precision: int
+    :return: The rounded value.
+    :rtype: int or float
+    """
+
+    if not isinstance(value, (int, long, float)) or isinstance(value, bool) or value == 0:
+        return value
+
+    exponent = int(floor(log10(abs(value)))) - precision + 1
+
+    # Integers with fewer digits than the precision are already exact.
+    if exponent <= 0 and not isinstance(value, float):
+        return value
+
+    magnitude = 10 ** exponent if exponent >= 0 else 10. ** exponent
+
+    return value - value % magnitude
+
+
+@cached('fin_name')
+def get_value_counts(x_attribute, fin_name, precision=None, stage=None):
+    """
+    Reads data from .json files and counts the occurrences of every value of the attributes of interest. Counts hold
+    the same information than samples (see get_samples) for CDFs and pie charts, while being way smaller. Results are
+    cached (see cache.cached).
+
+    Attributes with lots of different values (such as amounts) can be rounded to a given precision, which bounds the
+    size of their counts (e.g. 3 significant digits lead to at most 900 different values per order of magnitude).
+
+    Counts of different files (or of different parts of a file) can be merged by adding them up.
+
+    :param x_attribute: Attribute to plot (must be a key in the dictionary of the dumped data).
+    :type x_attribute: str or list
+    :param fin_name: Input file from which data is loaded.
+    :type fin_name: str
+    :param precision: Number of significant digits values are rounded (down) to (see round_value). Exact by default.
+    :type precision: int
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :return: A dictionary with x_attribute as keys and the number of occurrences of each value as values.
+    :rtype: dict
+    """
+
+    fin = open(CFG.data_path + fin_name, 'r')
+
+    if not isinstance(x_attribute, list):
+        x_attribute = [x_attribute]
+
+    # Create one counter per each attribute requested
+    counts = dict()
+    for attribute in x_attribute:
+        counts[attribute] = dict()
+
+    for line in fin:
+        data = ujson.loads(line[:-1])
+
+        for attribute, attribute_counts in counts.items():
+            value = data[attribute]
+            if precision is not None:
+                value = round_value(value, precision)
+            attribute_counts[value] = attribute_counts.get(value, 0) + 1
+
+        if stage is not None:
+            stage.update(1, len(line))
+
+    fin.close()
+
+    return counts
+
+
+@cached('fin_name')
+def get_filtered_value_counts(x_attribute, fin_name, filtr, stage=None):
+    """
+    Reads data from .json files and counts the occurrences of every value of the attribute of interest, filtered (see
+    get_filtered_samples). Results are cached (see cache.cached).
+
+    :param x_attribute: A single attribute to plot (must be a key in the dictionary of the dumped data).
+    :type x_attribute: str
+    :param fin_name: Input file from which data is loaded.
+    :type fin_name: str
+    :param filtr: Function to filter samples (returns a boolean value for a given sample)
+    :type filtr: function or list of functions
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :return: The number of occurrences of each value of the samples passing each filter (a list of them if more than
+    one filter is given).
+    :rtype: dict or list of dicts
+    """
+
+    fin = open(CFG.data_path + fin_name, 'r')
+
+    if not isinstance(filtr, list):
+        filtr = [filtr]
+
+    counts = [dict() for _ in filtr]
+
+    for line in fin:
+        data = ujson.loads(line[:-1])
+
+        for f, filter_counts in zip(filtr, counts):
+            if filter_sample(data, f):
+                value = data[x_attribute]
+                filter_counts[value] = filter_counts.get(value, 0) + 1
+
+        if stage is not None:
+            stage.update(1, len(line))
+    fin.close()
+
+    return counts if len(filtr) > 1 else counts[0]
+
+
 def filter_sample(sample, filtr):
     """
     Applies a given filter to a sample, returning the sample if the filter is passed, or None otherwise.
@@ -0,0 +1,217 @@
+from bitcoin_tools.analysis.status import CFG
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from os import rename
+from resource import getrusage, RUSAGE_SELF
+from timeit import default_timer as timer
+import ujson
+
+# Records processed between two checks of the clock (checking it for every record would slow down hot loops).
+CHECK_EVERY = 1000
+
+
+class Stage:
+    """ Progress of a stage of the analysis. Stages report every processed record (see update), and the elapsed time,
+    rate, ETA and peak memory are derived from them.
+
+    The ETA is computed over bytes (instead of records), since the size of the input files is known beforehand while
+    the number of records is not. Stages whose input size is unknown can set their progress directly instead.
+    """
+
+    def __init__(self, name, total_bytes=None, report_interval=10, on_report=None):
+        self.name = name
+        self.total_bytes = total_bytes
+        self.report_interval = report_interval
+        self.on_report = on_report
+
+        self.records = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_kb = 0
+        self.progress = None
+        self.start = timer()
+        self.end = None
+
+        self._next_check = CHECK_EVERY
+        self._last_report = self.start
+
+    def update(self, records=1, bytes_read=0, bytes_written=0):
+        """ Reports progress to the stage.
+
+        :param records: Number of records processed.
+        :type records: int
+        :param bytes_read: Number of bytes read.
+        :type bytes_read: int
+        :param bytes_written: Number of bytes written.
+        :type bytes_written: int
+        :return: None
+        :rtype: None
+        """
+
+        self.records += records
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+        if self.records >= self._next_check:
+            self._next_check = self.records + CHECK_EVERY
+            now = timer()
+            if now - self._last_report >= self.report_interval:
+                self._last_report = now
+                if self.on_report is not None:
+                    self.on_report(self)
+
+    def get_elapsed(self):
+        return (self.end if self.end is not None else timer()) - self.start
+
+    def get_rate(self):
+        elapsed = self.get_elapsed()
+        return self.records / elapsed if elapsed else 0.
+
+    def get_progress(self):
+        if self.end is not None:
+            return 1.
+        elif self.progress is not None:
+            return self.progress
+        elif self.total_bytes:
+            return min(self.bytes_read / float(self.total_bytes), 1.)
+
+    def get_eta(self):
+        progress = self.get_progress()
+        if progress:
+            return self.get_elapsed() * (1 - progress) / progress
+
+    def to_dict(self):
+        """ Gets the metrics of the stage.
+
+        :return: The metrics of the stage, by name.
+        :rtype: dict
+        """
+
+        # Peak memory is the one of the whole process so far (and it is only measured when reporting, until the stage
+        # ends).
+        if self.end is None:
+            self.peak_rss_kb = max(self.peak_rss_kb, getrusage(RUSAGE_SELF).ru_maxrss)
+
+        return {"records": self.records, "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                "elapsed_seconds": self.get_elapsed(), "records_per_second": self.get_rate(),
+                "progress": self.get_progress(), "eta_seconds": self.get_eta(), "peak_rss_kb": self.peak_rss_kb,
+                "done": self.end is not None}
+
+    def __str__(self):
+        metrics = self.to_dict()
+
+        summary = "%s: %d records, %.0f records/s" % (self.name, metrics["records"], metrics["records_per_second"])
+        if not metrics["done"] and metrics["progress"] is not None:
+            summary += ", %.1f%%" % (metrics["progress"] * 100)
+        if not metrics["done"] and metrics["eta_seconds"] is not None:
+            summary += ", ETA " + str(timedelta(seconds=int(metrics["eta_seconds"])))
+        if metrics["done"]:
+            summary += ", done in " + str(timedelta(seconds=int(metrics["elapsed_seconds"])))
+
+        return summary + ", peak RSS %d MB" % (metrics["peak_rss_kb"] / 1024)
+
+
+class Instrumentation:
+    """ Collects the metrics of every stage of an experiment (see run_analysis.run_experiment), and reports them
+    periodically (and at the end of every stage) to the log, a JSON metrics file and / or a Prometheus textfile (for
+    the node_exporter textfile collector).
+
+    Stages can also be profiled (with cProfile), storing their stats as <stage name>.prof under CFG.data_path.
+    """
+
+    def __init__(self, log=True, json_file=None, prom_file=None, profile=False, report_interval=10):
+        self.log = log
+        self.json_file = json_file
+        self.prom_file = prom_file
+        self.profile = profile
+        self.report_interval = report_interval
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, total_bytes=None):
+        """ Runs a stage of the experiment. Progress is reported to the returned Stage.
+
+        :param name: Name of the stage.
+        :type name: str
+        :param total_bytes: Size of the stage input (in bytes), used to estimate its progress. Unknown by default.
+        :type total_bytes: int
+        :return: The stage.
+        :rtype: Stage
+        """
+
+        stage = Stage(name, total_bytes, self.report_interval, self.report)
+        self.stages.append(stage)
+
+        if self.profile:
+            from cProfile import Profile
+            profiler = Profile()
+            profiler.enable()
+
+        try:
+            yield stage
+        finally:
+            stage.end = timer()
+            stage.peak_rss_kb = max(stage.peak_rss_kb, getrusage(RUSAGE_SELF).ru_maxrss)
+
+            if self.profile:
+                profiler.disable()
+                profiler.dump_stats(CFG.data_path + "/" + name + ".prof")
+
+            self.report(stage)
+
+    def report(self, stage):
+        """ Reports the progress of a given stage to the log, and the metrics of every stage so far to the metrics
+        files.
+
+        :param stage: The stage to be reported.
+        :type stage: Stage
+        :return: None
+        :rtype: None
+        """
+
+        if self.log:
+            print "\t" + str(stage)
+
+        if self.json_file:
+            metrics = {"updated": datetime.now().isoformat(), "stages": [dict(s.to_dict(), name=s.name)
+                                                                          for s in self.stages]}
+            _write_atomically(self.json_file, ujson.dumps(metrics, indent=2))
+
+        if self.prom_file:
+            _write_atomically(self.prom_file, self.to_prometheus())
+
+    def to_prometheus(self):
+        """ Gets the metrics of every stage so far in Prometheus text format.
+
+        :return: The metrics of every stage.
+        :rtype: str
+        """
+
+        metrics = [("records", "Records processed by the stage."),
+                   ("bytes_read", "Bytes read by the stage."),
+                   ("bytes_written", "Bytes written by the stage."),
+                   ("elapsed_seconds", "Time elapsed since the stage started."),
+                   ("records_per_second", "Records processed by the stage per second."),
+                   ("progress", "Share of the input of the stage processed so far."),
+                   ("eta_seconds", "Estimated time left for the stage to finish."),
+                   ("peak_rss_kb", "Peak memory usage of the process at the end of the stage (in kilobytes)."),
+                   ("done", "Whether the stage has finished or not.")]
+        values = [(s.name, s.to_dict()) for s in self.stages]
+
+        lines = []
+        for metric, description in metrics:
+            lines.append("# HELP status_stage_%s %s" % (metric, description))
+            lines.append("# TYPE status_stage_%s gauge" % metric)
+            for name, stage_metrics in values:
+                if stage_metrics[metric] is not None:
+                    lines.append('status_stage_%s{stage="%s"} %s' % (metric, name, repr(float(stage_metrics[metric]))))
+
+        return "\n".join(lines) + "\n"
+
+
+def _write_atomically(fout_name, data):
+    # Metrics files may be read at any time (e.g. by the Prometheus node_exporter), so they are never left half written.
+    with open(fout_name + ".tmp", 'w') as fout:
+        fout.write(data)
+    rename(fout_name + ".tmp", fout_name)
+
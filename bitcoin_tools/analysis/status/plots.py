@@ -1,11 +1,10 @@
-from bitcoin_tools.analysis.plots import plot_distribution, plot_pie
+from bitcoin_tools.analysis.plots import plot_distribution, plot_pie, downsample_cdfs
 from collections import Counter
-import numpy as np
 from bitcoin_tools.analysis.status.data_processing import get_samples
 
 
 def plots_from_samples(xs, ys, ylabel="Number of txs", xlabel=None, log_axis=None, save_fig=False, legend=None,
-                       legend_loc=1, font_size=20):
+                       legend_loc=1, font_size=20, queue=None):
     """
     Generates plots from utxo/tx samples extracted from utxo_dump.
 
@@ -28,29 +27,41 @@ def plots_from_samples(xs, ys, ylabel="Number of txs", xlabel=None, log_axis=Non
     :type legend_loc: int
     :param font_size: Title, xlabel and ylabel font size
     :type font_size: int
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). If None (or if the charts are not
+    saved) they are rendered straight away.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
 
     title = ""
 
+    # Samples are CDFs (with as many points as different values). Large ones are downsampled once, before being sent to
+    # plot_distribution (which may be called more than once, or from another process).
+    xs, ys = downsample_cdfs(xs, ys)
+
     if isinstance(log_axis, list) and isinstance(save_fig, list):
         # If both the normal axis and the logx axis charts want to be displayed, we can take advantage of the same
         # parsing to speed up the process.
-        for lx, sf in zip(log_axis, save_fig):
-            plot_distribution(xs, ys, title, xlabel, ylabel, lx, sf, legend, legend_loc, font_size)
+        charts = zip(log_axis, save_fig)
     else:
         # Otherwise we just print one chart.
-        plot_distribution(xs, ys, title, xlabel, ylabel, log_axis, save_fig, legend, legend_loc, font_size)
+        charts = [(log_axis, save_fig)]
+
+    for lx, sf in charts:
+        if queue is not None and sf:
+            queue.put(plot_distribution, xs, ys, title, xlabel, ylabel, lx, sf, legend, legend_loc, font_size)
+        else:
+            plot_distribution(xs, ys, title, xlabel, ylabel, lx, sf, legend, legend_loc, font_size)
 
 
 def plot_pie_chart_from_samples(samples, title="", labels=None, groups=None, colors=None, save_fig=False, font_size=20,
-                                labels_out=False):
+                                labels_out=False, queue=None):
     """
     Generates pie charts from UTXO/tx data extracted from utxo_dump.
 
-    :param samples: Samples to be printed (from get_samples)
-    :type: list
+    :param samples: Samples to be printed (from get_samples), or their number of occurrences (from get_value_counts)
+    :type: list or dict
     :param title: Title of the chart.
     :type title: str
     :param labels: List of labels (one label for each piece of the pie)
@@ -65,6 +76,9 @@ def plot_pie_chart_from_samples(samples, title="", labels=None, groups=None, col
     :type font_size: int
     :param labels_out: Whether the labels are placed inside the pie or not.
     :type labels_out: bool
+    :param queue: Queue the chart is rendered by (see analysis.plots.PlotQueue). If None (or if the chart is not saved)
+    it is rendered straight away.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -85,9 +99,13 @@ def plot_pie_chart_from_samples(samples, title="", labels=None, groups=None, col
     if len(labels) == len(groups) + 1:
         # We assume the last group is "others"
         current_sum = sum(values)
-        values.append(len(samples) - current_sum)
+        values.append(sum(ctr.values()) - current_sum)
 
-    plot_pie(values, labels, title, colors, save_fig=save_fig, font_size=font_size, labels_out=labels_out)
+    if queue is not None and save_fig:
+        queue.put(plot_pie, values, labels, title, colors, save_fig=save_fig, font_size=font_size,
+                  labels_out=labels_out)
+    else:
+        plot_pie(values, labels, title, colors, save_fig=save_fig, font_size=font_size, labels_out=labels_out)
 
 
 def overview_from_file(tx_fin_name, utxo_fin_name):
@@ -102,6 +120,8 @@ def overview_from_file(tx_fin_name, utxo_fin_name):
     :rtype: None
     """
 
+    import numpy as np
+
     samples = get_samples(['num_utxos', 'total_len', 'height'], fin_name=tx_fin_name)
 
     print "\t Max height: ", str(max(samples['height']))
@@ -1,10 +1,14 @@
-from bitcoin_tools.analysis.plots import get_cdf
+from bitcoin_tools.analysis.plots import get_cdf_from_counts, PlotQueue
 from bitcoin_tools.analysis.status.data_dump import transaction_dump, utxo_dump
 from bitcoin_tools.analysis.status.utils import parse_ldb, aggregate_dust_np
-from data_processing import get_samples, get_filtered_samples
+from bitcoin_tools.analysis.status.instrumentation import Instrumentation
+from bitcoin_tools.analysis.status.timeseries import TimeSeries, add_snapshot
+from bitcoin_tools.analysis.status import cache
+from data_processing import get_value_counts, get_filtered_value_counts
 from bitcoin_tools.analysis.status.plots import plot_pie_chart_from_samples, overview_from_file, plots_from_samples
 from bitcoin_tools import CFG
 from getopt import getopt
+from os.path import getsize
 from sys import argv
 
 
@@ -39,12 +43,14 @@ def set_out_names(count_p2sh, non_std_only):
     return f_utxos, f_parsed_txs, f_parsed_utxos, f_dust
 
 
-def non_std_outs_analysis(samples):
+def non_std_outs_analysis(samples, queue=None):
     """
     Perform the non standard out analysis for a given set of samples.
 
-    :param samples: List of samples that will form the chart.
-    :type samples: list
+    :param samples: Samples that will form the chart (or their number of occurrences, see get_value_counts).
+    :type samples: list or dict
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -57,24 +63,27 @@ def non_std_outs_analysis(samples):
     # and 3-3, and put the rest into "Other".
 
     groups = [[u'multisig-1-3'], [u'multisig-1-2'], [u'multisig-1-1'], [u'multisig-3-3'], [u'multisig-2-2'],
-              [u'multisig-2-3'], ["P2WSH"], ["P2WPKH"], [False, u'multisig-OP_NOTIF-OP_NOTIF',
-                                  u'multisig-<2153484f55544f555420544f2023424954434f494e2d41535345545320202020202020202'
-                                  u'0202020202020202020202020202020202020202020202020202020>-1']]
-    labels = ['M. 1-3', 'M. 1-2', 'M. 1-1', 'M. 3-3', 'M. 2-2', 'M. 2-3', "P2WSH", "P2WPKH", 'Other']
+              [u'multisig-2-3'], ["P2WSH"], ["P2WPKH"], ["P2TR"], [False]]
+    labels = ['M. 1-3', 'M. 1-2', 'M. 1-1', 'M. 3-3', 'M. 2-2', 'M. 2-3', "P2WSH", "P2WPKH", "P2TR", 'Other']
 
     out_name = "utxo_non_std_type"
 
     plot_pie_chart_from_samples(samples=samples, save_fig=out_name, labels=labels, groups=groups, title="",
                                 colors=["#165873", "#428C5C", "#4EA64B", "#ADD96C", "#B1D781", "#FAD02F",
-                                                   "#A69229", "#B69229", "#F69229"], labels_out=True)
+                                                   "#A69229", "#B69229", "#D69229", "#F69229"], labels_out=True,
+                                queue=queue)
 
 
-def tx_based_analysis(tx_fin_name):
+def tx_based_analysis(tx_fin_name, stage=None, queue=None):
     """
     Performs a transaction based analysis from a given input file (resulting from a transaction dump of the chainstate)
 
     :param tx_fin_name: Input file path which contains the chainstate transaction dump.
     :type: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -94,24 +103,28 @@ def tx_based_analysis(tx_fin_name):
     pie_groups = [[[1], [0]]]
     pie_colors = [["#165873", "#428C5C"]]
 
-    samples = get_samples(x_attributes + [x_attr_pie],  fin_name=tx_fin_name)
-    samples_pie = samples.pop(x_attr_pie)
+    counts = get_value_counts(x_attributes + [x_attr_pie], fin_name=tx_fin_name, stage=stage)
+    counts_pie = counts.pop(x_attr_pie)
 
     for attribute, label, log, out in zip(x_attributes, xlabels, log_axis, out_names):
-        xs, ys = get_cdf(samples[attribute], normalize=True)
-        plots_from_samples(xs=xs, ys=ys, xlabel=label, log_axis=log, save_fig=out, ylabel="Number of txs")
+        xs, ys = get_cdf_from_counts(counts[attribute], normalize=True)
+        plots_from_samples(xs=xs, ys=ys, xlabel=label, log_axis=log, save_fig=out, ylabel="Number of txs", queue=queue)
 
     for label, out, groups, colors in (zip(xlabels_pie, out_names_pie, pie_groups, pie_colors)):
-        plot_pie_chart_from_samples(samples=samples_pie, save_fig=out, labels=label, title="", groups=groups,
-                                    colors=colors, labels_out=True)
+        plot_pie_chart_from_samples(samples=counts_pie, save_fig=out, labels=label, title="", groups=groups,
+                                    colors=colors, labels_out=True, queue=queue)
 
 
-def utxo_based_analysis(utxo_fin_name):
+def utxo_based_analysis(utxo_fin_name, stage=None, queue=None):
     """
     Performs a utxo based analysis from a given input file (resulting from a utxo dump of the chainstate)
 
     :param utxo_fin_name: Input file path which contains the chainstate utxo dump.
     :type: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -135,21 +148,22 @@ def utxo_based_analysis(utxo_fin_name):
 
     # Since the attributes for the pie chart are already included in the normal chart, we won't pass them to the
     # sampling function.
-    samples = get_samples(x_attributes + [x_attribute_special], fin_name=utxo_fin_name)
-    samples_special = samples.pop(x_attribute_special)
+    counts = get_value_counts(x_attributes + [x_attribute_special], fin_name=utxo_fin_name, stage=stage)
+    counts_special = counts.pop(x_attribute_special)
 
     for attribute, label, log, out in zip(x_attributes, xlabels, log_axis, out_names):
-        xs, ys = get_cdf(samples[attribute], normalize=True)
-        plots_from_samples(xs=xs, ys=ys, xlabel=label, log_axis=log, save_fig=out, ylabel="Number of UTXOs")
+        xs, ys = get_cdf_from_counts(counts[attribute], normalize=True)
+        plots_from_samples(xs=xs, ys=ys, xlabel=label, log_axis=log, save_fig=out, ylabel="Number of UTXOs",
+                           queue=queue)
 
     for attribute, label, out, groups in (zip(x_attributes_pie, xlabels_pie, out_names_pie, pie_groups)):
-        plot_pie_chart_from_samples(samples=samples[attribute], save_fig=out, labels=label, title="", groups=groups,
-                                    colors=["#165873", "#428C5C", "#4EA64B", "#ADD96C"], labels_out=True)
+        plot_pie_chart_from_samples(samples=counts[attribute], save_fig=out, labels=label, title="", groups=groups,
+                                    colors=["#165873", "#428C5C", "#4EA64B", "#ADD96C"], labels_out=True, queue=queue)
     # Special case: non-standard
-    non_std_outs_analysis(samples_special)
+    non_std_outs_analysis(counts_special, queue=queue)
 
 
-def dust_analysis(utxo_fin_name, f_dust, fltr=None):
+def dust_analysis(utxo_fin_name, f_dust, fltr=None, stage=None, queue=None):
     """
     Performs a dust analysis by aggregating al the dust of a utxo dump file.
 
@@ -159,13 +173,17 @@ def dust_analysis(utxo_fin_name, f_dust, fltr=None):
     :type f_dust: str
     :param fltr: Filter to be applied to the samples. None by default.
     :type fltr: function
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
 
     # Generate plots for dust analysis (including percentage scale).
     # First, the dust accumulation file is generated
-    data = aggregate_dust_np(utxo_fin_name, fout_name=f_dust, fltr=fltr)
+    data = aggregate_dust_np(utxo_fin_name, fout_name=f_dust, fltr=fltr, stage=stage)
 
     # # Or we can load it from a dust file if we have already created it
     # data = load(open(CFG.data_path + f_dust))
@@ -183,7 +201,7 @@ def dust_analysis(utxo_fin_name, f_dust, fltr=None):
         ys = [sorted(data[l].values(), key=int) for l in labels]
 
         plots_from_samples(xs=xs, ys=ys, save_fig=out, legend=legend, legend_loc=4, xlabel='Fee rate (sat./byte)',
-                           ylabel=ylabel)
+                           ylabel=ylabel, queue=queue)
 
         # Get values in percentage
         ys_perc = []
@@ -192,16 +210,20 @@ def dust_analysis(utxo_fin_name, f_dust, fltr=None):
             ys_perc.append(y_perc)
 
         plots_from_samples(xs=xs, ys=ys_perc, save_fig='perc_' + out, legend=legend, legend_loc=4,
-                           xlabel='Fee rate (sat./byte)', ylabel=ylabel)
+                           xlabel='Fee rate (sat./byte)', ylabel=ylabel, queue=queue)
 
 
-def dust_analysis_all_fees(utxo_fin_name):
+def dust_analysis_all_fees(utxo_fin_name, stage=None, queue=None):
     """
     Performs a dust analysis for all fee rates, that is, up until all samples are considered dust (plot shows cdf up
     until 1).
 
     :param utxo_fin_name: Input file path which contains the chainstate utxo dump.
     :type: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -213,24 +235,28 @@ def dust_analysis_all_fees(utxo_fin_name):
     log_axis = ['x']
 
     for attribute, label, log, out, legend in zip(x_attributes, xlabels, log_axis, out_names, legends):
-        samples = get_samples(attribute, fin_name=utxo_fin_name)
+        counts = get_value_counts(attribute, fin_name=utxo_fin_name, stage=stage)
         xs = []
         ys = []
         for a in attribute:
-            x, y = get_cdf(samples[a], normalize=True)
+            x, y = get_cdf_from_counts(counts[a], normalize=True)
             xs.append(x)
             ys.append(y)
 
         plots_from_samples(xs=xs, ys=ys, xlabel=label, log_axis=log, save_fig=out, ylabel="Number of UTXOs",
-                           legend=legend, legend_loc=4)
+                           legend=legend, legend_loc=4, queue=queue)
 
 
-def utxo_based_analysis_with_filters(utxo_fin_name):
+def utxo_based_analysis_with_filters(utxo_fin_name, stage=None, queue=None):
     """
     Performs an utxo data analysis using different filters, to obtain for examples the amount of SegWit outputs.
 
     :param utxo_fin_name: Input file path which contains the chainstate utxo dump.
     :type: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -244,6 +270,7 @@ def utxo_based_analysis_with_filters(utxo_fin_name):
                lambda x: x["out_type"] in [2, 3, 4, 5],
                lambda x: x["non_std_type"] == "P2WPKH",
                lambda x: x["non_std_type"] == "P2WSH",
+               lambda x: x["non_std_type"] == "P2TR",
                lambda x: x["non_std_type"] is not False and "multisig" in x["non_std_type"],
                lambda x: x["non_std_type"] is False,
                lambda x: x["amount"] == 1,
@@ -256,33 +283,37 @@ def utxo_based_analysis_with_filters(utxo_fin_name):
                lambda x: x["out_type"] == 1,
                lambda x: x["amount"] == 1]
 
-    legends = [['P2PKH', 'P2SH', 'P2PK', 'P2WPKH', 'P2WSH', 'Multisig', 'Other'],
+    legends = [['P2PKH', 'P2SH', 'P2PK', 'P2WPKH', 'P2WSH', 'P2TR', 'Multisig', 'Other'],
                ['$=1$', '$1 < x \leq 10$', '$10 < x \leq 10^2$', '$10^2 < x \leq 10^4$', '$10^4 < x \leq 10^6$',
                 '$10^6 < x \leq 10^8$', '$10^8 < x$'], ['P2SH'], ['Amount = 1']]
     comparative = [True, True, False, False]
     legend_loc = 2
 
-    samples = get_filtered_samples(x_attribute, fin_name=utxo_fin_name, filtr=filters)
+    counts = get_filtered_value_counts(x_attribute, fin_name=utxo_fin_name, filtr=filters, stage=stage)
 
     for out, legend, comp in zip(out_names, legends, comparative):
         xs = []
         ys = []
         for _ in range(len(legend)):
-            x, y = get_cdf(samples.pop(0), normalize=True)
+            x, y = get_cdf_from_counts(counts.pop(0), normalize=True)
             xs.append(x)
             ys.append(y)
 
         plots_from_samples(xs=xs, ys=ys, xlabel=xlabel, save_fig=out, legend=legend, legend_loc=legend_loc,
-                           ylabel="Number of UTXOs")
+                           ylabel="Number of UTXOs", queue=queue)
 
 
-def tx_based_analysis_with_filters(tx_fin_name):
+def tx_based_analysis_with_filters(tx_fin_name, stage=None, queue=None):
     """
     Performs a transaction data analysis using different filters, to obtain for example the amount of coinbase
     transactions.
 
     :param tx_fin_name: Input file path which contains the chainstate transaction dump.
     :type: str
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
     :return: None
     :rtype: None
     """
@@ -292,14 +323,15 @@ def tx_based_analysis_with_filters(tx_fin_name):
     out_names = ['tx_height_coinbase']
     filters = [lambda x: x["coinbase"]]
 
-    samples = get_filtered_samples(x_attributes, fin_name=tx_fin_name, filtr=filters)
-    xs, ys = get_cdf(samples, normalize=True)
+    counts = get_filtered_value_counts(x_attributes, fin_name=tx_fin_name, filtr=filters, stage=stage)
+    xs, ys = get_cdf_from_counts(counts, normalize=True)
 
     for label, out in zip(xlabels, out_names):
-        plots_from_samples(xs=xs, ys=ys, xlabel=label, save_fig=out, ylabel="Number of txs")
+        plots_from_samples(xs=xs, ys=ys, xlabel=label, save_fig=out, ylabel="Number of txs", queue=queue)
 
 
-def run_experiment(coin, chainstate, count_p2sh, non_std_only):
+def run_experiment(coin, chainstate, count_p2sh, non_std_only, instrumentation=None, processes=None, store=None,
+                   height=None, timestamp=None):
     """
     Runs the whole experiment. You may comment the parts of it you are not interested in to save time.
 
@@ -311,46 +343,86 @@ def run_experiment(coin, chainstate, count_p2sh, non_std_only):
     :type count_p2sh: bool
     :param non_std_only: Whether the experiment is performed only counting non standard outputs.
     :type non_std_only:bool
+    :param instrumentation: Instrumentation every stage reports its progress to. Progress is only logged by default.
+    :type instrumentation: Instrumentation
+    :param processes: Number of processes charts are rendered by (all the available cores by default).
+    :type processes: int
+    :param store: Time series store the summary of the analysed snapshot is appended to (see timeseries.py). Not
+    summarized by default.
+    :type store: TimeSeries
+    :param height: Height of the analysed snapshot, as stored in the time series store. The height of its most recent
+    UTXO by default.
+    :type height: int
+    :param timestamp: Timestamp of the analysed snapshot (in seconds since epoch), as stored in the time series store.
+    Missing (NaN) by default.
+    :type timestamp: float
     :return:
     """
 
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+
+    # Charts are rendered in the background while the analysis goes on.
+    queue = PlotQueue(processes)
+
     # The following analysis reads/writes from/to large data files. Some of the steps can be ignored if those files have
     # already been created (if more updated data is not requited). Otherwise lot of time will be put in re-parsing large
-    # files.
+    # files. The aggregates computed from them are cached (see cache.py), so running the analysis again over the same
+    # files only re-plots the charts.
 
     # Set the name of the output data files
     f_utxos, f_parsed_txs, f_parsed_utxos, f_dust = set_out_names(count_p2sh, non_std_only)
 
     # Parse all the data in the chainstate.
     print "Parsing the chainstate."
-    parse_ldb(f_utxos, fin_name=chainstate)
+    with instrumentation.stage("parse_ldb") as stage:
+        parse_ldb(f_utxos, fin_name=chainstate, stage=stage)
 
     # Parses transactions and utxos from the dumped data.
     print "Adding meta-data for transactions and UTXOs."
-    transaction_dump(f_utxos, f_parsed_txs)
-    utxo_dump(f_utxos, f_parsed_utxos, coin, count_p2sh=count_p2sh, non_std_only=non_std_only)
+    with instrumentation.stage("transaction_dump", getsize(CFG.data_path + f_utxos)) as stage:
+        transaction_dump(f_utxos, f_parsed_txs, stage=stage)
+    with instrumentation.stage("utxo_dump", getsize(CFG.data_path + f_utxos)) as stage:
+        utxo_dump(f_utxos, f_parsed_utxos, coin, count_p2sh=count_p2sh, non_std_only=non_std_only, stage=stage)
 
     # Print basic stats from data
     print "Running overview analysis."
-    overview_from_file(f_parsed_txs, f_parsed_utxos)
+    with instrumentation.stage("overview"):
+        overview_from_file(f_parsed_txs, f_parsed_utxos)
 
     # Generate plots from tx data (from f_parsed_txs)
     print "Running transaction based analysis."
-    tx_based_analysis(f_parsed_txs)
+    with instrumentation.stage("tx_based_analysis", getsize(CFG.data_path + f_parsed_txs)) as stage:
+        tx_based_analysis(f_parsed_txs, stage=stage, queue=queue)
 
     # Generate plots from utxo data (from f_parsed_utxos)
     print "Running UTXO based analysis."
-    utxo_based_analysis(f_parsed_utxos)
+    with instrumentation.stage("utxo_based_analysis", getsize(CFG.data_path + f_parsed_utxos)) as stage:
+        utxo_based_analysis(f_parsed_utxos, stage=stage, queue=queue)
 
     # # Aggregates dust and generates plots.
     print "Running dust analysis."
-    dust_analysis(f_parsed_utxos, f_dust)
-    dust_analysis_all_fees(f_parsed_utxos)
+    with instrumentation.stage("dust_analysis", getsize(CFG.data_path + f_parsed_utxos)) as stage:
+        dust_analysis(f_parsed_utxos, f_dust, stage=stage, queue=queue)
+    with instrumentation.stage("dust_analysis_all_fees", getsize(CFG.data_path + f_parsed_utxos)) as stage:
+        dust_analysis_all_fees(f_parsed_utxos, stage=stage, queue=queue)
+
+    # Appends the summary of the snapshot to the time series store, so trends can be plotted without parsing it again.
+    if store is not None:
+        print "Summarizing the snapshot."
+        with instrumentation.stage("summary", getsize(CFG.data_path + f_parsed_utxos)) as stage:
+            add_snapshot(store, f_parsed_utxos, f_dust, height, timestamp, stage=stage)
 
     # Generate plots with filters
     print "Running analysis with filters."
-    utxo_based_analysis_with_filters(f_parsed_utxos)
-    tx_based_analysis_with_filters(f_parsed_txs)
+    with instrumentation.stage("utxo_based_analysis_with_filters", getsize(CFG.data_path + f_parsed_utxos)) as stage:
+        utxo_based_analysis_with_filters(f_parsed_utxos, stage=stage, queue=queue)
+    with instrumentation.stage("tx_based_analysis_with_filters", getsize(CFG.data_path + f_parsed_txs)) as stage:
+        tx_based_analysis_with_filters(f_parsed_txs, stage=stage, queue=queue)
+
+    print "Rendering charts."
+    with instrumentation.stage("render_charts"):
+        queue.join()
 
 
 if __name__ == '__main__':
@@ -359,8 +431,15 @@ if __name__ == '__main__':
     non_std_only = False
     count_p2sh = True
     coin = CFG.default_coin
+    json_file = None
+    prom_file = None
+    profile = False
+    store = None
+    height = None
+    timestamp = None
 
-    opts, _ = getopt(argv[1:], 'c:pn', ['coin=', 'count_p2sh', 'non_std'])
+    opts, _ = getopt(argv[1:], 'c:pnm:t:', ['coin=', 'count_p2sh', 'non_std', 'metrics=', 'prometheus=', 'profile',
+                                            'no_cache', 'timeseries=', 'height=', 'timestamp='])
 
     for opt, arg in opts:
         if opt in ['c', '--coin']:
@@ -369,6 +448,20 @@ if __name__ == '__main__':
             count_p2sh = True
         elif opt in ['n', '--non_std_only']:
             non_std_only = True
+        elif opt in ['-m', '--metrics']:
+            json_file = arg
+        elif opt in ['--prometheus']:
+            prom_file = arg
+        elif opt in ['--profile']:
+            profile = True
+        elif opt in ['--no_cache']:
+            cache.set_enabled(False)
+        elif opt in ['-t', '--timeseries']:
+            store = TimeSeries(arg)
+        elif opt in ['--height']:
+            height = int(arg)
+        elif opt in ['--timestamp']:
+            timestamp = float(arg)
 
     # When not using a snapshot, we directly use the chainstate under btc_core_dir (actually that's its default value)
     chainstate = CFG.chainstate_path
@@ -376,4 +469,11 @@ if __name__ == '__main__':
     # When using snapshots of the chainstate, specify the path to the chainstate snapshot
     # chainstate = path_to_snapshot
 
-    run_experiment(coin, chainstate, count_p2sh, non_std_only)
+    # Progress of every stage is logged, and optionally stored as JSON (-m) and / or as a Prometheus textfile. Stages
+    # can also be profiled (--profile).
+    instrumentation = Instrumentation(json_file=json_file, prom_file=prom_file, profile=profile)
+
+    # The summary of the snapshot can also be appended to a time series store (-t), whose trends are plotted by
+    # timeseries.py. The height (--height) and timestamp (--timestamp) of the snapshot are stored along with it.
+    run_experiment(coin, chainstate, count_p2sh, non_std_only, instrumentation, store=store, height=height,
+                   timestamp=timestamp)
@@ -1,11 +1,16 @@
-from bitcoin_tools.analysis.plots import get_cdf
-from bitcoin_tools.analysis.status.data_processing import get_samples
+from bitcoin_tools.analysis.plots import get_cdf_from_counts, downsample_cdf
+from bitcoin_tools.analysis.status.data_processing import get_value_counts
 from bitcoin_tools.analysis.status.plots import plots_from_samples
 from bitcoin_tools import CFG
+from multiprocessing import Pool, cpu_count
 from ujson import load
 
 from bitcoin_tools.analysis.status.utils import aggregate_dust_np
 
+# Significant digits the compared attributes are rounded to (see data_processing.round_value), which bounds the size
+# of the summary of each file regardless of the size of the UTXO set.
+CMP_PRECISION = 3
+
 
 def compare_dust(dust_files, legend, suffix=''):
     """
@@ -55,11 +60,24 @@ def compare_dust(dust_files, legend, suffix=''):
                            ylabel="Number of UTXOs")
 
 
-def compare_attribute(fin_names, x_attribute, out_name, xlabel='', legend=''):
+def _get_cdf_job(job):
+    # Summary of a single file: the (downsampled) CDF of its value counts, so only a few thousand points per file are
+    # sent back and held in memory.
+    x_attribute, fin_name, precision = job
+    counts = get_value_counts(x_attribute, fin_name, precision=precision)[x_attribute]
+
+    return downsample_cdf(*get_cdf_from_counts(counts, normalize=True))
+
+
+def compare_attribute(fin_names, x_attribute, out_name, xlabel='', legend='', precision=CMP_PRECISION,
+                      processes=None):
     """
     Performs a comparative analysis between different files and a fixed attribute. Useful to compare the evolution
     of a parameter throughout different snapshots.
 
+    Files are streamed (one by one, by a pool of worker processes) into value counts rounded to a given precision, so
+    only a compact summary of each file is kept in memory no matter how many snapshots are compared.
+
     :param fin_names: List of file names to load data from.
     :type fin_names: list str
     :param x_attribute: Attribute to be compared.
@@ -70,18 +88,33 @@ def compare_attribute(fin_names, x_attribute, out_name, xlabel='', legend=''):
     :type xlabel: str
     :param legend: Legend to be included in the chart.
     :type legend: str or list
+    :param precision: Number of significant digits values are rounded to (see data_processing.round_value), or None
+    to compare exact values.
+    :type precision: int
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
     :return: None
     :rtyp: None
     """
 
-    samples = [get_samples(x_attribute, fin) for fin in fin_names]
+    jobs = [(x_attribute, fin, precision) for fin in fin_names]
+
+    if processes is None:
+        processes = cpu_count()
+
+    if processes == 1 or len(jobs) == 1:
+        cdfs = [_get_cdf_job(job) for job in jobs]
+    else:
+        pool = Pool(processes)
+        try:
+            # One file per job, so each worker only holds the counts of the file it is reading.
+            cdfs = pool.map(_get_cdf_job, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
 
-    xs = []
-    ys = []
-    for _ in range(len(samples)):
-        x, y = get_cdf(samples.pop(0).values(), normalize=True)
-        xs.append(x)
-        ys.append(y)
+    xs = [x for x, _ in cdfs]
+    ys = [y for _, y in cdfs]
 
     plots_from_samples(xs=xs, ys=ys, xlabel=xlabel, save_fig=out_name,  legend=legend, log_axis='x',
                        ylabel="Number of UTXOs", legend_loc=2)
@@ -108,19 +141,19 @@ def comparative_data_analysis(tx_fin_name, utxo_fin_name):
     legends = [['Tx.', 'UTXO'], ['Tx.', 'UTXO']]
     legend_locations = [1, 2]
 
-    tx_samples = get_samples(tx_attributes, tx_fin_name)
-    utxo_samples = get_samples(utxo_attributes, utxo_fin_name)
+    tx_counts = get_value_counts(tx_attributes, tx_fin_name)
+    utxo_counts = get_value_counts(utxo_attributes, utxo_fin_name)
 
     for tx_attr, utxo_attr, label, out, legend, leg_loc in zip(tx_attributes, utxo_attributes, xlabels, out_names,
                                                                legends, legend_locations):
-        xs_txs, ys_txs = get_cdf(tx_samples[tx_attr], normalize=True)
-        xs_utxos, ys_utxos = get_cdf(utxo_samples[utxo_attr], normalize=True)
+        xs_txs, ys_txs = get_cdf_from_counts(tx_counts[tx_attr], normalize=True)
+        xs_utxos, ys_utxos = get_cdf_from_counts(utxo_counts[utxo_attr], normalize=True)
 
         plots_from_samples(xs=[xs_txs, xs_utxos], ys=[ys_txs, ys_utxos], xlabel=label, save_fig=out, legend=legend,
                            legend_loc=leg_loc, ylabel="Number of registers")
 
 
-def run_experiment(f_dust, f_parsed_utxos, f_parsed_txs):
+def run_experiment(f_dust, f_parsed_utxos, f_parsed_txs, processes=None):
     """
     Runs the whole experiment. You may comment the parts of it you are not interested in to save time.
 
@@ -130,6 +163,8 @@ def run_experiment(f_dust, f_parsed_utxos, f_parsed_txs):
     :type f_parsed_utxos: str
     :param f_parsed_txs: Parsed transactions file name.
     :type f_parsed_txs: str
+    :param processes: Number of processes snapshots are compared by (all the available cores by default).
+    :type processes: int
     :return: None
     :rtype: None
     """
@@ -156,12 +191,12 @@ def run_experiment(f_dust, f_parsed_utxos, f_parsed_txs):
     # UTXO amount comparison
     print "Comparing UTXO amount from different snapshots."
     compare_attribute(fin_names=fin_names, x_attribute='amount', xlabel='Amount (Satoshi)', legend=legend,
-                      out_name='cmp_utxo_amount')
+                      out_name='cmp_utxo_amount', processes=processes)
 
     # UTXO size comparison
     print "Comparing UTXO size from different snapshots."
     compare_attribute(fin_names=fin_names, x_attribute='register_len', xlabel='Size (bytes)', legend=legend,
-                      out_name='cmp_utxo_size')
+                      out_name='cmp_utxo_size', processes=processes)
 
     # Comparative data analysis (transactions and UTXOs)
     comparative_data_analysis(f_parsed_txs, f_parsed_utxos)
@@ -0,0 +1,288 @@
+from binascii import unhexlify
+from multiprocessing import Pool, cpu_count
+from random import Random
+from bitcoin_tools.analysis.status import NSPECIALSCRIPTS
+from bitcoin_tools.analysis.status.utils import encode_utxo, deobfuscate_value
+from bitcoin_tools.core.keys import serialize_pk
+from ecdsa import SigningKey, SECP256k1
+
+# Heights at which P2SH, SegWit and Taproot outputs were first found in the Bitcoin chain.
+P2SH_HEIGHT = 173805
+SEGWIT_HEIGHT = 481824
+TAPROOT_HEIGHT = 709632
+
+# Default share of each output type in the generated UTXO set (roughly the one of the actual UTXO set), together with
+# the minimum height at which each of them can be found.
+DEFAULT_TYPES = [("P2PKH", 0.42, 0), ("P2WPKH", 0.28, SEGWIT_HEIGHT), ("P2SH", 0.13, P2SH_HEIGHT),
+                 ("P2TR", 0.12, TAPROOT_HEIGHT), ("P2WSH", 0.02, SEGWIT_HEIGHT), ("P2PK", 0.01, 0),
+                 ("P2MS", 0.01, 0), ("unknown", 0.01, 0)]
+OUT_TYPES = ["P2PKH", "P2SH", "P2PK", "P2WPKH", "P2WSH", "P2TR", "P2MS", "unknown"]
+
+# Number of distinct public keys used by the generated P2PK and multisig outputs.
+N_KEYS = 64
+
+# Number of UTXOs generated by every job. Each chunk is generated from its own seed, so the resulting UTXOs do not
+# depend on the number of processes.
+CHUNK_SIZE = 50000
+
+
+class _Generator:
+    """ Generates random UTXOs following the distribution of a Bitcoin chainstate (see generate_utxos for the
+    parameters defining it).
+    """
+
+    def __init__(self, seed, tip, pks, types, height_skew, amount_range, round_amounts):
+        self.rng = Random(seed)
+        self.tip = tip
+        self.pks = pks
+        self.height_skew = height_skew
+        self.amount_range = amount_range
+        self.round_amounts = round_amounts
+
+        total = float(sum(share for _, share, _ in types))
+        self.types = []
+        acc = 0
+        for name, share, height in types:
+            if name not in OUT_TYPES:
+                raise Exception("Unknown output type " + str(name))
+            acc += share / total
+            self.types.append((acc, name, height))
+
+    def _bytes(self, n):
+        return format(self.rng.getrandbits(8 * n), '0' + str(2 * n) + 'x')
+
+    def _pick_type(self):
+        r = self.rng.random()
+        for acc, name, height in self.types:
+            if r < acc:
+                return name, height
+
+        return self.types[-1][1:]
+
+    def _height(self, min_height):
+        # Most of the UTXOs are recent, but a long tail goes back to the genesis block (or to the activation of the
+        # output type).
+        min_height = min(min_height, self.tip)
+        return min_height + int((self.tip - min_height) * (1 - self.rng.random() ** self.height_skew))
+
+    def _amount(self):
+        # Amounts are log-uniformly distributed.
+        amount = int(self.amount_range[0] * (float(self.amount_range[1]) / self.amount_range[0]) ** self.rng.random())
+        # Many amounts are round numbers (which are stored compressed in fewer bytes).
+        if self.rng.random() < self.round_amounts:
+            magnitude = 10 ** (len(str(amount)) - 1)
+            amount -= amount % magnitude
+
+        return amount
+
+    def _out(self, name):
+        """ Generates the (compressed) script of a given output type, as stored in the chainstate.
+
+        :param name: Output type.
+        :type name: str
+        :return: The out_type and script data (see decode_utxo).
+        :rtype: int, hex str
+        """
+
+        if name == "P2PKH":
+            return 0, self._bytes(20)
+        elif name == "P2SH":
+            return 1, self._bytes(20)
+        elif name == "P2PK":
+            pk = self.rng.choice(self.pks)
+            # Compressed keys are stored as types 2 and 3 (their prefix), uncompressed ones as 4 and 5.
+            out_type = int(pk[:2], 16) + (2 if self.rng.random() < 0.3 else 0)
+            return out_type, format(out_type, '02x') + pk[2:]
+        elif name == "P2WPKH":
+            script = "0014" + self._bytes(20)
+        elif name == "P2WSH":
+            script = "0020" + self._bytes(32)
+        elif name == "P2TR":
+            script = "5120" + self._bytes(32)
+        elif name == "P2MS":
+            n = self.rng.randint(1, 3)
+            m = self.rng.randint(1, n)
+            pks = [self.rng.choice(self.pks) for _ in range(n)]
+            script = format(0x50 + m, '02x') + "".join("21" + pk for pk in pks) + format(0x50 + n, '02x') + "ae"
+        else:
+            script = self._bytes(self.rng.randint(1, 60))
+
+        return len(script) / 2 + NSPECIALSCRIPTS, script
+
+    def utxos(self, n_utxos):
+        """ Generates a given number of random UTXOs, grouped by transaction.
+
+        :param n_utxos: Number of UTXOs to be generated.
+        :type n_utxos: int
+        :return: Generator of UTXOs (as returned by decode_utxo).
+        :rtype: generator
+        """
+
+        count = 0
+        while count < n_utxos:
+            tx_id = self._bytes(32)
+            coinbase = int(self.rng.random() < 0.01)
+            name, min_height = self._pick_type()
+            height = self._height(min_height)
+
+            # Most transactions only have one unspent output left, but some of them (e.g. batched payouts) have many.
+            n_outs = 1 if coinbase or self.rng.random() < 0.7 else self.rng.randint(2, 20)
+            n_outs = min(n_outs, n_utxos - count)
+            indexes = sorted(self.rng.sample(range(n_outs + self.rng.randint(0, 5)), n_outs))
+
+            for index in indexes:
+                out_type, data = self._out(name)
+                yield {'tx_id': tx_id, 'index': index, 'coinbase': coinbase, 'height': height,
+                       'out': {'amount': self._amount(), 'out_type': out_type, 'data': data}}
+
+                # Outputs of the same transaction are usually (but not always) of the same type.
+                if self.rng.random() < 0.2:
+                    name = self._pick_type()[0]
+
+            count += n_outs
+
+
+def _get_pks():
+    # Public keys are actual curve points, since the analysis may decompress them.
+    return [serialize_pk(SigningKey.from_secret_exponent(i + 1, curve=SECP256k1).get_verifying_key())
+            for i in range(N_KEYS)]
+
+
+def _get_chunks(n_utxos, seed, dist):
+    # Jobs of both generate_utxos and generate_chainstate: the seed and size of every chunk, and the distribution.
+    return [(seed * 2**32 + i, min(CHUNK_SIZE, n_utxos - start), dist)
+            for i, start in enumerate(range(0, n_utxos, CHUNK_SIZE))]
+
+
+def _generate_utxos_job(job):
+    seed, n_utxos, dist = job[:3]
+    return list(_Generator(seed, **dist).utxos(n_utxos))
+
+
+def _generate_entries_job(job):
+    o_key = job[3]
+
+    entries = []
+    for utxo in _generate_utxos_job(job):
+        outpoint, coin = encode_utxo(utxo)
+        entries.append((unhexlify(outpoint), unhexlify(deobfuscate_value(o_key, coin))))
+
+    return entries
+
+
+def _map_chunks(f, jobs, processes):
+    # Yields the result of every job in order, computing them in parallel if there is more than one.
+    if processes is None:
+        processes = cpu_count()
+
+    if processes == 1 or len(jobs) == 1:
+        for job in jobs:
+            yield f(job)
+    else:
+        pool = Pool(processes)
+        try:
+            # Results are consumed as they are computed (instead of at once, as in pool.map), so only a few chunks
+            # are kept in memory.
+            for result in pool.imap(f, jobs):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+
+def generate_utxos(n_utxos, seed=0, tip=850000, types=None, height_skew=3, amount_range=(300, 10**10),
+                   round_amounts=0.3, processes=None):
+    """
+    Generates random UTXOs following a given distribution (which defaults to roughly the one of the actual UTXO set).
+    Generation is deterministic for a given seed and distribution, regardless of the number of processes.
+
+    :param n_utxos: Number of UTXOs to be generated.
+    :type n_utxos: int
+    :param seed: Seed of the random generator.
+    :type seed: int
+    :param tip: Height of the best block (UTXOs heights range up to it).
+    :type tip: int
+    :param types: Output types of the UTXOs, as tuples of name (from OUT_TYPES), relative share and minimum height. By
+    default DEFAULT_TYPES.
+    :type types: list of (str, float, int)
+    :param height_skew: Skew of the heights towards the tip (1 means uniformly distributed heights).
+    :type height_skew: float
+    :param amount_range: Minimum and maximum amounts (in satoshis), which are log-uniformly distributed.
+    :type amount_range: (int, int)
+    :param round_amounts: Share of round amounts (amounts rounded to their most significant digit).
+    :type round_amounts: float
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
+    :return: Generator of UTXOs (as returned by decode_utxo).
+    :rtype: generator
+    """
+
+    if types is None:
+        types = DEFAULT_TYPES
+
+    dist = {'tip': tip, 'pks': _get_pks(), 'types': types, 'height_skew': height_skew, 'amount_range': amount_range,
+            'round_amounts': round_amounts}
+
+    for utxos in _map_chunks(_generate_utxos_job, _get_chunks(n_utxos, seed, dist), processes):
+        for utxo in utxos:
+            yield utxo
+
+
+def generate_chainstate(chainstate_path, n_utxos, seed=0, tip=850000, types=None, height_skew=3,
+                        amount_range=(300, 10**10), round_amounts=0.3, processes=None):
+    """
+    Generates a synthetic chainstate (Bitcoin Core v 0.15 onwards LevelDB format) holding the UTXOs of generate_utxos,
+    obfuscated under a random obfuscation key, and the hash of a random best block.
+
+    UTXOs are generated and encoded by a pool of worker processes, while they are written to the LevelDB (which can only
+    be opened by one process) by the calling one.
+
+    :param chainstate_path: Path of the LevelDB to be created (it must not exist).
+    :type chainstate_path: str
+    :param n_utxos: Number of UTXOs to be generated.
+    :type n_utxos: int
+    :param seed: Seed of the random generator.
+    :type seed: int
+    :param tip: Height of the best block (UTXOs heights range up to it).
+    :type tip: int
+    :param types: Output types of the UTXOs (see generate_utxos). By default DEFAULT_TYPES.
+    :type types: list of (str, float, int)
+    :param height_skew: Skew of the heights towards the tip (see generate_utxos).
+    :type height_skew: float
+    :param amount_range: Minimum and maximum amounts (see generate_utxos).
+    :type amount_range: (int, int)
+    :param round_amounts: Share of round amounts (see generate_utxos).
+    :type round_amounts: float
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
+    :return: None
+    :rtype: None
+    """
+
+    import plyvel
+
+    if types is None:
+        types = DEFAULT_TYPES
+
+    rng = Random(seed)
+    o_key = format(rng.getrandbits(64), '016x')
+    best_block = format(rng.getrandbits(256), '064x')
+
+    dist = {'tip': tip, 'pks': _get_pks(), 'types': types, 'height_skew': height_skew, 'amount_range': amount_range,
+            'round_amounts': round_amounts}
+    jobs = [job + (o_key,) for job in _get_chunks(n_utxos, seed, dist)]
+
+    db = plyvel.DB(chainstate_path, create_if_missing=True, error_if_exists=True, compression=None)
+
+    try:
+        # The obfuscation key is stored preceded by its size, and values are XORed with it (XOR is its own inverse, so
+        # deobfuscate_value obfuscates as well).
+        db.put(b'\x0e\x00obfuscate_key', unhexlify("08" + o_key))
+        db.put(b'B', unhexlify(deobfuscate_value(o_key, best_block)))
+
+        for entries in _map_chunks(_generate_entries_job, jobs, processes):
+            with db.write_batch() as batch:
+                for outpoint, coin in entries:
+                    batch.put(outpoint, coin)
+    finally:
+        db.close()
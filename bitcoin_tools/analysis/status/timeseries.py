@@ -0,0 +1,283 @@
+from bitcoin_tools.analysis.status.data_processing import get_value_counts
+from bitcoin_tools.analysis.status.plots import plots_from_samples
+from bitcoin_tools.analysis.status.utils import aggregate_dust_np
+from array import array
+from os import listdir, makedirs, path
+from re import match
+from sys import argv, byteorder
+
+# Columns every snapshot is keyed by.
+KEY_COLUMNS = ["height", "timestamp"]
+
+# Fee rates (in sat/byte) at which the dust and non-profitable UTXOs of every snapshot are tracked.
+FEE_RATES = [1, 5, 10, 50, 100]
+
+# Output types whose share of the UTXO set is tracked (every other type is counted as "other").
+TYPES = ["P2PKH", "P2SH", "P2PK", "P2WPKH", "P2WSH", "P2TR", "multisig", "other"]
+
+# Extension of the column files of a store.
+COLUMN_EXT = ".f64"
+
+
+class TimeSeries:
+    """ Appendable columnar store of snapshot metrics (see summarize_snapshot), keyed by the height and timestamp of
+    each snapshot.
+
+    Every column is stored in its own file under the store dir, as little-endian doubles, so appending a snapshot only
+    writes a value at the end of each column, and queries only read the columns they need. Values missing from a
+    snapshot (e.g. columns added afterwards) are stored as NaN.
+
+    The height column is written last, and it defines the number of snapshots in the store, so a snapshot that could not
+    be completely appended (e.g. if the process was killed) is ignored and overwritten by the next one.
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+
+        if not path.isdir(store_path):
+            makedirs(store_path)
+
+    def _get_column_path(self, column):
+        if not match(r"^[A-Za-z0-9_]+$", column):
+            raise Exception("Invalid column name " + str(column))
+
+        return path.join(self.store_path, column + COLUMN_EXT)
+
+    def _read_column(self, column):
+        values = array('d')
+
+        column_path = self._get_column_path(column)
+        if path.isfile(column_path):
+            with open(column_path, 'rb') as fin:
+                values.fromstring(fin.read())
+            if byteorder == 'big':
+                values.byteswap()
+
+        return values
+
+    def _append_value(self, column, value, length):
+        # Columns are brought to the length of the store before appending (dropping any incomplete snapshot, and
+        # filling with NaN new columns or columns missing from previous snapshots).
+        column_path = self._get_column_path(column)
+        size = path.getsize(column_path) / 8 if path.isfile(column_path) else 0
+
+        values = array('d', [float('nan')] * max(length - size, 0) + [value])
+        if byteorder == 'big':
+            values.byteswap()
+
+        with open(column_path, 'ab') as fout:
+            if size > length:
+                fout.truncate(length * 8)
+            fout.write(values.tostring())
+
+    def __len__(self):
+        height_path = self._get_column_path("height")
+        return path.getsize(height_path) / 8 if path.isfile(height_path) else 0
+
+    def get_columns(self):
+        """ Gets the name of the columns of the store.
+
+        :return: The name of the columns.
+        :rtype: list of str
+        """
+
+        return sorted(f[:-len(COLUMN_EXT)] for f in listdir(self.store_path) if f.endswith(COLUMN_EXT))
+
+    def get_heights(self):
+        """ Gets the height of the snapshots in the store (in the order they were appended).
+
+        :return: The height of every snapshot.
+        :rtype: list of int
+        """
+
+        return [int(h) for h in self._read_column("height")]
+
+    def append(self, row):
+        """ Appends a snapshot to the store.
+
+        :param row: The metrics of the snapshot, by column name. Both its height and timestamp must be included (the
+        timestamp may be NaN if unknown).
+        :type row: dict
+        :return: None
+        :rtype: None
+        """
+
+        for column in KEY_COLUMNS:
+            if row.get(column) is None:
+                raise Exception("Snapshots must include their " + column)
+
+        if row["height"] in self.get_heights():
+            raise Exception("A snapshot at height " + str(row["height"]) + " is already stored")
+
+        length = len(self)
+
+        for column, value in sorted(row.items()):
+            if column != "height":
+                self._append_value(column, float(value) if value is not None else float('nan'), length)
+
+        # Snapshots missing some column are padded, so every column keeps the same length.
+        for column in self.get_columns():
+            if column not in row:
+                self._append_value(column, float('nan'), length)
+
+        self._append_value("height", float(row["height"]), length)
+
+    def get(self, columns, min_height=None, max_height=None):
+        """ Gets the values of some columns for the snapshots within a range of heights, sorted by height.
+
+        :param columns: Name of the columns to get (height and timestamp are always included).
+        :type columns: list of str
+        :param min_height: Lowest height to be included. Unbounded by default.
+        :type min_height: int
+        :param max_height: Highest height to be included. Unbounded by default.
+        :type max_height: int
+        :return: The values of every column, by column name.
+        :rtype: dict
+        """
+
+        length = len(self)
+        heights = self._read_column("height")
+
+        rows = [i for i in sorted(range(length), key=lambda i: heights[i])
+                if (min_height is None or heights[i] >= min_height) and
+                (max_height is None or heights[i] <= max_height)]
+
+        result = dict()
+        for column in KEY_COLUMNS + [c for c in columns if c not in KEY_COLUMNS]:
+            values = self._read_column(column)
+            # Columns that were never stored are read as missing values.
+            result[column] = [values[i] if i < len(values) else float('nan') for i in rows]
+
+        result["height"] = [int(h) for h in result["height"]]
+
+        return result
+
+
+def summarize_snapshot(utxo_fin_name, f_dust, height=None, timestamp=None, stage=None):
+    """
+    Computes the metrics tracked across snapshots from the parsed utxo file of a snapshot (from utxo_dump): the size of
+    the UTXO set, its dust and non-profitable UTXOs at several fee rates (FEE_RATES) and the share of each output type
+    (TYPES). Metrics are built from the aggregates of the analysis, which are cached (see cache.py).
+
+    :param utxo_fin_name: Input file name which contains the snapshot utxo dump.
+    :type utxo_fin_name: str
+    :param f_dust: Output file name where the aggregated dust will be stored (see aggregate_dust_np).
+    :type f_dust: str
+    :param height: Height of the snapshot. The height of its most recent UTXO by default.
+    :type height: int
+    :param timestamp: Timestamp of the snapshot (in seconds since epoch), e.g. the time of its best block. Missing (NaN)
+    by default, since the time the snapshot is analysed is unrelated to it.
+    :type timestamp: float
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :return: The metrics of the snapshot, by column name (see TimeSeries).
+    :rtype: dict
+    """
+
+    counts = get_value_counts(['tx_height', 'out_type', 'non_std_type', 'register_len'], fin_name=utxo_fin_name,
+                              stage=stage)
+    dust = aggregate_dust_np(utxo_fin_name, fout_name=f_dust, stage=stage)
+
+    row = {"height": height if height is not None else max(counts['tx_height']),
+           "timestamp": timestamp if timestamp is not None else float('nan'),
+           "utxos": dust["total_utxos"], "value": dust["total_value"], "data_len": dust["total_data_len"],
+           "size": sum(register_len * n for register_len, n in counts['register_len'].items())}
+
+    for rate in FEE_RATES:
+        for metric in ["dust_utxos", "dust_value", "np_utxos", "np_value", "npest_utxos", "npest_value"]:
+            row[metric + "_" + str(rate)] = dust[metric][rate]
+
+    # Standard types are identified by their out_type (see decode_utxo), while the rest by their non_std_type (see
+    # utxo_dump).
+    out_types = counts['out_type']
+    non_std_types = counts['non_std_type']
+    type_counts = {"P2PKH": out_types.get(0, 0), "P2SH": out_types.get(1, 0),
+                   "P2PK": sum(out_types.get(t, 0) for t in [2, 3, 4, 5]),
+                   "P2WPKH": non_std_types.get("P2WPKH", 0), "P2WSH": non_std_types.get("P2WSH", 0),
+                   "P2TR": non_std_types.get("P2TR", 0),
+                   "multisig": sum(n for t, n in non_std_types.items() if t and "multisig" in t)}
+    type_counts["other"] = row["utxos"] - sum(type_counts.values())
+
+    for t in TYPES:
+        row["share_" + t] = type_counts[t] / float(row["utxos"]) if row["utxos"] else float('nan')
+
+    return row
+
+
+def add_snapshot(store, utxo_fin_name, f_dust, height=None, timestamp=None, stage=None):
+    """
+    Summarizes a snapshot (see summarize_snapshot) and appends it to a time series store, unless a snapshot at the same
+    height is already stored (so the summary job can be run again over a set of snapshots).
+
+    :param store: Store where the snapshot is appended.
+    :type store: TimeSeries
+    :param utxo_fin_name: Input file name which contains the snapshot utxo dump.
+    :type utxo_fin_name: str
+    :param f_dust: Output file name where the aggregated dust will be stored (see aggregate_dust_np).
+    :type f_dust: str
+    :param height: Height of the snapshot. The height of its most recent UTXO by default.
+    :type height: int
+    :param timestamp: Timestamp of the snapshot (in seconds since epoch). Missing (NaN) by default.
+    :type timestamp: float
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
+    :return: Whether the snapshot has been appended or not.
+    :rtype: bool
+    """
+
+    if height is not None and height in store.get_heights():
+        return False
+
+    row = summarize_snapshot(utxo_fin_name, f_dust, height, timestamp, stage)
+
+    if row["height"] in store.get_heights():
+        return False
+
+    store.append(row)
+
+    return True
+
+
+def plot_trends(store, min_height=None, max_height=None, queue=None):
+    """
+    Plots the evolution of the metrics of a time series store across snapshots: UTXO set size, dust and non-profitable
+    UTXOs (at every tracked fee rate) and output type shares.
+
+    :param store: Store the metrics are read from.
+    :type store: TimeSeries
+    :param min_height: Lowest height to be plotted. Unbounded by default.
+    :type min_height: int
+    :param max_height: Highest height to be plotted. Unbounded by default.
+    :type max_height: int
+    :param queue: Queue the charts are rendered by (see analysis.plots.PlotQueue). Rendered straight away by default.
+    :type queue: PlotQueue
+    :return: None
+    :rtype: None
+    """
+
+    rates = [str(rate) for rate in FEE_RATES]
+
+    # Each chart is made of a set of columns, plotted against the height of the snapshots.
+    charts = [(["utxos"], None, "Number of UTXOs", "ts_utxos"),
+              (["size", "data_len"], ["UTXO set", "Scripts"], "Size (bytes)", "ts_size"),
+              (["dust_utxos_" + r for r in rates], [r + " sat./byte" for r in rates], "Dust UTXOs", "ts_dust_utxos"),
+              (["np_utxos_" + r for r in rates], [r + " sat./byte" for r in rates], "Non-profitable UTXOs",
+               "ts_np_utxos"),
+              (["npest_utxos_" + r for r in rates], [r + " sat./byte" for r in rates], "Non-profitable est. UTXOs",
+               "ts_npest_utxos"),
+              (["share_" + t for t in TYPES], TYPES, "Share of UTXOs", "ts_types")]
+
+    data = store.get([c for columns, _, _, _ in charts for c in columns], min_height, max_height)
+
+    if not data["height"]:
+        raise Exception("There are no snapshots to be plotted in " + store.store_path)
+
+    for columns, legend, ylabel, out in charts:
+        plots_from_samples(xs=[data["height"]] * len(columns), ys=[data[c] for c in columns], xlabel="Height",
+                           ylabel=ylabel, save_fig=out, legend=legend, legend_loc=2, queue=queue)
+
+
+if __name__ == '__main__':
+
+    # Plots the trends stored in a given store (filled by run_analysis.py -t <store path>).
+    plot_trends(TimeSeries(argv[1]))
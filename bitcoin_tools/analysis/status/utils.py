@@ -1,12 +1,13 @@
-import plyvel
 from binascii import hexlify, unhexlify
 import ujson
 from math import ceil
 from copy import deepcopy
 from bitcoin_tools.analysis.status import *
+from bitcoin_tools.analysis.status.cache import cached
 from bitcoin_tools.utils import change_endianness, encode_varint
 from bitcoin_tools.core.script import OutputScript
-from bitcoin_tools.core.keys import get_uncompressed_pk
+from bitcoin_tools.core.script_types import match_script, match_scripts, to_blob, TYPE_NAMES, P2MS
+from bitcoin_tools.core.keys import get_uncompressed_pks
 
 
 def txout_compress(n):
@@ -256,6 +257,30 @@ def decode_utxo(coin, outpoint):
     return {'tx_id': tx_id, 'index': tx_index, 'coinbase': coinbase, 'out': out, 'height': height}
 
 
+def encode_utxo(utxo):
+    """
+    Encodes a UTXO in the LevelDB format for Bitcoin core v 0.15 onwards, that is, the inverse of decode_utxo (see it
+    for the details of the format).
+
+    :param utxo: The UTXO to be encoded, as returned by decode_utxo.
+    :type utxo: dict
+    :return: The outpoint and the coin of the UTXO (as stored in the chainstate, without obfuscation).
+    :rtype: str, str
+    """
+
+    out = utxo['out']
+
+    outpoint = '43' + utxo['tx_id'] + b128_encode(utxo['index'])
+
+    coin = b128_encode(utxo['height'] << 1 | utxo['coinbase']) + b128_encode(txout_compress(out['amount']))
+    # Compressed P2PK scripts (types 2 to 5) already start with their type, the rest are preceded by it.
+    if out['out_type'] not in [2, 3, 4, 5]:
+        coin += b128_encode(out['out_type'])
+    coin += out['data']
+
+    return outpoint, coin
+
+
 def decompress_script(compressed_script, script_type):
     """ Takes CScript as stored in leveldb and returns it in uncompressed form
     (de)compression scheme is defined in bitcoin/src/compressor.cpp
@@ -287,7 +312,7 @@ def decompress_script(compressed_script, script_type):
         if len(compressed_script) != 66:
             raise Exception("Compressed script has wrong size")
         prefix = format(script_type - 2, '02')
-        script = OutputScript.P2PK(get_uncompressed_pk(prefix + compressed_script[2:]))
+        script = OutputScript.P2PK(get_uncompressed_pks([prefix + compressed_script[2:]], processes=1)[0])
 
     else:
         assert len(compressed_script) / 2 == script_type - NSPECIALSCRIPTS
@@ -296,6 +321,40 @@ def decompress_script(compressed_script, script_type):
     return script.content
 
 
+def decompress_scripts(compressed_scripts, script_types, processes=None):
+    """ Batch version of decompress_script. The public keys of all the uncompressed P2PK scripts (types 4 and 5) are
+    decompressed at once (see keys.get_uncompressed_pks), so repeated keys are decompressed only once and the rest are
+    processed in parallel.
+
+    :param compressed_scripts: raw scripts bytes hexlified (data in decode_utxo)
+    :type compressed_scripts: list of str
+    :param script_types: first byte of each script data (out_type in decode_utxo)
+    :type script_types: list of int
+    :param processes: Number of worker processes used to decompress public keys (all the available cores by default).
+    :type processes: int
+    :return: the decompressed CScripts
+    :rtype: list of str
+    """
+
+    compressed_pks = []
+    for compressed_script, script_type in zip(compressed_scripts, script_types):
+        if script_type in [4, 5]:
+            if len(compressed_script) != 66:
+                raise Exception("Compressed script has wrong size")
+            compressed_pks.append(format(script_type - 2, '02') + compressed_script[2:])
+
+    uncompressed_pks = iter(get_uncompressed_pks(compressed_pks, processes))
+
+    scripts = []
+    for compressed_script, script_type in zip(compressed_scripts, script_types):
+        if script_type in [4, 5]:
+            scripts.append(OutputScript.P2PK(next(uncompressed_pks)).content)
+        else:
+            scripts.append(decompress_script(compressed_script, script_type))
+
+    return scripts
+
+
 def display_decoded_utxo(decoded_utxo):
     """ Displays the information extracted from a decoded UTXO from the chainstate.
 
@@ -316,7 +375,7 @@ def display_decoded_utxo(decoded_utxo):
     print "Block height: " + str(decoded_utxo['height'])
 
 
-def parse_ldb(fout_name, fin_name=CFG.chainstate_path, decode=True):
+def parse_ldb(fout_name, fin_name=CFG.chainstate_path, decode=True, stage=None):
     """
     Parsed data from the chainstate LevelDB and stores it in a output file.
     :param fout_name: Name of the file to output the data.
@@ -325,10 +384,15 @@ def parse_ldb(fout_name, fin_name=CFG.chainstate_path, decode=True):
     :type fin_name: str
     :param decode: Whether the parsed data is decoded before stored or not (default: True)
     :type decode: bool
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
     :return: None
     :rtype: None
     """
 
+    # plyvel is only needed (and loaded) when reading the chainstate.
+    import plyvel
+
     prefix = b'C'
 
     # Output file
@@ -362,7 +426,14 @@ def parse_ldb(fout_name, fin_name=CFG.chainstate_path, decode=True):
             utxo = decode_utxo(utxo, key)
             utxo['len'] = serialized_length
 
-        fout.write(ujson.dumps(utxo, sort_keys=True) + "\n")
+        line = ujson.dumps(utxo, sort_keys=True) + "\n"
+        fout.write(line)
+
+        if stage is not None:
+            stage.update(1, serialized_length, len(line))
+            # UTXOs are sorted by (little endian) tx_id, which are uniformly distributed, so the progress can be
+            # estimated from the position of the current one.
+            stage.progress = int(key[2:10], 16) / 2. ** 32
 
     fout.close()
     db.close()
@@ -377,6 +448,8 @@ def get_chainstate_lastblock(fin_name=CFG.chainstate_path):
     :rtype: str
     """
 
+    import plyvel
+
     # Open the chainstate
     db = plyvel.DB(fin_name, compression=None)
 
@@ -396,7 +469,7 @@ def get_chainstate_lastblock(fin_name=CFG.chainstate_path):
     return change_endianness(height)
 
 
-def aggregate_dust_np(fin_name, fout_name="dust.json", fltr=None):
+def aggregate_dust_np(fin_name, fout_name="dust.json", fltr=None, stage=None):
     """
     Aggregates all the dust / non-profitable (np) utxos of a given parsed utxo file (from utxo_dump function).
 
@@ -406,10 +479,27 @@ def aggregate_dust_np(fin_name, fout_name="dust.json", fltr=None):
     :type fout_name: str
     :param fltr: Filter to be applied to the samples. None by default.
     :type fltr: function
+    :param stage: Stage the progress is reported to (see instrumentation.Instrumentation). None by default.
+    :type stage: Stage
     :return: A dict with the aggregated data
     :rtype: dict
     """
 
+    data = _aggregate_dust_np(fin_name, fltr, stage)
+
+    # Store dust calculation in a file.
+    out = open(CFG.data_path + fout_name, 'w')
+    out.write(ujson.dumps(data))
+    out.close()
+
+    return data
+
+
+@cached('fin_name', params=lambda: {"MIN_FEE_PER_BYTE": MIN_FEE_PER_BYTE, "MAX_FEE_PER_BYTE": MAX_FEE_PER_BYTE,
+                                     "FEE_STEP": FEE_STEP})
+def _aggregate_dust_np(fin_name, fltr=None, stage=None):
+    # Aggregation of aggregate_dust_np, which is cached (see cache.cached) so the dust file can be regenerated for free.
+
     # Dust calculation
     # Input file
     fin = open(CFG.data_path + fin_name, 'r')
@@ -463,6 +553,9 @@ def aggregate_dust_np(fin_name, fout_name="dust.json", fltr=None):
         total_value += data["amount"]
         total_data_len += data["utxo_data_len"]
 
+        if stage is not None:
+            stage.update(1, len(line))
+
     fin.close()
 
     # Moreover, since if an output is dust/non-profitable for a given threshold, it will also be for every other step
@@ -486,11 +579,6 @@ def aggregate_dust_np(fin_name, fout_name="dust.json", fltr=None):
             "npest_utxos": npest, "npest_value": value_npest, "npest_data_len": data_len_npest,
             "total_utxos": total_utxo, "total_value": total_value, "total_data_len": total_data_len}
 
-    # Store dust calculation in a file.
-    out = open(CFG.data_path + fout_name, 'w')
-    out.write(ujson.dumps(data))
-    out.close()
-
     return data
 
 
@@ -528,13 +616,10 @@ def check_multisig_type(script):
     :return: "multisig-m-n" or False
     """
 
-    if len(OutputScript.deserialize(script).split()) > 2:
-        m = OutputScript.deserialize(script).split()[0]
-        n = OutputScript.deserialize(script).split()[-2]
-        op_multisig = OutputScript.deserialize(script).split()[-1]
+    t, m, n = match_script(script)
 
-        if op_multisig == "OP_CHECKMULTISIG" and script[2:4] in ["21", "41"]:
-            return "multisig-" + str(m) + "-" + str(n)
+    if t == "P2MS":
+        return "multisig-" + str(m) + "-" + str(n)
 
     return False
 
@@ -564,15 +649,43 @@ def check_native_segwit(script):
     :rtype: tuple, first element boolean
     """
 
-    if len(script) == 22*2 and script[:4] == "0014":
-        return True, "P2WPKH"
+    t = match_script(script)[0]
 
-    if len(script) == 34*2 and script[:4] == "0020":
-        return True, "P2WSH"
+    if t in ["P2WPKH", "P2WSH", "P2TR"]:
+        return True, t
 
     return False, None
 
 
+def get_non_std_types(scripts):
+    """
+    Classifies a batch of non-standard scripts (the ones stored in full in the chainstate) as utxo_dump reports them:
+    multisig ones by their type (see check_multisig_type), native SegWit ones by their SegWit type (see
+    check_native_segwit) and any other as False. Scripts are matched at once (see script_types.match_scripts).
+
+    :param scripts: The scripts to be classified.
+    :type scripts: list of str
+    :return: The non-standard type of every script.
+    :rtype: list
+    """
+
+    if not scripts:
+        return []
+
+    types, m, n = match_scripts(*to_blob(scripts))
+
+    non_std_types = []
+    for t, m_i, n_i in zip(types, m, n):
+        if t == P2MS:
+            non_std_types.append("multisig-" + str(m_i) + "-" + str(n_i))
+        elif TYPE_NAMES[t] in ["P2WPKH", "P2WSH", "P2TR"]:
+            non_std_types.append(TYPE_NAMES[t])
+        else:
+            non_std_types.append(False)
+
+    return non_std_types
+
+
 def get_min_input_size(out, height, count_p2sh=False, coin="bitcoin", compressed_pk_height=0):
     """
     Computes the minimum size an input created by a given output type (parsed from the chainstate) will have.
@@ -801,7 +914,7 @@ def get_est_input_size(out, height, p2pkh_pksize, p2sh_scriptsize, nonstd_script
     return fixed_size + var_size
 
 
-def get_utxo(tx_id, index, fin_name=CFG.chainstate_path):
+def get_utxo(tx_id, index, fin_name=CFG.chainstate_path, db=None):
     """
     Gets a UTXO from the chainstate identified by a given transaction id and index.
     If the requested UTXO does not exist, return None.
@@ -812,6 +925,8 @@ def get_utxo(tx_id, index, fin_name=CFG.chainstate_path):
     :type index: int
     :param fin_name: Name of the LevelDB folder (chainstate by default)
     :type fin_name: str
+    :param db: Already opened chainstate LevelDB. If set, it is used instead of opening fin_name (and it is left open).
+    :type db: plyvel.DB
     :return: A outpoint:coin pair representing the requested UTXO
     :rtype: str, str
     """
@@ -820,22 +935,29 @@ def get_utxo(tx_id, index, fin_name=CFG.chainstate_path):
     outpoint = prefix + unhexlify(tx_id + b128_encode(index))
 
     # Open the LevelDB
-    db = plyvel.DB(fin_name, compression=None)  # Change with path to chainstate
+    if db is None:
+        import plyvel
+        ldb = plyvel.DB(fin_name, compression=None)  # Change with path to chainstate
+    else:
+        ldb = db
 
     # Load obfuscation key (if it exists)
-    o_key = db.get((unhexlify("0e00") + "obfuscate_key"))
+    o_key = ldb.get((unhexlify("0e00") + "obfuscate_key"))
 
     # If the key exists, the leading byte indicates the length of the key (8 byte by default). If there is no key,
     # 8-byte zeros are used (since the key will be XORed with the given values).
     if o_key is not None:
         o_key = hexlify(o_key)[2:]
 
-    coin = db.get(outpoint)
+    coin = ldb.get(outpoint)
 
     if coin is not None and o_key is not None:
         coin = deobfuscate_value(o_key, hexlify(coin))
+    elif coin is not None:
+        coin = hexlify(coin)
 
-    db.close()
+    if db is None:
+        ldb.close()
 
     return hexlify(outpoint), coin
 
@@ -0,0 +1,186 @@
+from binascii import hexlify, unhexlify
+from hashlib import sha256
+
+B58_DIGITS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+# Every pair of base58 digits, together with its value. Numbers are converted two digits at a time, and most of the
+# divisions are performed over native ints (in chunks of ten digits) instead of the whole (long) number.
+_PAIRS = [a + b for a in B58_DIGITS for b in B58_DIGITS]
+_PAIR_VALUES = dict((p, i) for i, p in enumerate(_PAIRS))
+_DIGIT_VALUES = dict((d, i) for i, d in enumerate(B58_DIGITS))
+_B58_10 = 58 ** 10
+_B58_2 = 58 ** 2
+
+
+def checksum(payload):
+    """ Computes the base58check checksum of a given payload, that is, the first four bytes of its double-sha256.
+
+    :param payload: Data to be checksummed.
+    :type payload: bytes
+    :return: The checksum.
+    :rtype: bytes
+    """
+
+    return sha256(sha256(payload).digest()).digest()[:4]
+
+
+def encode(v):
+    """ Encodes a given string in base58. Leading zero bytes are encoded as leading '1's.
+
+    :param v: Data to be encoded.
+    :type v: bytes
+    :return: The base58 representation of the data.
+    :rtype: str
+    """
+
+    if not v:
+        return ''
+
+    n = int(hexlify(v), 16)
+    digits = []
+    while n:
+        n, r = divmod(n, _B58_10)
+        r, p0 = divmod(r, _B58_2)
+        r, p1 = divmod(r, _B58_2)
+        r, p2 = divmod(r, _B58_2)
+        r, p3 = divmod(r, _B58_2)
+        digits += (_PAIRS[p0], _PAIRS[p1], _PAIRS[p2], _PAIRS[p3], _PAIRS[r])
+    digits.reverse()
+
+    # Chunks are zero padded, so the leading zeros (digit '1') are removed and the ones matching leading zero bytes
+    # are added back.
+    return '1' * (len(v) - len(v.lstrip('\0'))) + ''.join(digits).lstrip('1')
+
+
+def decode(s):
+    """ Decodes a given base58 string (see encode).
+
+    :param s: base58 encoded data.
+    :type s: str
+    :return: The decoded data.
+    :rtype: bytes
+    """
+
+    try:
+        # An odd number of digits is prefixed with a leading zero (digit '1'), so it can be read two digits at a time.
+        n = 0 if len(s) % 2 == 0 else _DIGIT_VALUES[s[0]]
+        for i in range(len(s) % 2, len(s), 2):
+            n = n * _B58_2 + _PAIR_VALUES[s[i:i + 2]]
+    except KeyError:
+        raise Exception("Invalid base58 string: " + s)
+
+    h = format(n, 'x') if n else ''
+    if len(h) % 2:
+        h = '0' + h
+
+    return '\0' * (len(s) - len(s.lstrip('1'))) + unhexlify(h)
+
+
+def encode_check(payload):
+    """ Encodes a given payload in base58check, that is, the payload followed by its checksum, base58 encoded.
+
+    :param payload: Data to be encoded (e.g. network version followed by a RIPEMD-160 hash).
+    :type payload: bytes
+    :return: The base58check representation of the payload.
+    :rtype: str
+    """
+
+    return encode(payload + checksum(payload))
+
+
+def decode_check(s):
+    """ Decodes a given base58check string, verifying its checksum.
+
+    :param s: base58check encoded data.
+    :type s: str
+    :return: The decoded payload (without the checksum).
+    :rtype: bytes
+    """
+
+    data = decode(s)
+    payload = data[:-4]
+
+    if len(data) < 4 or checksum(payload) != data[-4:]:
+        raise Exception("Invalid base58check checksum: " + s)
+
+    return payload
+
+
+def encode_check_batch(payloads):
+    """ Batch version of encode_check.
+
+    :param payloads: Data to be encoded.
+    :type payloads: list of bytes
+    :return: The base58check representation of every payload, in the same order than the given ones.
+    :rtype: list of str
+    """
+
+    return [encode(p + sha256(sha256(p).digest()).digest()[:4]) for p in payloads]
+
+
+def decode_check_batch(strings):
+    """ Batch version of decode_check. An exception is raised if any of the checksums is not valid.
+
+    :param strings: base58check encoded data.
+    :type strings: list of str
+    :return: The decoded payloads, in the same order than the given strings.
+    :rtype: list of bytes
+    """
+
+    return [decode_check(s) for s in strings]
+
+
+def _chunks(items, chunk_size):
+    """ Splits an iterable into lists of (up to) a given size.
+
+    :param items: Items to be split.
+    :type items: iterable
+    :param chunk_size: Number of items per chunk.
+    :type chunk_size: int
+    :return: Generator of lists of items.
+    :rtype: generator
+    """
+
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def encode_check_stream(payloads, chunk_size=2**16):
+    """ Streaming version of encode_check_batch. Payloads are read from any iterable (e.g. a generator over the UTXO
+    set) and encoded in chunks, so they never have to be held in memory all at once.
+
+    e.g: for chunk in encode_check_stream(payloads):
+             fout.write("\\n".join(chunk) + "\\n")
+
+    :param payloads: Data to be encoded.
+    :type payloads: iterable of bytes
+    :param chunk_size: Number of payloads encoded per chunk.
+    :type chunk_size: int
+    :return: Generator of lists of base58check encoded payloads, in the same order than the given ones.
+    :rtype: generator
+    """
+
+    for chunk in _chunks(payloads, chunk_size):
+        yield encode_check_batch(chunk)
+
+
+def decode_check_stream(strings, chunk_size=2**16):
+    """ Streaming version of decode_check_batch (see encode_check_stream).
+
+    :param strings: base58check encoded data.
+    :type strings: iterable of str
+    :param chunk_size: Number of strings decoded per chunk.
+    :type chunk_size: int
+    :return: Generator of lists of decoded payloads, in the same order than the given strings.
+    :rtype: generator
+    """
+
+    for chunk in _chunks(strings, chunk_size):
+        yield decode_check_batch(chunk)
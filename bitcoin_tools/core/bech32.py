@@ -0,0 +1,210 @@
+# Bech32 (BIP173) is used by version 0 witness programs (P2WPKH and P2WSH), while bech32m (BIP350) is used by every
+# other version (e.g. P2TR). They only differ in the constant the checksum is xored with.
+BECH32 = 1
+BECH32M = 0x2bc830a3
+
+CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_CHARSET_VALUES = dict((c, i) for i, c in enumerate(CHARSET))
+_GENERATOR = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+
+
+def _polymod(values, chk=1):
+    """ Computes the bech32 checksum polynomial over a list of 5-bit values.
+
+    :param values: 5-bit values.
+    :type values: list of int
+    :param chk: Initial value (e.g. the result over a common prefix).
+    :type chk: int
+    :return: The resulting checksum polynomial.
+    :rtype: int
+    """
+
+    for v in values:
+        b = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ v
+        for i in range(5):
+            chk ^= _GENERATOR[i] if ((b >> i) & 1) else 0
+
+    return chk
+
+
+def _hrp_expand(hrp):
+    """ Expands the human readable part of an address into the values it contributes to the checksum.
+
+    :param hrp: Human readable part (e.g. bc or tb).
+    :type hrp: str
+    :return: The expanded values.
+    :rtype: list of int
+    """
+
+    return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+
+
+def convertbits(data, frombits, tobits, pad=True):
+    """ Regroups a list of values from frombits-bit to tobits-bit values.
+
+    :param data: Values to be regrouped.
+    :type data: list of int
+    :param frombits: Size (in bits) of the given values.
+    :type frombits: int
+    :param tobits: Size (in bits) of the resulting values.
+    :type tobits: int
+    :param pad: Whether the last value is zero padded (encoding) or the remaining bits must be zero (decoding).
+    :type pad: bool
+    :return: The regrouped values, or None if there are non-zero remaining bits (pad unset).
+    :rtype: list of int
+    """
+
+    acc = 0
+    bits = 0
+    ret = []
+    maxv = (1 << tobits) - 1
+    max_acc = (1 << (frombits + tobits - 1)) - 1
+    for value in data:
+        acc = ((acc << frombits) | value) & max_acc
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            ret.append((acc >> bits) & maxv)
+
+    if pad:
+        if bits:
+            ret.append((acc << (tobits - bits)) & maxv)
+    elif bits >= frombits or ((acc << (tobits - bits)) & maxv):
+        return None
+
+    return ret
+
+
+def _check_witness_program(witver, witprog_len):
+    """ Checks that a witness version and program length are valid (BIP141).
+
+    :param witver: Witness version.
+    :type witver: int
+    :param witprog_len: Length of the witness program (in bytes).
+    :type witprog_len: int
+    :return: True if valid, raise exception otherwise.
+    :rtype: bool
+    """
+
+    if not 0 <= witver <= 16:
+        raise Exception("Wrong witness version: " + str(witver))
+    elif not 2 <= witprog_len <= 40:
+        raise Exception("Wrong witness program length: " + str(witprog_len))
+    elif witver == 0 and witprog_len not in [20, 32]:
+        raise Exception("Wrong version 0 witness program length: " + str(witprog_len))
+    else:
+        return True
+
+
+def encode(hrp, witver, witprog):
+    """ Encodes a witness program into a segwit address (bech32 for version 0, bech32m otherwise).
+
+    :param hrp: Human readable part of the address (bc for mainnet, tb for testnet).
+    :type hrp: str
+    :param witver: Witness version.
+    :type witver: int
+    :param witprog: Witness program.
+    :type witprog: bytes
+    :return: The segwit address.
+    :rtype: str
+    """
+
+    _check_witness_program(witver, len(witprog))
+
+    data = [witver] + convertbits(bytearray(witprog), 8, 5)
+    const = BECH32 if witver == 0 else BECH32M
+    polymod = _polymod(_hrp_expand(hrp) + data + [0] * 6) ^ const
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+
+    return hrp + "1" + "".join([CHARSET[d] for d in data + checksum])
+
+
+def decode(hrp, addr):
+    """ Decodes a segwit address into its witness version and program, checking its checksum and format.
+
+    :param hrp: Expected human readable part of the address (bc for mainnet, tb for testnet).
+    :type hrp: str
+    :param addr: Segwit address.
+    :type addr: str
+    :return: The witness version and the witness program.
+    :rtype: int, bytes
+    """
+
+    if addr.lower() != addr and addr.upper() != addr:
+        raise Exception("Mixed case segwit address: " + addr)
+
+    addr = addr.lower()
+    pos = addr.rfind("1")
+    if addr[:pos] != hrp or pos + 7 > len(addr) or len(addr) > 90:
+        raise Exception("Wrong segwit address format: " + addr)
+
+    try:
+        data = [_CHARSET_VALUES[c] for c in addr[pos + 1:]]
+    except KeyError:
+        raise Exception("Invalid bech32 character in address: " + addr)
+
+    witver = data[0]
+    const = BECH32 if witver == 0 else BECH32M
+    if _polymod(_hrp_expand(hrp) + data) != const:
+        raise Exception("Invalid segwit address checksum: " + addr)
+
+    witprog = convertbits(data[1:-6], 5, 8, False)
+    if witprog is None:
+        raise Exception("Wrong segwit address padding: " + addr)
+
+    _check_witness_program(witver, len(witprog))
+
+    return witver, str(bytearray(witprog))
+
+
+def encode_batch(hrp, witver, witprogs):
+    """ Batch version of encode, for witness programs of the same version and length (e.g. all the P2WPKH outputs of
+    the UTXO set). Addresses are computed vectorially, each step of the checksum being performed over every program at
+    once.
+
+    :param hrp: Human readable part of the addresses (bc for mainnet, tb for testnet).
+    :type hrp: str
+    :param witver: Witness version.
+    :type witver: int
+    :param witprogs: Witness programs, either as a list of bytes or as a 2D array (one program per row).
+    :type witprogs: list of bytes or numpy.ndarray of uint8
+    :return: The segwit addresses, in the same order than the given programs.
+    :rtype: list of str
+    """
+
+    import numpy as np
+
+    if not isinstance(witprogs, np.ndarray):
+        witprogs = np.array([bytearray(w) for w in witprogs], dtype=np.uint8)
+    if len(witprogs) == 0:
+        return []
+
+    n, l = witprogs.shape
+    _check_witness_program(witver, l)
+
+    # 8 to 5-bit conversion: programs are unpacked into bits, zero padded to a multiple of 5, and packed back.
+    bits = np.unpackbits(witprogs, axis=1)
+    bits = np.concatenate([bits, np.zeros((n, -l * 8 % 5), dtype=np.uint8)], axis=1)
+    values = bits.reshape(n, -1, 5).dot(np.array([16, 8, 4, 2, 1], dtype=np.uint32))
+
+    # The checksum over the human readable part and the version is the same for every address, so it is computed once.
+    chk = np.full(n, _polymod(_hrp_expand(hrp) + [witver]), dtype=np.uint32)
+    generator = np.array(_GENERATOR, dtype=np.uint32)
+    for v in list(values.T) + [0] * 6:
+        b = chk >> 25
+        chk = ((chk & 0x1ffffff) << 5) ^ v
+        for i in range(5):
+            chk ^= generator[i] * ((b >> i) & 1)
+    chk ^= BECH32 if witver == 0 else BECH32M
+
+    checksum = np.array([(chk >> 5 * (5 - i)) & 31 for i in range(6)]).T
+    digits = np.concatenate([values, checksum], axis=1)
+
+    # Digits are mapped to their characters and every row is read as a single string.
+    chars = np.frombuffer(CHARSET, dtype=np.uint8)[digits]
+    prefix = hrp + "1" + CHARSET[witver]
+    width = chars.shape[1]
+    data = chars.tostring()
+
+    return [prefix + data[i:i + width] for i in range(0, n * width, width)]
@@ -0,0 +1,421 @@
+from bitcoin_tools.core import ec_backend
+from bitcoin_tools.core.base58check import encode_check, decode_check
+from bitcoin_tools.utils import LRUCache
+from bitcoin_tools.wallet import hash_160, pks_to_btc_addrs
+
+from binascii import hexlify, unhexlify
+from hashlib import sha512
+from hmac import new as hmac_new
+from multiprocessing import Pool, cpu_count
+from struct import pack, unpack
+from ecdsa import SigningKey, VerifyingKey, SECP256k1
+from ecdsa.ellipticcurve import INFINITY
+
+# Indexes from HARDENED on are hardened (they can only be derived from a private node).
+HARDENED = 2 ** 31
+
+# Extended key version bytes (xprv / xpub for mainnet, tprv / tpub for testnet).
+XPRV = '0488ade4'
+XPUB = '0488b21e'
+TPRV = '04358394'
+TPUB = '043587cf'
+
+_ORDER = SECP256k1.order
+_G = SECP256k1.generator
+
+
+def _ser_point(point):
+    """ Serializes an elliptic curve point (ecdsa backend) as a compressed public key.
+
+    :param point: Point to be serialized.
+    :type point: ecdsa.ellipticcurve.Point
+    :return: The compressed public key.
+    :rtype: bytes
+    """
+
+    return chr(2 + (point.y() & 1)) + unhexlify(format(point.x(), '064x'))
+
+
+class HDNode:
+    """ Defines a node of a BIP32 hierarchical deterministic wallet, that is, a key pair (or just a public key for
+    public nodes) together with its chain code. Nodes are derived from a seed (see from_seed) or parsed from an extended
+    key (see from_xkey).
+
+    The parsed public key of the node is kept once computed, since every non hardened child derivation adds a point to
+    it. The public part of derived children is cached as well (see _children), so deriving several paths sharing a
+    prefix only computes the public keys of the common nodes once.
+    """
+
+    def __init__(self, chain_code, pk, sk=None, depth=0, parent_fingerprint='\x00' * 4, index=0):
+        self.chain_code = chain_code
+        self.pk = pk
+        self.sk = sk
+        self.depth = depth
+        self.parent_fingerprint = parent_fingerprint
+        self.index = index
+        self._point = None
+
+    @classmethod
+    def from_seed(cls, seed):
+        """ Builds the master node of a wallet from a given seed.
+
+        :param seed: Seed of the wallet (between 16 and 64 bytes).
+        :type seed: bytes
+        :return: The master (private) node.
+        :rtype: HDNode
+        """
+
+        if not 16 <= len(seed) <= 64:
+            raise Exception("Wrong seed length: " + str(len(seed)) + ". Seeds must be 16 to 64 bytes long.")
+
+        i = hmac_new("Bitcoin seed", seed, sha512).digest()
+        k = int(hexlify(i[:32]), 16)
+        if not 0 < k < _ORDER:
+            raise Exception("Invalid master key, use a different seed.")
+
+        return cls(i[32:], _sk_to_pk(i[:32]), sk=i[:32])
+
+    @classmethod
+    def from_xkey(cls, xkey):
+        """ Parses an extended key (xprv, xpub, tprv or tpub).
+
+        :param xkey: base58check encoded extended key.
+        :type xkey: str
+        :return: The node encoded by the key.
+        :rtype: HDNode
+        """
+
+        data = decode_check(xkey)
+        if len(data) != 78:
+            raise Exception("Wrong extended key length: " + str(len(data)))
+
+        version = hexlify(data[:4])
+        depth = ord(data[4])
+        parent_fingerprint = data[5:9]
+        index = unpack('>I', data[9:13])[0]
+        chain_code = data[13:45]
+        key = data[45:]
+
+        if version in [XPRV, TPRV]:
+            if key[0] != '\x00' or not 0 < int(hexlify(key[1:]), 16) < _ORDER:
+                raise Exception("Invalid private extended key.")
+            return cls(chain_code, _sk_to_pk(key[1:]), key[1:], depth, parent_fingerprint, index)
+        elif version in [XPUB, TPUB]:
+            if key[0] not in ['\x02', '\x03']:
+                raise Exception("Invalid public extended key.")
+            return cls(chain_code, key, None, depth, parent_fingerprint, index)
+        else:
+            raise Exception("Unknown extended key version: " + version)
+
+    def is_private(self):
+        """ Checks whether the node holds a private key or not.
+
+        :return: True if the node is private, False otherwise.
+        :rtype: bool
+        """
+
+        return self.sk is not None
+
+    def fingerprint(self):
+        """ Gets the fingerprint of the node (the first 4 bytes of the RIPEMD-160 hash of its public key).
+
+        :return: The node fingerprint.
+        :rtype: bytes
+        """
+
+        return hash_160(hexlify(self.pk))[:4]
+
+    def neuter(self):
+        """ Gets the public version of the node.
+
+        :return: The node without its private key.
+        :rtype: HDNode
+        """
+
+        node = HDNode(self.chain_code, self.pk, None, self.depth, self.parent_fingerprint, self.index)
+        node._point = self._point
+
+        return node
+
+    def to_xkey(self, v='test', private=True):
+        """ Serializes the node as an extended key.
+
+        :param v: version (prefix) used to serialize the key, it depends on the type of network ('main' or 'test').
+        :type v: str
+        :param private: Whether the private (xprv / tprv) or public (xpub / tpub) extended key is returned. Private
+        nodes are serialized as private by default.
+        :type private: bool
+        :return: The base58check encoded extended key.
+        :rtype: str
+        """
+
+        private = private and self.is_private()
+
+        if v in ['mainnet', 'main']:
+            version = XPRV if private else XPUB
+        elif v in ['testnet', 'test']:
+            version = TPRV if private else TPUB
+        else:
+            raise Exception("Invalid version, use either 'main' or 'test'.")
+
+        key = '\x00' + self.sk if private else self.pk
+
+        return encode_check(unhexlify(version) + chr(self.depth) + self.parent_fingerprint + pack('>I', self.index) +
+                            self.chain_code + key)
+
+    def get_point(self):
+        """ Gets the public key of the node parsed by the current elliptic curve backend. It is parsed only once.
+
+        :return: The public key of the node.
+        :rtype: coincurve.PublicKey or ecdsa.ellipticcurve.Point
+        """
+
+        backend = ec_backend.get_backend()
+        if self._point is None or self._point[0] != backend:
+            if backend == ec_backend.COINCURVE:
+                point = ec_backend.parse_pk(hexlify(self.pk))
+            else:
+                point = VerifyingKey.from_string(self.pk, curve=SECP256k1).pubkey.point
+            self._point = (backend, point)
+
+        return self._point[1]
+
+    def get_verifying_key(self):
+        """ Gets the public key of the node as an ecdsa VerifyingKey (e.g. to be used by wallet.generate_btc_addr).
+
+        :return: The public key of the node.
+        :rtype: VerifyingKey
+        """
+
+        return VerifyingKey.from_string(self.pk, curve=SECP256k1)
+
+    def get_signing_key(self):
+        """ Gets the private key of the node as an ecdsa SigningKey (e.g. to sign transactions).
+
+        :return: The private key of the node.
+        :rtype: SigningKey
+        """
+
+        if not self.is_private():
+            raise Exception("Public nodes have no private key.")
+
+        return SigningKey.from_string(self.sk, curve=SECP256k1)
+
+    def child(self, index):
+        """ Derives a child of the node (CKDpriv for private nodes, CKDpub for public ones). The public part of the
+        child is cached (see _children).
+
+        :param index: Index of the child. Hardened indexes (from HARDENED on) can only be derived from private nodes.
+        :type index: int
+        :return: The child node.
+        :rtype: HDNode
+        """
+
+        key = (self.chain_code, self.pk, index)
+        public = _children.get(key)
+
+        if public is None:
+            sk, pk, chain_code = _ckd(self, index)
+            child = HDNode(chain_code, pk, sk, self.depth + 1, self.fingerprint(), index)
+            _children.put(key, child.neuter())
+        elif self.is_private():
+            # Private keys are never cached, so the one of the child is derived again. Its public key (the costly part
+            # of the derivation) is taken from the cache.
+            sk, pk, chain_code = _ckd(self, index, public.pk)
+            child = HDNode(chain_code, pk, sk, self.depth + 1, public.parent_fingerprint, index)
+            child._point = public._point
+        else:
+            # Hardened children may have been cached from the private version of the node.
+            if index >= HARDENED:
+                raise Exception("Hardened children can only be derived from private nodes.")
+            child = public.neuter()
+
+        return child
+
+    def derive(self, path):
+        """ Derives a descendant of the node following a given path, e.g. m/44'/0'/0'/0/1 (hardened indexes are
+        marked with either ' or h). Paths starting with m are only valid from the master node.
+
+        :param path: Derivation path.
+        :type path: str
+        :return: The derived node.
+        :rtype: HDNode
+        """
+
+        steps = path.split('/')
+        if steps[0] == 'm':
+            if self.depth != 0:
+                raise Exception("Absolute paths can only be derived from the master node.")
+            steps = steps[1:]
+
+        node = self
+        for step in steps:
+            if step[-1:] in ["'", "h", "H"]:
+                index = int(step[:-1]) + HARDENED
+            else:
+                index = int(step)
+            if not 0 <= index < 2 ** 32:
+                raise Exception("Wrong derivation index: " + step)
+            node = node.child(index)
+
+        return node
+
+
+# Public version of the children derived by HDNode.child, identified by the chain code and public key of their parent
+# (which identify it, being it private or not) and their index. Private keys are never cached, so they are only held by
+# the nodes of the caller.
+_children = LRUCache()
+
+
+def clear_cache():
+    """ Drops every cached child (see HDNode.child).
+
+    :return: None
+    :rtype: None
+    """
+
+    _children.clear()
+
+
+def _sk_to_pk(sk):
+    """ Computes the compressed public key of a given private key.
+
+    :param sk: 32-byte private key.
+    :type sk: bytes
+    :return: The compressed public key.
+    :rtype: bytes
+    """
+
+    if ec_backend.get_backend() == ec_backend.COINCURVE:
+        return ec_backend.secret_to_pk(sk)
+    else:
+        return _ser_point(_G * int(hexlify(sk), 16))
+
+
+def _ckd(node, index, pk=None):
+    """ Computes the child key derivation function of BIP32 over a given node.
+
+    :param node: Parent node.
+    :type node: HDNode
+    :param index: Index of the child.
+    :type index: int
+    :param pk: Public key of the child, if already known (so it is not computed again from a private node). None by
+    default.
+    :type pk: bytes
+    :return: The private key (None for public nodes), public key and chain code of the child.
+    :rtype: bytes, bytes, bytes
+    """
+
+    if index >= HARDENED:
+        if not node.is_private():
+            raise Exception("Hardened children can only be derived from private nodes.")
+        data = '\x00' + node.sk + pack('>I', index)
+    else:
+        data = node.pk + pack('>I', index)
+
+    i = hmac_new(node.chain_code, data, sha512).digest()
+    il = int(hexlify(i[:32]), 16)
+    if not 0 < il < _ORDER:
+        raise Exception("Invalid child key at index " + str(index) + ", use the next index.")
+
+    if node.is_private():
+        k = (il + int(hexlify(node.sk), 16)) % _ORDER
+        if k == 0:
+            raise Exception("Invalid child key at index " + str(index) + ", use the next index.")
+        sk = unhexlify(format(k, '064x'))
+        if pk is None:
+            pk = _sk_to_pk(sk)
+    else:
+        sk = None
+        # The child public key is the parent one plus il * G.
+        if ec_backend.get_backend() == ec_backend.COINCURVE:
+            pk = ec_backend.tweak_pk(node.get_point(), i[:32]).format(compressed=True)
+        else:
+            point = _G * il + node.get_point()
+            if point == INFINITY:
+                raise Exception("Invalid child key at index " + str(index) + ", use the next index.")
+            pk = _ser_point(point)
+
+    return sk, pk, i[32:]
+
+
+def _derive_children_job(job):
+    """ Derives a chunk of children of derive_children inside a worker process.
+
+    :param job: Parent (chain code, public key and private key) and indexes of the children.
+    :type job: tuple
+    :return: The private key, public key and chain code of every child.
+    :rtype: list of tuple
+    """
+
+    chain_code, pk, sk, indexes = job
+    node = HDNode(chain_code, pk, sk)
+
+    return [_ckd(node, i) for i in indexes]
+
+
+def derive_children(node, indexes, processes=None):
+    """ Batch version of HDNode.child, over many indexes of the same parent (e.g. a range of receive addresses). The
+    parent public key is parsed once, and the indexes are split in chunks that are derived by a pool of worker
+    processes. Children are not cached.
+
+    e.g: derive_children(account.derive('0'), range(100000))
+
+    :param node: Parent node.
+    :type node: HDNode
+    :param indexes: Indexes of the children.
+    :type indexes: list of int
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the children are
+    derived in the calling process.
+    :type processes: int
+    :return: The children, in the same order than the given indexes.
+    :rtype: list of HDNode
+    """
+
+    indexes = list(indexes)
+
+    if processes is None:
+        processes = cpu_count()
+
+    if processes == 1 or len(indexes) < processes * 1000:
+        results = [_ckd(node, i) for i in indexes]
+    else:
+        # Every job carries the parent node, so indexes are sent in a few big chunks instead of one by one.
+        chunksize = len(indexes) / (processes * 4) + 1
+        jobs = [(node.chain_code, node.pk, node.sk, indexes[i:i + chunksize])
+                for i in range(0, len(indexes), chunksize)]
+
+        pool = Pool(processes)
+        try:
+            results = [r for chunk in pool.map(_derive_children_job, jobs) for r in chunk]
+        finally:
+            pool.close()
+            pool.join()
+
+    fingerprint = node.fingerprint()
+
+    return [HDNode(chain_code, pk, sk, node.depth + 1, fingerprint, i) for i, (sk, pk, chain_code) in
+            zip(indexes, results)]
+
+
+def derive_btc_addrs(node, indexes, v='test', processes=None):
+    """ Derives the (P2PKH) Bitcoin addresses of many children of the same parent (see derive_children and
+    wallet.pks_to_btc_addrs).
+
+    e.g: derive_btc_addrs(HDNode.from_xkey(xpub).derive('0'), range(100000), 'main')
+
+    :param node: Parent node.
+    :type node: HDNode
+    :param indexes: Indexes of the children.
+    :type indexes: list of int
+    :param v: version used to calculate the Bitcoin addresses (either 'main' or 'test').
+    :type v: str
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
+    :return: The Bitcoin addresses, in the same order than the given indexes.
+    :rtype: list of str
+    """
+
+    children = derive_children(node, indexes, processes)
+
+    return pks_to_btc_addrs([child.pk for child in children], v, processes)
@@ -0,0 +1,175 @@
+from binascii import hexlify, unhexlify
+from imp import find_module
+
+# coincurve (a binding to Bitcoin Core's libsecp256k1) is an optional dependency. If it is installed, the elliptic
+# curve operations that dominate signing and key decompression are performed with it. Otherwise, the pure-Python ecdsa
+# library is used. Both backends produce identical keys and (deterministic) DER signatures.
+#
+# Loading coincurve (and its cffi bindings) takes longer than loading the rest of the library, so it is only looked up
+# here and imported the first time it is used (see _coincurve).
+try:
+    find_module('coincurve')
+    _installed = True
+except ImportError:
+    _installed = False
+
+coincurve = None
+
+ECDSA = 'ecdsa'
+COINCURVE = 'coincurve'
+
+_backend = COINCURVE if _installed else ECDSA
+
+
+def _coincurve():
+    """ Gets the coincurve module, importing it on first use.
+
+    :return: The coincurve module.
+    :rtype: module
+    """
+
+    global coincurve
+
+    if coincurve is None:
+        import coincurve as cc
+        coincurve = cc
+
+    return coincurve
+
+
+def is_coincurve_installed():
+    """ Checks whether coincurve is installed (without importing it).
+
+    :return: True if coincurve is installed, False otherwise.
+    :rtype: bool
+    """
+
+    return _installed
+
+
+def get_backend():
+    """ Gets the name of the backend currently used for the elliptic curve operations.
+
+    :return: The backend name (either ECDSA or COINCURVE).
+    :rtype: str
+    """
+
+    return _backend
+
+
+def set_backend(name):
+    """ Sets the backend to be used for the elliptic curve operations.
+
+    :param name: Name of the backend (either ECDSA or COINCURVE).
+    :type name: str
+    :return: None.
+    :rtype: None
+    """
+
+    global _backend
+
+    if name not in [ECDSA, COINCURVE]:
+        raise Exception("Unknown backend, use either '" + ECDSA + "' or '" + COINCURVE + "'.")
+    elif name == COINCURVE and not _installed:
+        raise Exception("coincurve is not installed. Install it to use the " + COINCURVE + " backend.")
+
+    _backend = name
+
+
+def sign_digest(secret, h):
+    """ Performs a deterministic (RFC6979) ECDSA signature over a sha256 digest using libsecp256k1. As with
+    ecdsa's sign_deterministic with hashfunc=sha256, the digest is hashed once more before being signed. The signature
+    is DER encoded and has a low S value (the same sigencode_der_canonize would output).
+
+    :param secret: 32-byte private key.
+    :type secret: bytes
+    :param h: Digest to be signed.
+    :type h: bytes
+    :return: DER encoded signature.
+    :rtype: bytes
+    """
+
+    return _coincurve().PrivateKey(secret).sign(h)
+
+
+def compress_pk(pk):
+    """ Computes the compressed representation of a public key using libsecp256k1.
+
+    :param pk: Uncompressed public key.
+    :type pk: hex str
+    :return: The compressed public key.
+    :rtype: hex str
+    """
+
+    return hexlify(_coincurve().PublicKey(unhexlify(pk)).format(compressed=True))
+
+
+def decompress_pk(compressed_pk):
+    """ Computes the uncompressed representation of a public key using libsecp256k1.
+
+    :param compressed_pk: Compressed public key.
+    :type compressed_pk: hex str
+    :return: The uncompressed public key.
+    :rtype: hex str
+    """
+
+    return hexlify(_coincurve().PublicKey(unhexlify(compressed_pk)).format(compressed=False))
+
+
+def parse_pk(pk):
+    """ Parses a serialized public key using libsecp256k1.
+
+    :param pk: Serialized public key (either compressed or uncompressed).
+    :type pk: hex str
+    :return: The parsed public key.
+    :rtype: coincurve.PublicKey
+    """
+
+    return _coincurve().PublicKey(unhexlify(pk))
+
+
+def verify_digest(pk, signature, h):
+    """ Verifies an ECDSA signature over a sha256 digest using libsecp256k1 (see sign_digest). Notice that libsecp256k1
+    only accepts signatures with a low S value.
+
+    :param pk: Public key, as returned by parse_pk.
+    :type pk: coincurve.PublicKey
+    :param signature: DER encoded signature.
+    :type signature: bytes
+    :param h: Signed digest.
+    :type h: bytes
+    :return: Whether the signature is valid or not.
+    :rtype: bool
+    """
+
+    return pk.verify(signature, h)
+
+
+def secret_to_pk(secret):
+    """ Computes the compressed public key of a given private key using libsecp256k1.
+
+    :param secret: 32-byte private key.
+    :type secret: bytes
+    :return: The compressed public key.
+    :rtype: bytes
+    """
+
+    return _coincurve().PublicKey.from_valid_secret(secret).format(compressed=True)
+
+
+def tweak_pk(pk, tweak):
+    """ Adds tweak * G to a public key using libsecp256k1 (as done by BIP32 public derivation). The tweak point is
+    computed over the precomputed generator tables and then combined with the key, which is faster than
+    libsecp256k1's own tweak addition.
+
+    :param pk: Public key, as returned by parse_pk.
+    :type pk: coincurve.PublicKey
+    :param tweak: 32-byte tweak (a valid private key).
+    :type tweak: bytes
+    :return: The resulting public key.
+    :rtype: coincurve.PublicKey
+    """
+
+    PublicKey = _coincurve().PublicKey
+
+    return PublicKey.combine_keys([PublicKey.from_valid_secret(tweak), pk])
@@ -0,0 +1,349 @@
+from binascii import hexlify, unhexlify
+from multiprocessing import Pool, cpu_count
+from bitcoin.core.script import OP_PUSHDATA4, OP_1NEGATE, OP_1, OP_16, OP_NOP, OP_VERIFY, OP_RETURN, OP_DUP, \
+    OP_EQUAL, OP_EQUALVERIFY, OP_HASH160, OP_CHECKSIG, OP_CHECKSIGVERIFY, OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY, \
+    SIGHASH_ALL, SIGHASH_SINGLE, SIGHASH_NONE
+from bitcoin_tools.core.keys import tx_sighash, ecdsa_verify_sighash
+from bitcoin_tools.core.script import OutputScript, Script
+from bitcoin_tools.core.script_types import match_script
+from bitcoin_tools.wallet import hash_160
+from bitcoin_tools.utils import LRUCache
+
+# Maximum number of public keys of an OP_CHECKMULTISIG.
+MAX_PUBKEYS_PER_MULTISIG = 20
+
+# Results of the signature checks performed by the interpreter, identified by the signed digest, the signature and the
+# public key. The same signature is usually checked several times (e.g. when a transaction is validated both before and
+# after being broadcast, or against every key of a multisig script), and checking it is the costly part of the
+# validation.
+_signatures = LRUCache()
+
+
+def check_sig(h, signature, pk):
+    """ Checks an ECDSA signature over a transaction digest, caching the result (see keys.ecdsa_verify_sighash).
+
+    :param h: sha256 digest of the unsigned transaction and the hash type.
+    :type h: bytes
+    :param signature: DER encoded signature (without the trailing hash type).
+    :type signature: bytes
+    :param pk: Serialized public key the signature is checked against.
+    :type pk: bytes
+    :return: Whether the signature is valid or not.
+    :rtype: bool
+    """
+
+    valid = _signatures.get((h, signature, pk))
+    if valid is None:
+        valid = ecdsa_verify_sighash(h, hexlify(signature), hexlify(pk))
+        _signatures.put((h, signature, pk), valid)
+
+    return valid
+
+
+class _Checker:
+    """ Checks the signatures found while evaluating the scripts of a given transaction input. Digests are computed once
+    per script code and hash type.
+    """
+
+    def __init__(self, tx, index):
+        self.tx = tx
+        self.index = index
+        self.sighashes = dict()
+
+    def check(self, signature, pk, script_code):
+        """ Checks a signature (followed by its hash type) performed over the input.
+
+        :param signature: Transaction signature, as found in the stack.
+        :type signature: bytes
+        :param pk: Serialized public key, as found in the stack.
+        :type pk: bytes
+        :param script_code: Script being evaluated, that is, the one included in the data signed for the input.
+        :type script_code: bytes
+        :return: Whether the signature is valid or not. Signatures with a hash type that can not be signed (either not
+        supported, such as SIGHASH_ANYONECANPAY, or SIGHASH_SINGLE without a matching output) are considered invalid.
+        :rtype: bool
+        """
+
+        if not signature:
+            return False
+
+        hashflag = ord(signature[-1])
+        if hashflag not in [SIGHASH_ALL, SIGHASH_SINGLE, SIGHASH_NONE] or \
+                (hashflag == SIGHASH_SINGLE and self.index >= self.tx.outputs):
+            return False
+
+        h = self.sighashes.get((script_code, hashflag))
+        if h is None:
+            prev_script = OutputScript.from_hex(hexlify(script_code))
+            h, _ = tx_sighash(self.tx.signature_preimage(self.index, prev_script, hashflag), hashflag)
+            self.sighashes[(script_code, hashflag)] = h
+
+        return check_sig(h, signature[:-1], pk)
+
+
+def cast_to_bool(v):
+    """ Interprets a stack element as a boolean: any value but zero (or negative zero) is true.
+
+    :param v: Stack element.
+    :type v: bytes
+    :return: The boolean value of the element.
+    :rtype: bool
+    """
+
+    for i, c in enumerate(v):
+        if c != "\x00":
+            # Negative zero (0x80 as last byte, with zeros everywhere else) is also false.
+            return not (i == len(v) - 1 and c == "\x80")
+
+    return False
+
+
+def decode_num(v):
+    """ Decodes a stack element as a number (little endian sign-magnitude, up to 4 bytes).
+
+    :param v: Stack element.
+    :type v: bytes
+    :return: The decoded number, or None if the element is too long to be a number.
+    :rtype: int
+    """
+
+    if len(v) > 4:
+        return None
+    elif not v:
+        return 0
+
+    n = int(hexlify(v[::-1]), 16)
+    if ord(v[-1]) & 0x80:
+        return -(n & ~(0x80 << (8 * (len(v) - 1))))
+    else:
+        return n
+
+
+def eval_script(stack, script, checker):
+    """ Evaluates a serialized script over a given stack. Only the opcodes used by the standard scripts are supported:
+    data pushes, OP_1NEGATE, OP_1 to OP_16, OP_NOP, OP_VERIFY, OP_RETURN, OP_DUP, OP_HASH160, OP_EQUAL(VERIFY),
+    OP_CHECKSIG(VERIFY) and OP_CHECKMULTISIG(VERIFY).
+
+    :param stack: Stack the script is evaluated over (it is modified in place).
+    :type stack: list of bytes
+    :param script: Serialized script.
+    :type script: bytes
+    :param checker: Checker of the signatures of the input being evaluated.
+    :type checker: _Checker
+    :return: Whether the evaluation succeeded or not (the result of the script is left on top of the stack).
+    :rtype: bool
+    """
+
+    try:
+        for op, data in Script.parse(hexlify(script)):
+            if op is None:
+                # Data push exceeding the script length.
+                return False
+            elif op <= OP_PUSHDATA4:
+                stack.append(data)
+            elif op == OP_1NEGATE:
+                stack.append("\x81")
+            elif OP_1 <= op <= OP_16:
+                stack.append(chr(op - OP_1 + 1))
+            elif op == OP_NOP:
+                pass
+            elif op == OP_VERIFY:
+                if not cast_to_bool(stack.pop()):
+                    return False
+            elif op == OP_RETURN:
+                return False
+            elif op == OP_DUP:
+                stack.append(stack[-1])
+            elif op == OP_HASH160:
+                stack.append(hash_160(hexlify(stack.pop())))
+            elif op in [OP_EQUAL, OP_EQUALVERIFY]:
+                equal = stack.pop() == stack.pop()
+                if op == OP_EQUALVERIFY:
+                    if not equal:
+                        return False
+                else:
+                    stack.append("\x01" if equal else "")
+            elif op in [OP_CHECKSIG, OP_CHECKSIGVERIFY]:
+                pk = stack.pop()
+                signature = stack.pop()
+                valid = checker.check(signature, pk, script)
+                if op == OP_CHECKSIGVERIFY:
+                    if not valid:
+                        return False
+                else:
+                    stack.append("\x01" if valid else "")
+            elif op in [OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY]:
+                n = decode_num(stack.pop())
+                if n is None or not 0 <= n <= MAX_PUBKEYS_PER_MULTISIG or n > len(stack):
+                    return False
+                pks = [stack.pop() for _ in range(n)][::-1]
+                m = decode_num(stack.pop())
+                if m is None or not 0 <= m <= n or m > len(stack):
+                    return False
+                sigs = [stack.pop() for _ in range(m)][::-1]
+                # OP_CHECKMULTISIG pops an extra (dummy) element.
+                stack.pop()
+
+                # Each signature is checked against the remaining keys (in order), and the check fails as soon as there
+                # are more signatures left than keys to check them against.
+                i_sig, i_pk = 0, 0
+                while i_sig < m and m - i_sig <= n - i_pk:
+                    if checker.check(sigs[i_sig], pks[i_pk], script):
+                        i_sig += 1
+                    i_pk += 1
+                valid = i_sig == m
+
+                if op == OP_CHECKMULTISIGVERIFY:
+                    if not valid:
+                        return False
+                else:
+                    stack.append("\x01" if valid else "")
+            else:
+                raise Exception("Unsupported opcode " + hex(op) + ". Only standard scripts can be evaluated.")
+    except IndexError:
+        # Stack underflow.
+        return False
+
+    return True
+
+
+def _is_push_only(script):
+    """ Checks whether a serialized script only pushes data (including OP_1NEGATE and OP_1 to OP_16).
+
+    :param script: Serialized script.
+    :type script: bytes
+    :return: True if the script only pushes data, False otherwise.
+    :rtype: bool
+    """
+
+    return all(op is not None and op <= OP_16 for op, _ in Script.parse(hexlify(script)))
+
+
+def _get_pushes(script):
+    """ Gets the data pushed by a serialized script, if it only has data pushes (OP_1NEGATE and OP_1 to OP_16 aside).
+
+    :param script: Serialized script.
+    :type script: hex str
+    :return: The pushed data, or None if the script has any other opcode.
+    :rtype: list of bytes
+    """
+
+    ops = Script.parse(script)
+
+    if all(op is not None and op <= OP_PUSHDATA4 for op, _ in ops):
+        return [data for _, data in ops]
+    else:
+        return None
+
+
+def _raw(script):
+    """ Gets the serialization of a script as bytes.
+
+    :param script: Script.
+    :type script: Script
+    :return: The serialized script.
+    :rtype: bytes
+    """
+
+    return unhexlify(script.content)
+
+
+def verify_script(tx, index, prev_script, p2sh=True):
+    """ Verifies that a given input of a transaction is a valid spend of the UTXO it redeems, by evaluating its
+    scriptSig followed by the ScriptPubKey of the UTXO (and, for P2SH outputs, the redeem script). P2PKH and P2PK
+    spends are checked straight away, without going through the interpreter.
+
+    Only legacy (non SegWit) spends of standard scripts are supported. OP_CODESEPARATOR is not supported, and signatures
+    are not removed from the signed script (which only matters for nonstandard scripts).
+
+    :param tx: Transaction to be verified.
+    :type tx: TX
+    :param index: The index of the input to be verified.
+    :type index: int
+    :param prev_script: Script of the UTXO that the input is redeeming.
+    :type prev_script: OutputScript
+    :param p2sh: Whether P2SH outputs are evaluated as such (BIP16) or not. Set by default.
+    :type p2sh: bool
+    :return: Whether the input is valid or not.
+    :rtype: bool
+    """
+
+    checker = _Checker(tx, index)
+    t = match_script(prev_script.content)[0]
+
+    # Fast path for the most common templates, when the scriptSig only pushes the expected elements.
+    if t in ["P2PKH", "P2PK"]:
+        pushes = _get_pushes(tx.scriptSig[index].content)
+        script_pk = OutputScript.parse(prev_script.content)
+
+        if t == "P2PKH" and pushes is not None and len(pushes) == 2:
+            signature, pk = pushes
+            return hash_160(hexlify(pk)) == script_pk[2][1] and checker.check(signature, pk, _raw(prev_script))
+        elif t == "P2PK" and pushes is not None and len(pushes) == 1:
+            return checker.check(pushes[0], script_pk[0][1], _raw(prev_script))
+
+    script_sig = _raw(tx.scriptSig[index])
+    script_pk = _raw(prev_script)
+
+    stack = []
+    if not eval_script(stack, script_sig, checker):
+        return False
+    stack_copy = list(stack)
+
+    if not eval_script(stack, script_pk, checker) or not stack or not cast_to_bool(stack[-1]):
+        return False
+
+    if p2sh and t == "P2SH":
+        # The scriptSig of a P2SH spend must only push data, the last element being the redeem script, that is evaluated
+        # over the rest of the elements.
+        if not _is_push_only(script_sig) or not stack_copy:
+            return False
+
+        stack = stack_copy
+        redeem_script = stack.pop()
+
+        if not eval_script(stack, redeem_script, checker) or not stack or not cast_to_bool(stack[-1]):
+            return False
+
+    return True
+
+
+def _verify_script_job(job):
+    """ Verifies a single job of verify_scripts inside a worker process.
+
+    :param job: Transaction, input index and ScriptPubKey of the redeemed UTXO.
+    :type job: tuple
+    :return: Whether the input is valid or not.
+    :rtype: bool
+    """
+
+    return verify_script(*job)
+
+
+def verify_scripts(jobs, processes=None):
+    """ Batch version of verify_script, spreading the inputs across a pool of worker processes. Each worker keeps its
+    own signature cache.
+
+    :param jobs: List of (tx, index, prev_script) to be verified (see verify_script).
+    :type jobs: list of tuple
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the inputs are
+    verified in the calling process.
+    :type processes: int
+    :return: Whether each input is valid or not, in the same order than the jobs.
+    :rtype: list of bool
+    """
+
+    if processes == 1 or len(jobs) <= 1:
+        return [verify_script(*job) for job in jobs]
+
+    if processes is None:
+        processes = cpu_count()
+
+    pool = Pool(processes)
+    try:
+        results = pool.map(_verify_script_job, jobs, len(jobs) / (processes * 4) + 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
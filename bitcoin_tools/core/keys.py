@@ -1,12 +1,14 @@
 from bitcoin_tools import CFG
-from bitcoin_tools.utils import change_endianness, int2bytes
+from bitcoin_tools.core import ec_backend
+from bitcoin_tools.utils import change_endianness, int2bytes, LRUCache
 from bitcoin.core.script import SIGHASH_ALL, SIGHASH_SINGLE, SIGHASH_NONE
 
 from binascii import hexlify, unhexlify
 from hashlib import sha256
+from multiprocessing import Pool, cpu_count
 from os import mkdir, path
-from ecdsa import SigningKey, VerifyingKey, SECP256k1
-from ecdsa.util import sigencode_der_canonize, number_to_string
+from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
+from ecdsa.util import sigencode_der_canonize, sigdecode_der, number_to_string
 
 
 def generate_keys():
@@ -23,9 +25,9 @@ def generate_keys():
     return sk, pk
 
 
-def store_keys(sk, pk, btc_addr, vault_path=None):
+def store_keys(sk, pk, btc_addr, vault_path=None, vault=None):
     """ Stores an elliptic curve key pair in PEM format into disk. Both keys are stored in a folder named after the
-    Bitcoin address derived from the public key.
+    Bitcoin address derived from the public key, or in a single file vault if one is given (see core.vault.KeyVault).
 
     :param sk: PEM encoded elliptic curve private key.
     :type sk: str
@@ -35,10 +37,16 @@ def store_keys(sk, pk, btc_addr, vault_path=None):
     :type btc_addr: str
     :param vault_path: Path where keys will be stored. Defined in the config file by default.
     :type vault_path: str
+    :param vault: Vault where keys will be stored, instead of vault_path.
+    :type vault: KeyVault
     :return: None.
     :rtype: None
     """
 
+    if vault is not None:
+        vault.store_keys(SigningKey.from_pem(sk), VerifyingKey.from_pem(pk), btc_addr)
+        return
+
     if vault_path is None:
         vault_path = CFG.address_vault
 
@@ -50,7 +58,7 @@ def store_keys(sk, pk, btc_addr, vault_path=None):
     open(vault_path + btc_addr + '/pk.pem', "w").write(pk)
 
 
-def load_keys(btc_addr, vault_path=None):
+def load_keys(btc_addr, vault_path=None, vault=None):
     """ Loads an elliptic curve key pair in PEM format from disk. Keys are stored in their proper objects from the ecdsa
     python library (SigningKey and VerifyingKey respectively)
 
@@ -58,10 +66,15 @@ def load_keys(btc_addr, vault_path=None):
     :type btc_addr: str
     :param vault_path: Path where keys are be stored. Defined in the config file by default.
     :type vault_path: str
+    :param vault: Vault where keys are stored, instead of vault_path (see core.vault.KeyVault).
+    :type vault: KeyVault
     :return: ecdsa key pair as a tuple.
     :rtype: SigningKey, VerifyingKey
     """
 
+    if vault is not None:
+        return vault.load_keys(btc_addr)
+
     if vault_path is None:
         vault_path = CFG.address_vault
 
@@ -111,17 +124,16 @@ def serialize_sk(sk):
     return hexlify(sk.to_string())
 
 
-def ecdsa_tx_sign(unsigned_tx, sk, hashflag=SIGHASH_ALL, deterministic=True):
-    """ Performs and ECDSA sign over a given transaction using a given secret key.
-    :param unsigned_tx: unsigned transaction that will be double-sha256 and signed.
+def tx_sighash(unsigned_tx, hashflag=SIGHASH_ALL):
+    """ Computes the digest of an unsigned transaction that will be signed for a given hash type. Notice that the digest
+    is a single sha256, the second one is performed by the ECDSA signature itself (resulting in the double-sha256).
+
+    :param unsigned_tx: unsigned transaction (already formatted to be signed).
     :type unsigned_tx: hex str
-    :param sk: ECDSA private key that will sign the transaction.
-    :type sk: SigningKey
     :param hashflag: hash type that will be used during the signature process and will identify the signature format.
     :type hashflag: int
-    :param deterministic: Whether the signature is performed using a deterministic k or not. Set by default.
-    :type deterministic: bool
-    :return:
+    :return: The sha256 digest of the transaction together with the hash type, and the 4-byte encoded hash type.
+    :rtype: bytes, hex str
     """
 
     # Encode the hash type as a 4-byte hex value.
@@ -134,9 +146,30 @@ def ecdsa_tx_sign(unsigned_tx, sk, hashflag=SIGHASH_ALL, deterministic=True):
 
     # sha-256 the unsigned transaction together with the hash type (little endian).
     h = sha256(unhexlify(unsigned_tx + change_endianness(hc))).digest()
+
+    return h, hc
+
+
+def ecdsa_sign_sighash(h, hc, sk, deterministic=True):
+    """ Performs an ECDSA sign over an already computed transaction digest (see tx_sighash).
+
+    :param h: sha256 digest of the unsigned transaction and the hash type.
+    :type h: bytes
+    :param hc: 4-byte encoded hash type.
+    :type hc: hex str
+    :param sk: ECDSA private key that will sign the transaction.
+    :type sk: SigningKey
+    :param deterministic: Whether the signature is performed using a deterministic k or not. Set by default.
+    :type deterministic: bool
+    :return: The DER encoded signature followed by the hash type.
+    :rtype: hex str
+    """
+
     # Sign the transaction (using a sha256 digest, that will conclude with the double-sha256)
     # If deterministic is set, the signature will be performed deterministically choosing a k from the given transaction
-    if deterministic:
+    if deterministic and ec_backend.get_backend() == ec_backend.COINCURVE:
+        s = ec_backend.sign_digest(sk.to_string(), h)
+    elif deterministic:
         s = sk.sign_deterministic(h, hashfunc=sha256, sigencode=sigencode_der_canonize)
     # Otherwise, k will be chosen at random. Notice that this can lead to a private key disclosure if two different
     # messages are signed using the same k.
@@ -147,6 +180,205 @@ def ecdsa_tx_sign(unsigned_tx, sk, hashflag=SIGHASH_ALL, deterministic=True):
     return hexlify(s) + hc[-2:]
 
 
+def ecdsa_tx_sign(unsigned_tx, sk, hashflag=SIGHASH_ALL, deterministic=True):
+    """ Performs and ECDSA sign over a given transaction using a given secret key.
+    :param unsigned_tx: unsigned transaction that will be double-sha256 and signed.
+    :type unsigned_tx: hex str
+    :param sk: ECDSA private key that will sign the transaction.
+    :type sk: SigningKey
+    :param hashflag: hash type that will be used during the signature process and will identify the signature format.
+    :type hashflag: int
+    :param deterministic: Whether the signature is performed using a deterministic k or not. Set by default.
+    :type deterministic: bool
+    :return:
+    """
+
+    h, hc = tx_sighash(unsigned_tx, hashflag)
+
+    return ecdsa_sign_sighash(h, hc, sk, deterministic)
+
+
+# Signing keys rebuilt by each worker process of ecdsa_tx_sign_batch, identified by their serialization. Rebuilding a
+# key derives its public key, which costs as much as a signature, so it is only done once per key and worker.
+_worker_sks = dict()
+
+
+def _sign_sighash_job(job):
+    """ Signs a single job of ecdsa_tx_sign_batch inside a worker process.
+
+    :param job: serialized private key, transaction digest, encoded hash type and deterministic flag.
+    :type job: tuple
+    :return: The DER encoded signature followed by the hash type.
+    :rtype: hex str
+    """
+
+    sk_str, h, hc, deterministic = job
+
+    sk = _worker_sks.get(sk_str)
+    if sk is None:
+        sk = SigningKey.from_string(sk_str, curve=SECP256k1)
+        _worker_sks[sk_str] = sk
+
+    return ecdsa_sign_sighash(h, hc, sk, deterministic)
+
+
+def ecdsa_tx_sign_batch(jobs, deterministic=True, processes=None):
+    """ Performs the ECDSA signatures of a batch of transactions. Digests are computed up front and the signatures are
+    spread across a pool of worker processes.
+
+    :param jobs: List of (unsigned_tx, sk, hashflag) to be signed (see ecdsa_tx_sign).
+    :type jobs: list of tuple
+    :param deterministic: Whether the signature is performed using a deterministic k or not. Set by default.
+    :type deterministic: bool
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the signatures are
+    performed in the calling process.
+    :type processes: int
+    :return: The signatures, in the same order than the jobs.
+    :rtype: list of hex str
+    """
+
+    sighashes = [tx_sighash(unsigned_tx, hashflag) for unsigned_tx, _, hashflag in jobs]
+
+    if processes == 1 or len(jobs) <= 1:
+        return [ecdsa_sign_sighash(h, hc, sk, deterministic) for (h, hc), (_, sk, _) in zip(sighashes, jobs)]
+
+    # Keys are sent to the workers serialized, since SigningKeys are not meant to be pickled.
+    work = [(sk.to_string(), h, hc, deterministic) for (h, hc), (_, sk, _) in zip(sighashes, jobs)]
+
+    if processes is None:
+        processes = cpu_count()
+
+    pool = Pool(processes)
+    try:
+        chunksize = len(work) / (processes * 4) + 1
+        sigs = pool.map(_sign_sighash_job, work, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+    return sigs
+
+
+# Public keys parsed by ecdsa_verify_sighash, identified by the backend and their serialization. The same keys are found
+# in many signatures, and parsing a key (decompressing it and checking it is a valid point) is a costly operation.
+_verifying_keys = LRUCache()
+
+
+def get_verifying_key(pk):
+    """ Parses a serialized public key into a key object of the current elliptic curve backend. Results are cached.
+
+    :param pk: Serialized public key (either compressed or uncompressed).
+    :type pk: hex str
+    :return: The parsed public key.
+    :rtype: VerifyingKey or coincurve.PublicKey, depending on the backend.
+    """
+
+    backend = ec_backend.get_backend()
+
+    vk = _verifying_keys.get((backend, pk))
+    if vk is None:
+        if backend == ec_backend.COINCURVE:
+            vk = ec_backend.parse_pk(pk)
+        else:
+            if pk[:2] in ["02", "03"]:
+                uncompressed_pk = get_uncompressed_pk(pk)
+            else:
+                uncompressed_pk = pk
+            vk = VerifyingKey.from_string(unhexlify(uncompressed_pk[2:]), curve=SECP256k1)
+        _verifying_keys.put((backend, pk), vk)
+
+    return vk
+
+
+def ecdsa_verify_sighash(h, signature, pk):
+    """ Verifies an ECDSA signature over an already computed transaction digest (see tx_sighash).
+
+    :param h: sha256 digest of the unsigned transaction and the hash type.
+    :type h: bytes
+    :param signature: DER encoded signature (without the trailing hash type).
+    :type signature: hex str
+    :param pk: Serialized public key the signature is checked against.
+    :type pk: hex str
+    :return: Whether the signature is valid or not. Malformed signatures or keys are considered invalid.
+    :rtype: bool
+    """
+
+    try:
+        r, s = sigdecode_der(unhexlify(signature), SECP256k1.order)
+        vk = get_verifying_key(pk)
+    except Exception:
+        return False
+
+    if ec_backend.get_backend() == ec_backend.COINCURVE:
+        # libsecp256k1 only accepts low S values, while signatures with a high S value are also valid (they were
+        # common before the low S rule was enforced as standard), so the S value is normalized before verifying.
+        return ec_backend.verify_digest(vk, sigencode_der_canonize(r, s, SECP256k1.order), h)
+    else:
+        try:
+            return vk.verify(unhexlify(signature), h, hashfunc=sha256, sigdecode=sigdecode_der)
+        except BadSignatureError:
+            return False
+
+
+def ecdsa_tx_verify(unsigned_tx, signature, pk):
+    """ Verifies an ECDSA signature over a given transaction, the counterpart of ecdsa_tx_sign.
+
+    :param unsigned_tx: unsigned transaction (already formatted to be signed) the signature has been performed over.
+    :type unsigned_tx: hex str
+    :param signature: Transaction signature (DER encoded signature followed by the hash type).
+    :type signature: hex str
+    :param pk: Serialized public key the signature is checked against.
+    :type pk: hex str
+    :return: Whether the signature is valid or not.
+    :rtype: bool
+    """
+
+    h, _ = tx_sighash(unsigned_tx, int(signature[-2:], 16))
+
+    return ecdsa_verify_sighash(h, signature[:-2], pk)
+
+
+def _verify_sighash_job(job):
+    """ Verifies a single job of ecdsa_verify_batch inside a worker process.
+
+    :param job: transaction digest, DER encoded signature and serialized public key.
+    :type job: tuple
+    :return: Whether the signature is valid or not.
+    :rtype: bool
+    """
+
+    return ecdsa_verify_sighash(*job)
+
+
+def ecdsa_verify_batch(jobs, processes=None):
+    """ Verifies a batch of ECDSA signatures over transaction digests, spreading them across a pool of worker
+    processes. Each worker keeps its own cache of parsed public keys.
+
+    :param jobs: List of (h, signature, pk) to be verified (see ecdsa_verify_sighash).
+    :type jobs: list of tuple
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the signatures are
+    verified in the calling process.
+    :type processes: int
+    :return: Whether each signature is valid or not, in the same order than the jobs.
+    :rtype: list of bool
+    """
+
+    if processes == 1 or len(jobs) <= 1:
+        return [ecdsa_verify_sighash(*job) for job in jobs]
+
+    if processes is None:
+        processes = cpu_count()
+
+    pool = Pool(processes)
+    try:
+        results = pool.map(_verify_sighash_job, jobs, len(jobs) / (processes * 4) + 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
 def get_compressed_pk(pk):
     """
     Constructs the compressed representation of a SECP256k1 ECDSA public key form a given uncompressed key.
@@ -157,12 +389,20 @@ def get_compressed_pk(pk):
     :rtype: hex
     """
 
+    if ec_backend.get_backend() == ec_backend.COINCURVE:
+        return ec_backend.compress_pk(pk)
+
     ecdsa_pk = VerifyingKey.from_string(unhexlify(pk[2:]), curve=SECP256k1)
     compressed_pk = serialize_pk(ecdsa_pk)
 
     return compressed_pk
 
 
+# Uncompressed public keys, identified by their compressed representation. The same keys are found many times in the
+# chainstate, so they are only decompressed once (see get_uncompressed_pks).
+_uncompressed_pks = LRUCache()
+
+
 def get_uncompressed_pk(compressed_pk):
     """
     Constructs the uncompressed representation of a SECP256k1 ECDSA public key form a given compressed key.
@@ -175,6 +415,9 @@ def get_uncompressed_pk(compressed_pk):
     :rtype: hex
     """
 
+    if ec_backend.get_backend() == ec_backend.COINCURVE:
+        return ec_backend.decompress_pk(compressed_pk)
+
     # Get p from the curve
     p = SECP256k1.curve.p()
 
@@ -197,3 +440,48 @@ def get_uncompressed_pk(compressed_pk):
     uncompressed_pk = "04" + x_hex + format(y, '064x')
 
     return uncompressed_pk
+
+
+def get_uncompressed_pks(compressed_pks, processes=None):
+    """
+    Batch version of get_uncompressed_pk. Repeated keys are decompressed only once (results are also cached across
+    calls), and the remaining keys are spread across a pool of worker processes.
+
+    :param compressed_pks: The compressed SECP256k1 keys to be decompressed.
+    :type compressed_pks: list of hex
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the keys are
+    decompressed in the calling process.
+    :type processes: int
+    :return: The uncompressed SECP256k1 ECDSA keys, in the same order than the given ones.
+    :rtype: list of hex
+    """
+
+    uncompressed_pks = dict()
+    missing = []
+    for pk in compressed_pks:
+        if pk not in uncompressed_pks:
+            uncompressed_pk = _uncompressed_pks.get(pk)
+            uncompressed_pks[pk] = uncompressed_pk
+            if uncompressed_pk is None:
+                missing.append(pk)
+
+    if processes is None:
+        processes = cpu_count()
+
+    # Workers only pay off for large batches of pure-Python decompressions, libsecp256k1 is faster than the
+    # inter-process communication itself.
+    if processes == 1 or len(missing) < processes * 1000 or ec_backend.get_backend() == ec_backend.COINCURVE:
+        results = [get_uncompressed_pk(pk) for pk in missing]
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(get_uncompressed_pk, missing, len(missing) / (processes * 4) + 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for pk, uncompressed_pk in zip(missing, results):
+        uncompressed_pks[pk] = uncompressed_pk
+        _uncompressed_pks.put(pk, uncompressed_pk)
+
+    return [uncompressed_pks[pk] for pk in compressed_pks]
@@ -0,0 +1,392 @@
+from abc import ABCMeta, abstractmethod
+from json import load, loads
+from os import makedirs, path, rename
+from Queue import Queue, Empty
+from threading import Thread, Lock
+from time import sleep
+from urlparse import urlparse
+
+from bitcoin_tools.utils import change_endianness, get_prev_ScriptPubKey, LRUCache
+from bitcoin_tools.core.script_types import get_script_type
+
+
+class PrevoutProvider:
+    """ Defines the interface of a previous output (prevout) provider, that is, a source from which the ScriptPubKey of
+    the UTXOs redeemed by a transaction can be obtained (e.g. when signing it). Providers are identified by the
+    transaction id (big endian, as in TX.prev_tx_id) and the output index.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def get_prev_script(self, tx_id, index):
+        """ Gets the ScriptPubKey of a given UTXO and its type.
+
+        :param tx_id: Transaction id of the UTXO (big endian).
+        :type tx_id: hex str
+        :param index: Index of the output in the transaction.
+        :type index: int
+        :return: The corresponding ScriptPubKey and its type.
+        :rtype: hex str, str
+        """
+        pass
+
+    def prefetch(self, outpoints):
+        """ Lets the provider know which prevouts are going to be requested next, so it can get them in advance (e.g.
+        concurrently). Providers that can not take advantage of it just ignore it.
+
+        :param outpoints: List of (tx_id, index) that will be requested.
+        :type outpoints: list of tuple
+        :return: None.
+        :rtype: None
+        """
+        pass
+
+
+class BlockcypherProvider(PrevoutProvider):
+    """ Gets prevouts by querying blockcypher's API (see utils.get_prev_ScriptPubKey).
+    """
+
+    def __init__(self, network='test', timeout=30):
+        if network not in ['main', 'mainnet', 'test', 'testnet']:
+            raise Exception("Bad network.")
+
+        self.network = network
+        self.timeout = timeout
+
+    def get_prev_script(self, tx_id, index):
+        script, _ = get_prev_ScriptPubKey(tx_id, index, self.network, self.timeout)
+
+        return script, get_script_type(script)
+
+
+class ChainstateProvider(PrevoutProvider):
+    """ Gets prevouts from a Bitcoin Core chainstate (see analysis.status.utils.get_utxo). The LevelDB is kept open
+    until close is called, so notice that bitcoind can not be using it meanwhile.
+    """
+
+    def __init__(self, chainstate_path=None):
+        # The chainstate tools are only needed (and loaded) when using this provider.
+        import plyvel
+        from bitcoin_tools import CFG
+
+        if chainstate_path is None:
+            chainstate_path = CFG.chainstate_path
+
+        self.db = plyvel.DB(chainstate_path, compression=None)
+
+    def get_prev_script(self, tx_id, index):
+        from bitcoin_tools.analysis.status.utils import get_utxo, decode_utxo, decompress_script
+
+        # Outpoints are stored in the chainstate using the little endian transaction id.
+        outpoint, coin = get_utxo(change_endianness(tx_id), index, db=self.db)
+
+        if coin is None:
+            raise Exception("UTXO " + tx_id + ":" + str(index) + " not found in the chainstate.")
+
+        out = decode_utxo(coin, outpoint).get('out')
+        script = decompress_script(out['data'], out['out_type'])
+
+        return script, get_script_type(script)
+
+    def close(self):
+        self.db.close()
+
+
+class DictProvider(PrevoutProvider):
+    """ Gets prevouts from a dictionary that maps (tx_id, index) to ScriptPubKeys.
+    """
+
+    def __init__(self, prevouts):
+        self.prevouts = prevouts
+
+    @classmethod
+    def from_json(cls, fin_name):
+        """ Builds a provider from a json file containing an object that maps "tx_id:index" to ScriptPubKeys.
+
+        e.g: {"f0315ffc38709d70ad5647e22048358dd3745f3ce3874223c80a7c92fab0c8ba:0": "76a914...88ac"}
+
+        :param fin_name: Path of the json file.
+        :type fin_name: str
+        :return: The provider containing the prevouts of the file.
+        :rtype: DictProvider
+        """
+
+        fin = open(fin_name, 'r')
+        data = load(fin)
+        fin.close()
+
+        prevouts = dict()
+        for outpoint, script in data.items():
+            tx_id, index = outpoint.split(":")
+            prevouts[(str(tx_id), int(index))] = str(script)
+
+        return cls(prevouts)
+
+    def get_prev_script(self, tx_id, index):
+        script = self.prevouts.get((tx_id, index))
+
+        if script is None:
+            raise Exception("Unknown prevout " + tx_id + ":" + str(index) + ".")
+
+        return script, get_script_type(script)
+
+
+class CachedProvider(PrevoutProvider):
+    """ Puts a least recently used (LRU) cache in front of a given provider, so each prevout is only requested once.
+    """
+
+    def __init__(self, provider, max_size=2**16):
+        self.provider = provider
+        self.cache = LRUCache(max_size)
+
+    def get_prev_script(self, tx_id, index):
+        prevout = self.cache.get((tx_id, index))
+
+        if prevout is None:
+            prevout = self.provider.get_prev_script(tx_id, index)
+            self.cache.put((tx_id, index), prevout)
+
+        return prevout
+
+    def prefetch(self, outpoints):
+        self.provider.prefetch([outpoint for outpoint in outpoints if outpoint not in self.cache])
+
+
+class PooledHTTPProvider(PrevoutProvider):
+    """ Gets prevouts by querying blockcypher's API (or any server exposing the same interface), resolving several
+    transactions concurrently. Queries are performed by a bounded number of worker threads, each one of them reusing a
+    keep-alive connection, failed queries are retried with an exponential backoff and, optionally, responses are
+    stored on disk (one file per transaction id) so they are never queried twice.
+    """
+
+    def __init__(self, network='test', max_connections=8, retries=3, backoff=0.5, timeout=30, cache_dir=None,
+                 base_url=None):
+        """ Creates a provider for a given network.
+
+        :param network: Network to query (either main or test). Ignored if base_url is set.
+        :type network: str
+        :param max_connections: Maximum number of concurrent queries (and therefore of open connections).
+        :type max_connections: int
+        :param retries: Number of times a failed query is retried (server errors, rate limiting and dropped
+        connections are retried, while client errors are not).
+        :type retries: int
+        :param backoff: Seconds waited before the first retry of a query, doubled for every following one.
+        :type backoff: float
+        :param timeout: Timeout of each query, in seconds.
+        :type timeout: float
+        :param cache_dir: Directory where responses are stored (created if it does not exist), or None to keep them
+        only in memory.
+        :type cache_dir: str
+        :param base_url: URL transaction ids are appended to, for servers other than blockcypher's API.
+        :type base_url: str
+        """
+
+        if base_url is None:
+            if network in ['main', 'mainnet']:
+                base_url = "https://api.blockcypher.com/v1/btc/main/txs/"
+            elif network in ['test', 'testnet']:
+                base_url = "https://api.blockcypher.com/v1/btc/test3/txs/"
+            else:
+                raise Exception("Bad network.")
+
+        self.url = urlparse(base_url)
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+
+        if cache_dir is not None and not path.isdir(cache_dir):
+            makedirs(cache_dir)
+
+        # Outputs of the already resolved transactions, as (script, type) lists.
+        self.outputs = dict()
+        self.lock = Lock()
+
+    def get_prev_script(self, tx_id, index):
+        if tx_id not in self.outputs:
+            self.fetch([tx_id])
+
+        return self.outputs[tx_id][index]
+
+    def prefetch(self, outpoints):
+        self.fetch([tx_id for tx_id, _ in outpoints])
+
+    def fetch(self, tx_ids):
+        """ Resolves the outputs of a list of transactions, querying concurrently the ones that are neither in memory nor
+        on disk.
+
+        :param tx_ids: Transaction ids to be resolved.
+        :type tx_ids: list of hex str
+        :return: None.
+        :rtype: None
+        """
+
+        queue = Queue()
+        for tx_id in set(tx_ids):
+            if tx_id not in self.outputs and not self._load(tx_id):
+                queue.put(tx_id)
+
+        if queue.empty():
+            return
+
+        errors = []
+        workers = [Thread(target=self._worker, args=(queue, errors)) for _ in range(min(self.max_connections,
+                                                                                          queue.qsize()))]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        if errors:
+            raise Exception("Prevouts could not be fetched: " + "; ".join(errors))
+
+    def _connect(self):
+        from httplib import HTTPConnection, HTTPSConnection
+
+        if self.url.scheme == "https":
+            return HTTPSConnection(self.url.netloc, timeout=self.timeout)
+        else:
+            return HTTPConnection(self.url.netloc, timeout=self.timeout)
+
+    def _worker(self, queue, errors):
+        conn = self._connect()
+
+        while True:
+            try:
+                tx_id = queue.get_nowait()
+            except Empty:
+                break
+
+            for attempt in range(self.retries + 1):
+                try:
+                    conn.request("GET", self.url.path + tx_id, headers={"User-agent": "Mozilla/5.0"})
+                    r = conn.getresponse()
+                    data = r.read()
+                except Exception as e:
+                    # The connection may have been dropped by the server, so a new one is used for the next attempt.
+                    conn.close()
+                    conn = self._connect()
+                    error = str(e)
+                else:
+                    if r.status == 200:
+                        try:
+                            self._store(tx_id, data)
+                        except Exception as e:
+                            error = "bad response: " + str(e)
+                        break
+
+                    error = "HTTP " + str(r.status)
+                    # Client errors (but rate limiting) won't be solved by retrying.
+                    if 400 <= r.status < 500 and r.status != 429:
+                        break
+
+                if attempt < self.retries:
+                    sleep(self.backoff * 2 ** attempt)
+
+            if tx_id not in self.outputs:
+                with self.lock:
+                    errors.append(tx_id + " (" + error + ")")
+
+        conn.close()
+
+    def _load(self, tx_id):
+        """ Loads the outputs of a transaction from the on-disk cache (if any).
+
+        :param tx_id: Transaction id to be loaded.
+        :type tx_id: hex str
+        :return: Whether the transaction was found on disk or not.
+        :rtype: bool
+        """
+
+        if self.cache_dir is None or not path.exists(path.join(self.cache_dir, tx_id + ".json")):
+            return False
+
+        fin = open(path.join(self.cache_dir, tx_id + ".json"), 'r')
+        self._parse(tx_id, fin.read())
+        fin.close()
+
+        return True
+
+    def _store(self, tx_id, data):
+        """ Parses a response and stores it both in memory and in the on-disk cache (if set).
+
+        :param tx_id: Transaction id of the response.
+        :type tx_id: hex str
+        :param data: Response body (json).
+        :type data: str
+        :return: None.
+        :rtype: None
+        """
+
+        self._parse(tx_id, data)
+
+        if self.cache_dir is not None:
+            # Responses are written to a temporary file first, so a partially written one is never loaded.
+            fout_name = path.join(self.cache_dir, tx_id + ".json")
+            fout = open(fout_name + ".tmp", 'w')
+            fout.write(data)
+            fout.close()
+            rename(fout_name + ".tmp", fout_name)
+
+    def _parse(self, tx_id, data):
+        scripts = [str(o.get('script')) for o in loads(data).get('outputs')]
+        outputs = [(script, get_script_type(script)) for script in scripts]
+
+        with self.lock:
+            self.outputs[tx_id] = outputs
+
+
+# Providers used when no provider is explicitly given, one per network.
+_default_providers = dict()
+
+
+def get_default_provider(network='test'):
+    """ Gets the default prevout provider of a given network. Unless set otherwise, blockcypher's API (behind a cache)
+    is used.
+
+    :param network: Network of the provider (either main or test).
+    :type network: str
+    :return: The default provider.
+    :rtype: PrevoutProvider
+    """
+
+    network = _normalize_network(network)
+
+    if network not in _default_providers:
+        _default_providers[network] = CachedProvider(BlockcypherProvider(network))
+
+    return _default_providers[network]
+
+
+def set_default_provider(provider, network='test'):
+    """ Sets the default prevout provider of a given network (e.g. to sign without relying on third parties).
+
+    :param provider: The provider to be used by default.
+    :type provider: PrevoutProvider
+    :param network: Network of the provider (either main or test).
+    :type network: str
+    :return: None.
+    :rtype: None
+    """
+
+    _default_providers[_normalize_network(network)] = provider
+
+
+def _normalize_network(network):
+    """ Normalizes the name of a network, so mainnet/main and testnet/test refer to the same one.
+
+    :param network: Network name.
+    :type network: str
+    :return: The normalized network name.
+    :rtype: str
+    """
+
+    if network in ['main', 'mainnet']:
+        network = 'main'
+    elif network in ['test', 'testnet']:
+        network = 'test'
+
+    return network
+
@@ -1,9 +1,30 @@
 from bitcoin_tools.wallet import btc_addr_to_hash_160
 from bitcoin_tools.utils import check_public_key, check_signature, check_address
+from bitcoin_tools.core.script_types import get_script_type
 from abc import ABCMeta, abstractmethod
 from binascii import unhexlify, hexlify
+from struct import pack, unpack_from
 from bitcoin.core.script import *
 
+# Opcode name to byte table, used to assemble scripts. OP_FALSE, OP_TRUE and OP_INVALIDOPCODE are not part of
+# python-bitcoinlib's OPCODES_BY_NAME, so they are added explicitly. Small integers are accepted as written by
+# Script.deserialize ("0" to "16") as well.
+_OPCODES_BY_NAME = dict((name, int(op)) for name, op in OPCODES_BY_NAME.items())
+_OPCODES_BY_NAME.update({"OP_FALSE": int(OP_FALSE), "OP_TRUE": int(OP_TRUE), "OP_INVALIDOPCODE": int(OP_INVALIDOPCODE)})
+_OPCODES_BY_NAME.update((str(n), int(CScriptOp.encode_op_n(n))) for n in range(17))
+
+# Byte to opcode name table, used to disassemble scripts. Push opcodes (0x01 to OP_PUSHDATA4) are parsed on their own,
+# so they have no name.
+_OPCODE_NAMES = []
+for _op in range(256):
+    if _op == OP_0 or OP_1 <= _op <= OP_16:
+        _OPCODE_NAMES.append(str(CScriptOp(_op).decode_op_n()))
+    elif _op <= OP_PUSHDATA4:
+        _OPCODE_NAMES.append(None)
+    else:
+        _OPCODE_NAMES.append(OPCODE_NAMES.get(CScriptOp(_op), "CScriptOp(0x%02x)" % _op))
+del _op
+
 
 class Script:
     """ Defines the class Script which includes two subclasses, InputScript and OutputScript. Every script type have two
@@ -17,6 +38,10 @@ class Script:
         self.content = ""
         self.type = "unknown"
 
+        # Tokenized content (see get_elements), together with the content it was computed from.
+        self._elements = None
+        self._elements_content = None
+
     @classmethod
     def from_hex(cls, hex_script):
         """ Builds a script from a serialized one (it's hexadecimal representation).
@@ -50,6 +75,78 @@ class Script:
 
         return script
 
+    @staticmethod
+    def parse(script):
+        """ Parses a serialized script into (opcode, data) pairs. Data is only set for data pushes (including OP_0, that
+        pushes an empty string), and None otherwise. If a data push exceeds the script length, the script is parsed up
+        to that point and a (None, None) pair is appended.
+
+        :param script: Serialized script to be parsed.
+        :type script: hex str
+        :return: The opcodes of the script, together with the data they push.
+        :rtype: list of tuple
+        """
+
+        raw = unhexlify(script)
+        b = bytearray(raw)
+        l = len(b)
+        ops = []
+
+        i = 0
+        while i < l:
+            op = b[i]
+            i += 1
+
+            if op <= OP_PUSHDATA4:
+                # Data pushes are either implicit (the opcode is the data length) or prefixed with a 1, 2 or 4-byte
+                # little endian length (OP_PUSHDATA1, OP_PUSHDATA2 and OP_PUSHDATA4 respectively).
+                if op < OP_PUSHDATA1:
+                    size = op
+                else:
+                    fmt, n = {OP_PUSHDATA1: ("<B", 1), OP_PUSHDATA2: ("<H", 2), OP_PUSHDATA4: ("<I", 4)}[op]
+                    if i + n > l:
+                        ops.append((None, None))
+                        break
+                    size = unpack_from(fmt, raw, i)[0]
+                    i += n
+
+                if i + size > l:
+                    ops.append((None, None))
+                    break
+
+                ops.append((op, raw[i:i + size]))
+                i += size
+            else:
+                ops.append((op, None))
+
+        return ops
+
+    @staticmethod
+    def tokenize(script):
+        """ Splits a serialized script into its elements, in human readable form. Data is escaped between '<' '>', while
+        small integers (OP_0 to OP_16) are written as numbers. If a data push exceeds the script length, the script is
+        tokenized up to that point and an "[error]" element is appended.
+
+        e.g: tokenize('76a914b34bbaac4e9606c9a8a6a720acaf3018c9bc77c988ac') = ['OP_DUP', 'OP_HASH160',
+            '<b34bbaac4e9606c9a8a6a720acaf3018c9bc77c9>', 'OP_EQUALVERIFY', 'OP_CHECKSIG']
+
+        :param script: Serialized script to be tokenized.
+        :type script: hex str
+        :return: The elements of the script.
+        :rtype: list of str
+        """
+
+        elements = []
+        for op, data in Script.parse(script):
+            if op is None:
+                elements.append("[error]")
+            elif OP_0 < op <= OP_PUSHDATA4:
+                elements.append("<" + hexlify(data) + ">")
+            else:
+                elements.append(_OPCODE_NAMES[op])
+
+        return elements
+
     @staticmethod
     def deserialize(script):
         """ Deserializes a serialized script (goes from hex to human).
@@ -63,18 +160,7 @@ class Script:
         :rtype: hex str
         """
 
-        start = "CScript(["
-        end = "])"
-
-        ps = CScript(unhexlify(script)).__repr__()
-        ps = ps[ps.index(start) + len(start): ps.index(end)].split(", ")
-
-        for i in range(len(ps)):
-            if ps[i].startswith('x('):
-                ps[i] = ps[i][3:-2]
-                ps[i] = '<' + ps[i] + '>'
-
-        return " ".join(ps)
+        return " ".join(Script.tokenize(script))
 
     @staticmethod
     def serialize(data):
@@ -85,16 +171,30 @@ class Script:
         :rtype: hex str
         """
 
-        hex_string = ""
-        for e in data.split(" "):
+        hex_string = []
+        for e in data.split():
             if e[0] == "<" and e[-1] == ">":
-                hex_string += hexlify(CScriptOp.encode_op_pushdata(unhexlify(e[1:-1])))
-            elif eval(e) in OPCODE_NAMES:
-                hex_string += format(eval(e), '02x')
+                hex_string.append(encode_pushdata(e[1:-1]))
+            elif e in _OPCODES_BY_NAME:
+                hex_string.append(format(_OPCODES_BY_NAME[e], '02x'))
             else:
-                raise Exception
+                raise Exception("Unknown opcode: " + e)
+
+        return "".join(hex_string)
 
-        return hex_string
+    def get_elements(self):
+        """ Returns the elements of the script (see tokenize). The script is only tokenized once (as long as its content
+        is not modified), so the returned list must not be modified.
+
+        :return: The elements of the script.
+        :rtype: list of str
+        """
+
+        if self._elements is None or self._elements_content != self.content:
+            self._elements = Script.tokenize(self.content)
+            self._elements_content = self.content
+
+        return self._elements
 
     def get_element(self, i):
         """
@@ -105,8 +205,7 @@ class Script:
         :rtype: str
         """
 
-        return Script.deserialize(self.content).split()[i]
-
+        return self.get_elements()[i]
 
     @abstractmethod
     def P2PK(self):
@@ -218,6 +317,22 @@ class OutputScript(Script):
     """ Defines an OutputScript (ScriptPubKey) class that inherits from script.
     """
 
+    @classmethod
+    def from_hex(cls, hex_script):
+        """ Builds an OutputScript from a serialized one (it's hexadecimal representation). The type of the script is
+        set by matching it against the standard output templates (see script_types.match_script).
+
+        :param hex_script: Serialized script.
+        :type hex_script: hex str
+        :return: OutputScript object with the serialized script as it's content.
+        :rtype OutputScript
+        """
+
+        script = super(OutputScript, cls).from_hex(hex_script)
+        script.type = get_script_type(hex_script)
+
+        return script
+
     @classmethod
     def P2PK(cls, pk):
         """ Pay-to-PubKey template 'constructor'. Builds a P2PK OutputScript from a given public key.
@@ -314,3 +429,29 @@ class OutputScript(Script):
             script.content = script.serialize("OP_HASH160 <" + script_hash + "> OP_EQUAL")
 
         return script
+
+
+def encode_pushdata(data):
+    """ Encodes the push of a given piece of data into a script, using the same opcodes python-bitcoinlib does (the
+    data length as opcode for up to 75 bytes, and OP_PUSHDATA1, OP_PUSHDATA2 or OP_PUSHDATA4 otherwise).
+
+    :param data: Data to be pushed.
+    :type data: hex str
+    :return: The serialized push (opcode, length if needed, and data).
+    :rtype: hex str
+    """
+
+    # Data is checked to be hex encoded (and normalized to lowercase) by going back and forth.
+    data = hexlify(unhexlify(data))
+    size = len(data) / 2
+
+    if size < OP_PUSHDATA1:
+        prefix = pack("<B", size)
+    elif size <= 0xff:
+        prefix = pack("<BB", OP_PUSHDATA1, size)
+    elif size <= 0xffff:
+        prefix = pack("<BH", OP_PUSHDATA2, size)
+    else:
+        prefix = pack("<BI", OP_PUSHDATA4, size)
+
+    return hexlify(prefix) + data
@@ -0,0 +1,177 @@
+from binascii import unhexlify
+
+# Script types, identified by a code (used by the batch matcher) and a name (used by Script.type).
+NONSTANDARD, P2PK, P2PKH, P2SH, P2MS, P2WPKH, P2WSH, P2TR, OP_RETURN = range(9)
+TYPE_NAMES = ["unknown", "P2PK", "P2PKH", "P2SH", "P2MS", "P2WPKH", "P2WSH", "P2TR", "OP_RETURN"]
+
+# Opcodes used by the templates.
+_OP_0 = 0x00
+_OP_1 = 0x51
+_OP_16 = 0x60
+_OP_RETURN = 0x6a
+_OP_DUP = 0x76
+_OP_EQUAL = 0x87
+_OP_EQUALVERIFY = 0x88
+_OP_HASH160 = 0xa9
+_OP_CHECKSIG = 0xac
+_OP_CHECKMULTISIG = 0xae
+
+
+def _is_pk(b, i):
+    """ Checks whether the data pushed at a given position of a script is a public key (or at least if it is formatted
+    as if it is), that is, a 33-byte key with 02/03 prefix or a 65-byte key with 04/06/07 prefix.
+
+    :param b: Serialized script.
+    :type b: bytearray
+    :param i: Position of the push opcode.
+    :type i: int
+    :return: True if a public key is pushed at i, False otherwise.
+    :rtype: bool
+    """
+
+    if b[i] == 33:
+        return i + 34 <= len(b) and b[i + 1] in (2, 3)
+    elif b[i] == 65:
+        return i + 66 <= len(b) and b[i + 1] in (4, 6, 7)
+    else:
+        return False
+
+
+def _match(b):
+    """ Matches a serialized script against the standard output templates.
+
+    :param b: Serialized script.
+    :type b: bytearray
+    :return: The type code of the script, together with m and n for m-of-n multisig scripts (0 otherwise).
+    :rtype: int, int, int
+    """
+
+    l = len(b)
+
+    if l == 25 and b[0] == _OP_DUP and b[1] == _OP_HASH160 and b[2] == 20 and b[23] == _OP_EQUALVERIFY and \
+            b[24] == _OP_CHECKSIG:
+        return P2PKH, 0, 0
+    elif l == 23 and b[0] == _OP_HASH160 and b[1] == 20 and b[22] == _OP_EQUAL:
+        return P2SH, 0, 0
+    elif l == 22 and b[0] == _OP_0 and b[1] == 20:
+        return P2WPKH, 0, 0
+    elif l == 34 and b[0] == _OP_0 and b[1] == 32:
+        return P2WSH, 0, 0
+    elif l == 34 and b[0] == _OP_1 and b[1] == 32:
+        return P2TR, 0, 0
+    elif l in (35, 67) and b[0] == l - 2 and _is_pk(b, 0) and b[-1] == _OP_CHECKSIG:
+        return P2PK, 0, 0
+    elif l > 0 and b[0] == _OP_RETURN:
+        return OP_RETURN, 0, 0
+    elif l > 3 and _OP_1 <= b[0] <= _OP_16 and _OP_1 <= b[-2] <= _OP_16 and b[-1] == _OP_CHECKMULTISIG:
+        # OP_m <pk_1> ... <pk_n> OP_n OP_CHECKMULTISIG, with exactly n keys and m <= n.
+        m, n = b[0] - _OP_1 + 1, b[-2] - _OP_1 + 1
+        i, keys = 1, 0
+        while i < l - 2 and _is_pk(b, i):
+            i += b[i] + 1
+            keys += 1
+        if i == l - 2 and keys == n and m <= n:
+            return P2MS, m, n
+
+    return NONSTANDARD, 0, 0
+
+
+def match_script(script):
+    """ Matches a ScriptPubKey against the standard output templates (P2PK, P2PKH, P2SH, P2MS, P2WPKH, P2WSH, P2TR and
+    OP_RETURN). Scripts matching none of them are nonstandard (unknown).
+
+    :param script: ScriptPubKey.
+    :type script: hex str
+    :return: The script type, together with m and n for m-of-n multisig scripts (None otherwise).
+    :rtype: str, int, int
+    """
+
+    t, m, n = _match(bytearray(unhexlify(script)))
+
+    if t == P2MS:
+        return TYPE_NAMES[t], m, n
+    else:
+        return TYPE_NAMES[t], None, None
+
+
+def get_script_type(script):
+    """ Gets the type of a given ScriptPubKey (see match_script).
+
+    :param script: ScriptPubKey.
+    :type script: hex str
+    :return: The script type (P2PK, P2PKH, P2SH, P2MS, P2WPKH, P2WSH, P2TR, OP_RETURN or unknown).
+    :rtype: str
+    """
+
+    return TYPE_NAMES[_match(bytearray(unhexlify(script)))[0]]
+
+
+def to_blob(scripts):
+    """ Packs a list of ScriptPubKeys into a single byte array (blob) plus the offset where each one of them starts,
+    as expected by match_scripts.
+
+    :param scripts: ScriptPubKeys to be packed.
+    :type scripts: list of hex str
+    :return: The packed scripts and their offsets (len(scripts) + 1 of them, the last one being the blob size).
+    :rtype: numpy.ndarray, numpy.ndarray
+    """
+
+    import numpy as np
+
+    raw = [unhexlify(s) for s in scripts]
+    offsets = np.zeros(len(raw) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in raw], out=offsets[1:])
+
+    return np.frombuffer("".join(raw), dtype=np.uint8), offsets
+
+
+def match_scripts(blob, offsets):
+    """ Batch version of match_script, over scripts packed in a single byte array (see to_blob). Fixed size templates
+    are matched vectorially, while only the scripts that may be multisig are matched one by one.
+
+    :param blob: Packed scripts.
+    :type blob: numpy.ndarray of uint8
+    :param offsets: Offset of each script in the blob (plus the blob size as last element).
+    :type offsets: numpy.ndarray of int
+    :return: The type code of each script (see TYPE_NAMES), together with m and n (0 for non multisig scripts).
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
+
+    import numpy as np
+
+    starts = np.asarray(offsets[:-1], dtype=np.int64)
+    ends = np.asarray(offsets[1:], dtype=np.int64)
+    lengths = ends - starts
+
+    # The blob is padded so bytes can be read at any position of every script (the mask on the length of each script
+    # tells whether the read is meaningful or not).
+    padded = np.concatenate([np.asarray(blob, dtype=np.uint8), np.zeros(67, dtype=np.uint8)])
+    first = [padded[starts + k] for k in range(3)]
+    last = [padded[np.maximum(ends - 1 - k, 0)] for k in range(2)]
+    nonempty = lengths > 0
+
+    types = np.full(len(starts), NONSTANDARD, dtype=np.uint8)
+    m = np.zeros(len(starts), dtype=np.uint8)
+    n = np.zeros(len(starts), dtype=np.uint8)
+
+    templates = [
+        (P2PKH, (lengths == 25) & (first[0] == _OP_DUP) & (first[1] == _OP_HASH160) & (first[2] == 20) &
+         (last[1] == _OP_EQUALVERIFY) & (last[0] == _OP_CHECKSIG)),
+        (P2SH, (lengths == 23) & (first[0] == _OP_HASH160) & (first[1] == 20) & (last[0] == _OP_EQUAL)),
+        (P2WPKH, (lengths == 22) & (first[0] == _OP_0) & (first[1] == 20)),
+        (P2WSH, (lengths == 34) & (first[0] == _OP_0) & (first[1] == 32)),
+        (P2TR, (lengths == 34) & (first[0] == _OP_1) & (first[1] == 32)),
+        (P2PK, (((lengths == 35) & (first[0] == 33) & np.in1d(first[1], [2, 3])) |
+                ((lengths == 67) & (first[0] == 65) & np.in1d(first[1], [4, 6, 7]))) & (last[0] == _OP_CHECKSIG)),
+        (OP_RETURN, nonempty & (first[0] == _OP_RETURN))]
+
+    for t, mask in templates:
+        types[mask] = t
+
+    # Multisig scripts have variable structure, so candidates are checked one by one.
+    candidates = np.nonzero((lengths > 3) & (first[0] >= _OP_1) & (first[0] <= _OP_16) & (last[1] >= _OP_1) &
+                            (last[1] <= _OP_16) & (last[0] == _OP_CHECKMULTISIG))[0]
+    for i in candidates:
+        types[i], m[i], n[i] = _match(bytearray(padded[starts[i]:ends[i]].tostring()))
+
+    return types, m, n
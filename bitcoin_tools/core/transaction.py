@@ -1,12 +1,13 @@
 from binascii import unhexlify, hexlify
-from copy import deepcopy
 from hashlib import sha256
 from ecdsa import SigningKey
-from bitcoin_tools.core.keys import serialize_pk, ecdsa_tx_sign
+from bitcoin_tools.core.keys import serialize_pk, ecdsa_tx_sign, ecdsa_tx_sign_batch, tx_sighash, ecdsa_verify_batch
 from bitcoin_tools.core.script import InputScript, OutputScript, Script, SIGHASH_ALL, SIGHASH_SINGLE, SIGHASH_NONE, \
     SIGHASH_ANYONECANPAY
+from bitcoin_tools.wallet import hash_160
 from bitcoin_tools.utils import change_endianness, encode_varint, int2bytes, is_public_key, is_btc_addr, is_script, \
-    parse_element, parse_varint, get_prev_ScriptPubKey, decode_varint
+    parse_element, parse_varint, decode_varint
+from bitcoin_tools.core.prevouts import get_default_provider
 
 
 class TX:
@@ -31,6 +32,9 @@ class TX:
         self.offset = 0
         self.hex = ""
 
+        # Buffer reused by signature_preimage to build the data to be signed for each input.
+        self._preimage = []
+
     @classmethod
     def build_from_hex(cls, hex_tx):
         """
@@ -200,7 +204,7 @@ class TX:
             else:
                 raise Exception("Bad output")
 
-            outs.append(deepcopy(oscript))
+            outs.append(oscript)
 
         for i in range(len(prev_tx_id)):
             # Temporarily set IS content to 0, since data will be signed afterwards.
@@ -330,7 +334,8 @@ class TX:
 
         return tx_id
 
-    def sign(self, sk, index, hashflag=SIGHASH_ALL, compressed=True, orphan=False, deterministic=True, network='test'):
+    def sign(self, sk, index, hashflag=SIGHASH_ALL, compressed=True, orphan=False, deterministic=True, network='test',
+             provider=None):
         """ Signs a transaction using the provided private key(s), index(es) and hash type. If more than one key and index
         is provides, key i will sign the ith input of the transaction.
 
@@ -353,6 +358,9 @@ class TX:
         :type deterministic: bool
         :param network: Network from which the previous ScripPubKey will be queried (either main or test).
         :type network: str
+        :param provider: Provider from which the previous ScriptPubKeys are obtained. The default provider of the network
+        is used if none is given (see core.prevouts).
+        :type provider: PrevoutProvider
         :return: Transaction signature.
         :rtype: str
         """
@@ -366,34 +374,28 @@ class TX:
         if isinstance(index, int):
             index = [index]
 
+        # Let the provider know which prevouts will be requested, so it can get them all at once.
+        if provider is None:
+            provider = get_default_provider(network)
+        provider.prefetch([(self.prev_tx_id[index[i]], self.prev_out_index[index[i]]) for i in range(len(sk))
+                           if not orphan or orphan.get(i) is None])
+
         for i in range(len(sk)):
 
-            # If the input to be signed is orphan, the OutputScript of the UTXO to be redeemed will be passed to
-            # the signature_format function, otherwise False is passed and the UTXO will be requested afterwards.
+            # If the input to be signed is orphan, the OutputScript of the UTXO to be redeemed will be used, otherwise
+            # the UTXO will be requested.
             o = orphan if not orphan else orphan.get(i)
+            prev_script = self._get_prev_script(index[i], o, network, provider)
             # The unsigned transaction is formatted depending on the input that is going to be signed. For input i,
             # the ScriptSig[i] will be set to the scriptPubKey of the UTXO that input i tries to redeem, while all
-            # the other inputs will be set blank.
-            unsigned_tx = self.signature_format(index[i], hashflag, o, network)
+            # the other inputs will be set blank. The preimage is built once, no matter how many keys sign it.
+            unsigned_tx = self.signature_preimage(index[i], prev_script, hashflag)
 
             # Then, depending on the format how the private keys have been passed to the signing function
-            # and the content of the ScripSig field, a different final scriptSig will be created.
-            if isinstance(sk[i], list) and unsigned_tx.scriptSig[index[i]].type is "P2MS":
-                sigs = []
-                for k in sk[i]:
-                    sigs.append(ecdsa_tx_sign(unsigned_tx.serialize(), k, hashflag, deterministic))
-                iscript = InputScript.P2MS(sigs)
-            elif isinstance(sk[i], SigningKey) and unsigned_tx.scriptSig[index[i]].type is "P2PK":
-                s = ecdsa_tx_sign(unsigned_tx.serialize(), sk[i], hashflag, deterministic)
-                iscript = InputScript.P2PK(s)
-            elif isinstance(sk[i], SigningKey) and unsigned_tx.scriptSig[index[i]].type is "P2PKH":
-                s = ecdsa_tx_sign(unsigned_tx.serialize(), sk[i], hashflag, deterministic)
-                pk = serialize_pk(sk[i].get_verifying_key(), compressed)
-                iscript = InputScript.P2PKH(s, pk)
-            elif unsigned_tx.scriptSig[index[i]].type is "unknown":
-                raise Exception("Unknown previous transaction output script type. Can't sign the transaction.")
-            else:
-                raise Exception("Can't sign input " + str(i) + " with the provided data.")
+            # and the type of the previous ScriptPubKey, a different final scriptSig will be created.
+            keys = self._get_signing_keys(sk[i], prev_script, i)
+            sigs = [ecdsa_tx_sign(unsigned_tx, k, hashflag, deterministic) for k in keys]
+            iscript = self._build_scriptSig(prev_script, keys, sigs, compressed)
 
             # Finally, temporal scripts are stored as final and the length of the script is computed
             self.scriptSig[i] = iscript
@@ -401,7 +403,200 @@ class TX:
 
         self.hex = self.serialize()
 
-    def signature_format(self, index, hashflag=SIGHASH_ALL, orphan=False, network='test'):
+    @staticmethod
+    def _get_signing_keys(sk, prev_script, i):
+        """ Checks that the provided private key(s) can sign an input redeeming a given script, and returns them as a
+        list.
+
+        :param sk: Private key (or list of private keys for multisig) that will sign the input.
+        :type sk: SigningKey or list of SigningKey
+        :param prev_script: Script of the UTXO that the input is trying to redeem.
+        :type prev_script: Script
+        :param i: Index of the input (used for error reporting).
+        :type i: int
+        :return: The list of keys that will sign the input.
+        :rtype: list of SigningKey
+        """
+
+        if isinstance(sk, list) and prev_script.type is "P2MS":
+            keys = sk
+        elif isinstance(sk, SigningKey) and prev_script.type in ["P2PK", "P2PKH"]:
+            keys = [sk]
+        elif prev_script.type is "unknown":
+            raise Exception("Unknown previous transaction output script type. Can't sign the transaction.")
+        else:
+            raise Exception("Can't sign input " + str(i) + " with the provided data.")
+
+        return keys
+
+    @staticmethod
+    def _build_scriptSig(prev_script, keys, sigs, compressed=True):
+        """ Builds the final scriptSig of an input from the signatures performed by the given keys.
+
+        :param prev_script: Script of the UTXO that the input is trying to redeem.
+        :type prev_script: Script
+        :param keys: Keys that have signed the input (from _get_signing_keys).
+        :type keys: list of SigningKey
+        :param sigs: Signatures performed by each one of the keys.
+        :type sigs: list of hex str
+        :param compressed: Indicates if the public key that goes along with the signature will be compressed or not.
+        :type compressed: bool
+        :return: The scriptSig that redeems the UTXO.
+        :rtype: InputScript
+        """
+
+        if prev_script.type is "P2MS":
+            iscript = InputScript.P2MS(sigs)
+        elif prev_script.type is "P2PK":
+            iscript = InputScript.P2PK(sigs[0])
+        else:
+            pk = serialize_pk(keys[0].get_verifying_key(), compressed)
+            iscript = InputScript.P2PKH(sigs[0], pk)
+
+        return iscript
+
+    def verify(self, index, prev_script):
+        """ Verifies the signature(s) of a given input (see verify_batch).
+
+        :param index: The index of the input to be verified.
+        :type index: int
+        :param prev_script: Script of the UTXO that the input is redeeming.
+        :type prev_script: OutputScript
+        :return: Whether the input signatures are valid or not.
+        :rtype: bool
+        """
+
+        return verify_batch([(self, index, prev_script)], processes=1)[0]
+
+    def _get_signatures(self, index, prev_script):
+        """ Extracts the signatures of a given input together with the public keys they should be checked against.
+
+        :param index: The index of the input.
+        :type index: int
+        :param prev_script: Script of the UTXO that the input is redeeming.
+        :type prev_script: OutputScript
+        :return: The signatures, the public keys (in the order they have to be matched) and the number of required
+        signatures.
+        :rtype: list of hex str, list of hex str, int
+        """
+
+        # Data elements are unescaped, while OP_CODES are left as they are.
+        script_sig = [e.strip("<>") for e in self.scriptSig[index].get_elements()]
+        script_pk = [e.strip("<>") for e in prev_script.get_elements()]
+
+        if len(script_pk) == 2 and script_pk[1] == "OP_CHECKSIG":
+            # P2PK: <sig>
+            sigs, pks, m = script_sig, script_pk[:1], 1
+        elif len(script_pk) == 5 and script_pk[:2] == ["OP_DUP", "OP_HASH160"] and script_pk[3:] == \
+                ["OP_EQUALVERIFY", "OP_CHECKSIG"]:
+            # P2PKH: <sig> <pk>. The public key must match the hash160 of the UTXO, otherwise no key is matched.
+            sigs, pks, m = script_sig[:1], script_sig[1:2], 1
+            if len(script_sig) != 2 or hexlify(hash_160(script_sig[1])) != script_pk[2]:
+                pks = []
+        elif len(script_pk) > 3 and script_pk[-1] == "OP_CHECKMULTISIG":
+            # P2MS: OP_0 <sig_1> ... <sig_m>
+            sigs, pks, m = script_sig[1:], script_pk[1:-2], int(script_pk[0].replace("OP_", ""))
+        else:
+            raise Exception("Can't verify input " + str(index) + ", only P2PK, P2PKH and P2MS inputs are supported.")
+
+        return sigs, pks, m
+
+    def _get_prev_script(self, index, orphan=False, network='test', provider=None):
+        """ Gets the script of the UTXO that a given input is trying to redeem. The script is either the one provided
+        as orphan or, if none is provided, the one obtained from the prevout provider.
+
+        :param index: The index of the input.
+        :type index: int
+        :param orphan: Whether the input is orphan or not. Orphan inputs must provide an OutputScript that matches the
+        utxo to be redeemed.
+        :type orphan: OutputScript
+        :param network: Network from which the previous ScripPubKey will be queried (either main or test).
+        :type network: str
+        :param provider: Provider from which the previous ScriptPubKey is obtained (the default one of the network if
+        none is given).
+        :type provider: PrevoutProvider
+        :return: The script of the UTXO to be redeemed, with its type set.
+        :rtype: Script
+        """
+
+        if not orphan:
+            if provider is None:
+                provider = get_default_provider(network)
+            script, t = provider.get_prev_script(self.prev_tx_id[index], self.prev_out_index[index])
+            prev_script = InputScript.from_hex(script)
+            prev_script.type = t
+        else:
+            prev_script = orphan
+
+        return prev_script
+
+    def signature_preimage(self, index, prev_script, hashflag=SIGHASH_ALL):
+        """ Builds the serialized data that has to be signed for a given input. The result is the same as serializing
+        the transaction returned by signature_format, but it is written straight from the transaction fields into a
+        reusable buffer, so the transaction is never cloned. Use this one when signing transactions with many inputs.
+
+        :param index: The index of the input to be signed.
+        :type index: int
+        :param prev_script: Script of the UTXO that the input to be signed is trying to redeem.
+        :type prev_script: Script
+        :param hashflag: Hash type to be used, see signature_format for further information.
+        :type hashflag: int
+        :return: Serialized transaction properly formatted to be signed.
+        :rtype: hex str
+        """
+
+        if hashflag is SIGHASH_SINGLE and index >= self.outputs:
+            raise Exception("You are trying to use SIGHASH_SINGLE to sign an input that does not have a "
+                            "corresponding output (" + str(index) + "). This could lead to a irreversible lose "
+                            "of funds. Signature process aborted.")
+
+        p = self._preimage
+        del p[:]
+
+        p.append(change_endianness(int2bytes(self.version, 4)))
+
+        # INPUTS
+        p.append(encode_varint(self.inputs))
+
+        for i in range(self.inputs):
+            p.append(change_endianness(self.prev_tx_id[i]))
+            p.append(change_endianness(int2bytes(self.prev_out_index[i], 4)))
+            if i == index:
+                # The input to be signed carries the script of the UTXO it redeems,
+                p.append(encode_varint(len(prev_script.content) / 2))
+                p.append(prev_script.content)
+            else:
+                # while every other input is left blank.
+                p.append(encode_varint(0))
+            # SIGHASH_SINGLE and SIGHASH_NONE set the nSequence of every other input to 0.
+            if hashflag in [SIGHASH_SINGLE, SIGHASH_NONE] and i != index:
+                p.append(int2bytes(0, 4))
+            else:
+                p.append(int2bytes(self.nSequence[i], 4))
+
+        # OUTPUTS
+        if hashflag is SIGHASH_SINGLE:
+            # Every output before index is blank and holds the maximum value, followed by the output to be signed.
+            p.append(encode_varint(index + 1))
+            p.extend([change_endianness(int2bytes(pow(2, 64) - 1, 8)) + encode_varint(0)] * index)
+            outputs = [index]
+        elif hashflag is SIGHASH_NONE:
+            p.append(encode_varint(0))
+            outputs = []
+        else:
+            p.append(encode_varint(self.outputs))
+            outputs = range(self.outputs)
+
+        for o in outputs:
+            p.append(change_endianness(int2bytes(self.value[o], 8)))
+            p.append(encode_varint(len(self.scriptPubKey[o].content) / 2))
+            p.append(self.scriptPubKey[o].content)
+
+        p.append(int2bytes(self.nLockTime, 4))
+
+        return "".join(p)
+
+    def signature_format(self, index, hashflag=SIGHASH_ALL, orphan=False, network='test', provider=None):
         """ Builds the signature format an unsigned transaction has to follow in order to be signed. Basically empties
         every InputScript field but the one to be signed, identified by index, that will be filled with the OutputScript
         from the UTXO that will be redeemed.
@@ -421,22 +616,18 @@ class TX:
         :type orphan: OutputScript
         :param network: Network into which the transaction will be published (either mainnet or testnet).
         :type network: str
+        :param provider: Provider from which the previous ScriptPubKey is obtained (see sign).
+        :type provider: PrevoutProvider
         :return: Transaction properly formatted to be signed.
         :rtype TX
         """
 
-        tx = deepcopy(self)
+        tx = self._shallow_copy()
         for i in range(tx.inputs):
             if i is index:
-                if not orphan:
-                    script, t = get_prev_ScriptPubKey(tx.prev_tx_id[i], tx.prev_out_index[i], network)
-                    # Once we get the previous UTXO script, the inputScript is temporarily set to it in order to sign
-                    # the transaction.
-                    tx.scriptSig[i] = InputScript.from_hex(script)
-                    tx.scriptSig[i].type = t
-                else:
-                    # If input to be signed is orphan, the orphan InputScript is used when signing the transaction.
-                    tx.scriptSig[i] = orphan
+                # The inputScript is temporarily set to the previous UTXO script (either queried or the orphan one) in
+                # order to sign the transaction.
+                tx.scriptSig[i] = self._get_prev_script(i, orphan, network, provider)
                 tx.scriptSig_len[i] = len(tx.scriptSig[i].content) / 2
             elif tx.scriptSig[i].content != "":
                 # All other scriptSig fields are emptied and their length is set to 0.
@@ -504,6 +695,21 @@ class TX:
 
         return tx
 
+    def _shallow_copy(self):
+        """ Copies the transaction without cloning its scripts. Field lists are copied so they can be modified without
+        affecting the original transaction, while scripts are shared (they are replaced, never modified, when
+        building a signature format).
+
+        :return: A copy of the transaction.
+        :rtype: TX
+        """
+
+        tx = self.__class__()
+        for k, v in self.__dict__.items():
+            setattr(tx, k, list(v) if isinstance(v, list) else v)
+
+        return tx
+
     def display(self):
         """ Displays all the information related to the transaction object, properly split and arranged.
 
@@ -542,3 +748,131 @@ class TX:
             print "\t decoded scriptPubKey: " + Script.deserialize(self.scriptPubKey[i].content)
 
         print "nLockTime: " + str(self.nLockTime) + " (" + int2bytes(self.nLockTime, 4) + ")"
+
+
+def sign_batch(jobs, compressed=True, deterministic=True, network='test', processes=None, provider=None):
+    """ Signs a batch of transaction inputs. The data to be signed is built up front for every job, the ECDSA
+    signatures are spread across a pool of worker processes (see keys.ecdsa_tx_sign_batch) and, finally, the resulting
+    scriptSigs are set to the transactions.
+
+    Jobs are defined as (tx, index, sk, hashflag) or (tx, index, sk, hashflag, orphan), where sk is either a SigningKey
+    or a list of SigningKeys for multisig inputs, and orphan is the OutputScript of the UTXO to be redeemed (see
+    TX.sign). Several jobs may refer to the same transaction.
+
+    :param jobs: List of inputs to be signed.
+    :type jobs: list of tuple
+    :param compressed: Indicates if the public key that goes along with the signature will be compressed or not.
+    :type compressed: bool
+    :param deterministic: Whether the signature is performed using a deterministic k or not. Set by default.
+    :type deterministic: bool
+    :param network: Network from which the previous ScripPubKeys will be queried (either main or test).
+    :type network: str
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
+    :param provider: Provider from which the previous ScriptPubKeys are obtained (see TX.sign).
+    :type provider: PrevoutProvider
+    :return: None.
+    :rtype: None
+    """
+
+    inputs = []
+    sign_jobs = []
+
+    # Let the provider know which prevouts will be requested, so it can get them all at once.
+    if provider is None:
+        provider = get_default_provider(network)
+    provider.prefetch([(job[0].prev_tx_id[job[1]], job[0].prev_out_index[job[1]]) for job in jobs
+                       if len(job) < 5 or not job[4]])
+
+    # Build the data to be signed by every key before setting any scriptSig. Since every other input is left blank in
+    # the signature format, the order in which the inputs are signed does not matter.
+    for job in jobs:
+        tx, index, sk, hashflag = job[:4]
+        orphan = job[4] if len(job) > 4 else False
+
+        prev_script = tx._get_prev_script(index, orphan, network, provider)
+        unsigned_tx = tx.signature_preimage(index, prev_script, hashflag)
+        keys = TX._get_signing_keys(sk, prev_script, index)
+
+        inputs.append((tx, index, prev_script, keys))
+        sign_jobs.extend([(unsigned_tx, k, hashflag) for k in keys])
+
+    sigs = ecdsa_tx_sign_batch(sign_jobs, deterministic, processes)
+
+    # Assemble the scriptSigs from the signatures, that are returned in the same order they were requested.
+    signed_txs = dict()
+    offset = 0
+    for tx, index, prev_script, keys in inputs:
+        iscript = TX._build_scriptSig(prev_script, keys, sigs[offset:offset + len(keys)], compressed)
+        offset += len(keys)
+
+        tx.scriptSig[index] = iscript
+        tx.scriptSig_len[index] = len(iscript.content) / 2
+
+        signed_txs[id(tx)] = tx
+
+    for tx in signed_txs.values():
+        tx.hex = tx.serialize()
+
+
+def verify_batch(jobs, processes=None):
+    """ Verifies the signatures of a batch of transaction inputs (P2PK, P2PKH and P2MS). The data that was signed is
+    rebuilt for every input from the script of the UTXO it redeems (provided locally, nothing is queried), and all the
+    ECDSA verifications are spread across a pool of worker processes (see keys.ecdsa_verify_batch).
+
+    Multisig inputs are verified following OP_CHECKMULTISIG rules, that is, signatures have to be provided in the same
+    order than their public keys.
+
+    :param jobs: List of (tx, index, prev_script) to be verified, where prev_script is the OutputScript of the UTXO
+    redeemed by the index-th input of tx.
+    :type jobs: list of tuple
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
+    :return: Whether each input is valid or not, in the same order than the jobs. Inputs with malformed signatures,
+    or signed with an unsupported hash type, are invalid.
+    :rtype: list of bool
+    """
+
+    inputs = []
+    verify_jobs = []
+
+    for tx, index, prev_script in jobs:
+        sigs, pks, m = tx._get_signatures(index, prev_script)
+
+        # Since signatures are matched in order, the ith signature can only be valid for the ith public key onwards.
+        pairs = dict()
+        sighashes = dict()
+        for i, sig in enumerate(sigs):
+            try:
+                hashflag = int(sig[-2:], 16)
+                if hashflag not in sighashes:
+                    sighashes[hashflag], _ = tx_sighash(tx.signature_preimage(index, prev_script, hashflag), hashflag)
+            except Exception:
+                # Malformed signatures, or signatures whose hash type can not be signed (e.g. SIGHASH_ANYONECANPAY or
+                # SIGHASH_SINGLE without a matching output), are not checked, so they match no public key.
+                continue
+            for j in range(i, len(pks)):
+                pairs[(i, j)] = len(verify_jobs)
+                verify_jobs.append((sighashes[hashflag], sig[:-2], pks[j]))
+
+        inputs.append((len(sigs), len(pks), m, pairs))
+
+    results = ecdsa_verify_batch(verify_jobs, processes)
+
+    valid = []
+    for n_sigs, n_pks, m, pairs in inputs:
+        # Replicates the OP_CHECKMULTISIG matching loop: each signature is checked against the remaining keys, and the
+        # input is invalid as soon as there are more signatures left than keys to check them against.
+        i_sig, i_pk = 0, 0
+        is_valid = n_sigs == m
+        while is_valid and i_sig < n_sigs:
+            if n_sigs - i_sig > n_pks - i_pk:
+                is_valid = False
+            else:
+                if (i_sig, i_pk) in pairs and results[pairs[(i_sig, i_pk)]]:
+                    i_sig += 1
+                i_pk += 1
+
+        valid.append(is_valid)
+
+    return valid
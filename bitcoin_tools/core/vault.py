@@ -0,0 +1,235 @@
+from bitcoin_tools import CFG
+from bitcoin_tools.utils import LRUCache
+
+from binascii import hexlify, unhexlify
+from os import listdir, path
+from shutil import rmtree
+from ecdsa import SigningKey, VerifyingKey, SECP256k1
+import sqlite3
+
+# Name of the vault file, created inside the address vault dir (see CFG.address_vault) by default.
+VAULT_FILE = "vault.db"
+
+
+class KeyVault:
+    """ Defines a key vault stored in a single (SQLite) file, indexed by Bitcoin address. It replaces the directory per
+    address layout of keys.store_keys and wallet.generate_wif, holding the key pair and the WIF of every address.
+
+    Keys are stored serialized (hex), and parsed keys (ecdsa SigningKey and VerifyingKey) are cached, since rebuilding
+    a signing key derives its public key (as costly as a signature).
+    """
+
+    def __init__(self, db_path=None, cache_size=2**16):
+        if db_path is None:
+            db_path = CFG.address_vault + VAULT_FILE
+
+        self.db_path = db_path
+        self._keys = LRUCache(cache_size)
+
+        self.db = sqlite3.connect(db_path)
+        self.db.text_factory = str
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS keys (btc_addr TEXT PRIMARY KEY, sk TEXT NOT NULL, "
+                        "pk TEXT NOT NULL, wif TEXT)")
+        self.db.commit()
+
+    def __contains__(self, btc_addr):
+        return self.db.execute("SELECT 1 FROM keys WHERE btc_addr = ?", (btc_addr,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def close(self):
+        """ Closes the vault file.
+
+        :return: None.
+        :rtype: None
+        """
+
+        self.db.close()
+
+    def store_keys(self, sk, pk, btc_addr):
+        """ Stores an elliptic curve key pair, identified by the Bitcoin address derived from its public key. Existing
+        keys for the same address are replaced (keeping their WIF, if any).
+
+        :param sk: elliptic curve private key.
+        :type sk: SigningKey
+        :param pk: elliptic curve public key.
+        :type pk: VerifyingKey
+        :param btc_addr: Bitcoin address associated to the public key of the key pair.
+        :type btc_addr: str
+        :return: None.
+        :rtype: None
+        """
+
+        self.import_keys([(btc_addr, sk.to_string(), pk.to_string())])
+        self._keys.put(btc_addr, (sk, pk))
+
+    def load_keys(self, btc_addr):
+        """ Loads the elliptic curve key pair of a given Bitcoin address.
+
+        :param btc_addr: Bitcoin address associated to the public key of the key pair.
+        :type btc_addr: str
+        :return: ecdsa key pair as a tuple.
+        :rtype: SigningKey, VerifyingKey
+        """
+
+        keys = self._keys.get(btc_addr)
+
+        if keys is None:
+            row = self.db.execute("SELECT sk, pk FROM keys WHERE btc_addr = ?", (btc_addr,)).fetchone()
+            if row is None:
+                raise Exception("No keys found for address " + btc_addr)
+
+            keys = (SigningKey.from_string(unhexlify(row[0]), curve=SECP256k1),
+                    VerifyingKey.from_string(unhexlify(row[1]), curve=SECP256k1))
+            self._keys.put(btc_addr, keys)
+
+        return keys
+
+    def store_wif(self, btc_addr, wif):
+        """ Stores the WIF of the private key of a given Bitcoin address (whose keys must be already stored).
+
+        :param btc_addr: Bitcoin address associated to the private key.
+        :type btc_addr: str
+        :param wif: WIF representation of the private key (see wallet.sk_to_wif).
+        :type wif: str
+        :return: None.
+        :rtype: None
+        """
+
+        self.store_wifs({btc_addr: wif})
+
+    def store_wifs(self, wifs):
+        """ Bulk version of store_wif. All the WIFs are stored in a single transaction.
+
+        :param wifs: WIF of the private keys, identified by Bitcoin address.
+        :type wifs: dict
+        :return: None.
+        :rtype: None
+        """
+
+        with self.db:
+            for btc_addr, wif in wifs.items():
+                if not self.db.execute("UPDATE keys SET wif = ? WHERE btc_addr = ?", (wif, btc_addr)).rowcount:
+                    raise Exception("No keys found for address " + btc_addr)
+
+    def load_wif(self, btc_addr):
+        """ Loads the WIF of the private key of a given Bitcoin address.
+
+        :param btc_addr: Bitcoin address associated to the private key.
+        :type btc_addr: str
+        :return: The WIF, or None if it has not been stored.
+        :rtype: str
+        """
+
+        row = self.db.execute("SELECT wif FROM keys WHERE btc_addr = ?", (btc_addr,)).fetchone()
+        if row is None:
+            raise Exception("No keys found for address " + btc_addr)
+
+        return row[0]
+
+    def get_addresses(self):
+        """ Gets the Bitcoin addresses whose keys are stored in the vault.
+
+        :return: The stored Bitcoin addresses.
+        :rtype: list of str
+        """
+
+        return [row[0] for row in self.db.execute("SELECT btc_addr FROM keys")]
+
+    def import_keys(self, entries, wifs=None):
+        """ Bulk version of store_keys, over serialized keys. All the keys are stored in a single transaction. Keys
+        already stored for the same address are replaced, while their WIF is only replaced if a new one is given.
+
+        :param entries: Bitcoin address, private key, public key and, optionally, WIF of every key pair (keys serialized
+        as returned by SigningKey.to_string and VerifyingKey.to_string), e.g. as returned by export_keys.
+        :type entries: iterable of (str, bytes, bytes) or (str, bytes, bytes, str)
+        :param wifs: WIF of the private keys, identified by Bitcoin address (optional). They take precedence over the
+        ones in entries.
+        :type wifs: dict
+        :return: None.
+        :rtype: None
+        """
+
+        if wifs is None:
+            wifs = dict()
+
+        rows = [(entry[0], hexlify(entry[1]), hexlify(entry[2]),
+                 wifs.get(entry[0], entry[3] if len(entry) > 3 else None)) for entry in entries]
+
+        with self.db:
+            if sqlite3.sqlite_version_info >= (3, 24, 0):
+                self.db.executemany("INSERT INTO keys (btc_addr, sk, pk, wif) VALUES (?, ?, ?, ?) "
+                                    "ON CONFLICT(btc_addr) DO UPDATE SET sk = excluded.sk, pk = excluded.pk, "
+                                    "wif = COALESCE(excluded.wif, keys.wif)", rows)
+            else:
+                # Older SQLite versions have no UPSERT, so rows are inserted (if new) and then updated.
+                for btc_addr, sk, pk, wif in rows:
+                    self.db.execute("INSERT OR IGNORE INTO keys (btc_addr, sk, pk, wif) VALUES (?, ?, ?, ?)",
+                                    (btc_addr, sk, pk, wif))
+                    self.db.execute("UPDATE keys SET sk = ?, pk = ?, wif = COALESCE(?, wif) WHERE btc_addr = ?",
+                                    (sk, pk, wif, btc_addr))
+
+        # Parsed keys of the imported addresses may be stale now.
+        for row in rows:
+            self._keys.pop(row[0])
+
+    def export_keys(self):
+        """ Bulk export of the vault (see import_keys). Keys are read in a single pass and never parsed.
+
+        :return: Generator of Bitcoin address, private key, public key and WIF (None if not stored) of every key pair.
+        :rtype: generator
+        """
+
+        for btc_addr, sk, pk, wif in self.db.execute("SELECT btc_addr, sk, pk, wif FROM keys"):
+            yield btc_addr, unhexlify(sk), unhexlify(pk), wif
+
+
+def migrate_vault(vault_path=None, db_path=None, remove=False, vault=None):
+    """ Migrates the keys stored following the directory per address layout (see keys.store_keys and
+    wallet.generate_wif) to a KeyVault. Text WIFs (WIF.txt) are migrated as well, while image ones (WIF.png) can be
+    regenerated from the keys.
+
+    :param vault_path: Path where keys are stored. Defined in the config file by default.
+    :type vault_path: str
+    :param db_path: Path of the vault file. Defaults to vault.db inside vault_path.
+    :type db_path: str
+    :param remove: Whether the migrated directories are removed or not. Unset by default.
+    :type remove: bool
+    :param vault: Already open vault the keys are migrated to, instead of opening db_path (so the keys it has cached
+    are kept up to date).
+    :type vault: KeyVault
+    :return: The vault the keys have been migrated to.
+    :rtype: KeyVault
+    """
+
+    if vault_path is None:
+        vault_path = CFG.address_vault
+    if db_path is None:
+        db_path = vault_path + VAULT_FILE
+
+    entries = []
+    wifs = dict()
+    for btc_addr in listdir(vault_path):
+        addr_dir = path.join(vault_path, btc_addr)
+        if not path.isfile(path.join(addr_dir, "sk.pem")):
+            continue
+
+        sk = SigningKey.from_pem(open(path.join(addr_dir, "sk.pem"), "r").read())
+        pk = VerifyingKey.from_pem(open(path.join(addr_dir, "pk.pem"), "r").read())
+        entries.append((btc_addr, sk.to_string(), pk.to_string()))
+
+        if path.isfile(path.join(addr_dir, "WIF.txt")):
+            wifs[btc_addr] = open(path.join(addr_dir, "WIF.txt"), "r").read().strip()
+
+    if vault is None:
+        vault = KeyVault(db_path)
+    vault.import_keys(entries, wifs)
+
+    if remove:
+        for btc_addr, _, _ in entries:
+            rmtree(path.join(vault_path, btc_addr))
+
+    return vault
@@ -1,5 +1,80 @@
-from urllib2 import urlopen, Request
 from json import loads
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ Defines a least recently used (LRU) cache holding at most max_size entries. Once the cache is full, the least
+    recently used entry is dropped for every new one.
+    """
+
+    def __init__(self, max_size=2**16):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """ Gets the value of a given key, marking it as the most recently used one.
+
+        :param key: Key to be looked up.
+        :type key: hashable
+        :param default: Value returned if the key is not cached.
+        :type default: any
+        :return: The cached value, or default if the key is not cached.
+        :rtype: any
+        """
+
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+
+        self._entries[key] = value
+
+        return value
+
+    def put(self, key, value):
+        """ Caches a value for a given key, dropping the least recently used entry if the cache is full.
+
+        :param key: Key of the value.
+        :type key: hashable
+        :param value: Value to be cached.
+        :type value: any
+        :return: None.
+        :rtype: None
+        """
+
+        self._entries.pop(key, None)
+        self._entries[key] = value
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """ Drops the cached value of a given key.
+
+        :param key: Key to be dropped.
+        :type key: hashable
+        :param default: Value returned if the key is not cached.
+        :type default: any
+        :return: The dropped value, or default if the key was not cached.
+        :rtype: any
+        """
+
+        return self._entries.pop(key, default)
+
+    def clear(self):
+        """ Drops every cached entry.
+
+        :return: None.
+        :rtype: None
+        """
+
+        self._entries.clear()
 
 
 def change_endianness(x):
@@ -279,8 +354,9 @@ def is_script(script):
         return False
 
 
-def get_prev_ScriptPubKey(tx_id, index, network='test'):
-    """ Gets the ScriptPubKey of a given transaction id and its type, by querying blockcyer's API.
+def get_prev_ScriptPubKey(tx_id, index, network='test', timeout=30):
+    """ Gets the ScriptPubKey of a given transaction id and its type, by querying blockcyer's API. Consider using a
+    prevout provider (see core.prevouts) instead, which allows to avoid (or at least cache) these queries.
 
     :param tx_id: Transaction identifier to be queried.
     :type tx_id: hex str
@@ -288,6 +364,8 @@ def get_prev_ScriptPubKey(tx_id, index, network='test'):
     :type index: int
     :param network: Network in which the transaction can be found (either mainnet or testnet).
     :type network: hex str
+    :param timeout: Timeout of the query (in seconds).
+    :type timeout: int
     :return: The corresponding ScriptPubKey and its type.
     :rtype hex str, str
     """
@@ -299,11 +377,13 @@ def get_prev_ScriptPubKey(tx_id, index, network='test'):
     else:
         raise Exception("Bad network.")
 
+    from urllib2 import urlopen, Request
+
     request = Request(base_url + tx_id)
     header = 'User-agent', 'Mozilla/5.0'
     request.add_header("User-agent", header)
 
-    r = urlopen(request)
+    r = urlopen(request, timeout=timeout)
 
     data = loads(r.read())
 
@@ -329,7 +409,7 @@ def parse_script_type(t):
     elif t == 'pay-to-pubkey-hash':
         r = "P2PKH"
     elif t == 'pay-to-script-hash':
-        r = "P2PSH"
+        r = "P2SH"
     else:
         r = "unknown"
 
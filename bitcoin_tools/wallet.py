@@ -1,13 +1,13 @@
 from binascii import unhexlify, hexlify
 from hashlib import new, sha256
+from multiprocessing import Pool, cpu_count
 from os import mkdir, path
-from re import match
-
-from base58 import b58encode, b58decode
-from qrcode import make as qr_make
 
 from bitcoin_tools import CFG
+from bitcoin_tools.core.base58check import encode_check, encode_check_batch, decode_check
+from bitcoin_tools.core import bech32
 from bitcoin_tools.core.keys import serialize_pk, serialize_sk
+from bitcoin_tools.utils import LRUCache
 
 # Network codes
 PUBKEY_HASH = 0
@@ -16,6 +16,19 @@ TESTNET_PUBKEY_HASH = 111
 WIF = 128
 TESTNET_WIF = 239
 
+# Human readable part of segwit addresses
+SEGWIT_HRP = 'bc'
+TESTNET_SEGWIT_HRP = 'tb'
+
+# Empty RIPEMD-160 hash object, copied for every hash so the hash implementation is only looked up once (on first use,
+# since some OpenSSL builds lack RIPEMD-160 and the fallback implementation is slow to load).
+_ripemd160 = None
+
+# Addresses derived by pks_to_btc_addrs, identified by the network version and the public key, and RIPEMD-160 hashes
+# obtained by btc_addrs_to_hash_160s, identified by the address.
+_btc_addrs = LRUCache()
+_hash_160s = LRUCache()
+
 
 def hash_160(data):
     """ Calculates the RIPEMD-160 hash of a given string.
@@ -26,13 +39,28 @@ def hash_160(data):
     :rtype: bytes
     """
 
-    # Calculate the RIPEMD-160 hash of the given data.
-    md = new('ripemd160')
-    h = sha256(unhexlify(data)).digest()
-    md.update(h)
-    h160 = md.digest()
+    return _hash_160(unhexlify(data))
 
-    return h160
+
+def _hash_160(data):
+    """ Calculates the RIPEMD-160 hash of a given string (see hash_160).
+
+    :param data: Data to be hashed.
+    :type data: bytes
+    :return: The RIPEMD-160 hash.
+    :rtype: bytes
+    """
+
+    global _ripemd160
+
+    if _ripemd160 is None:
+        _ripemd160 = new('ripemd160')
+
+    # Calculate the RIPEMD-160 hash of the sha256 of the given data.
+    md = _ripemd160.copy()
+    md.update(sha256(data).digest())
+
+    return md.digest()
 
 
 def hash_160_to_btc_address(h160, v):
@@ -52,23 +80,19 @@ def hash_160_to_btc_address(h160, v):
     """
 
     # If h160 is passed as hex str, the value is converted into bytes.
-    if match('^[0-9a-fA-F]*$', h160):
+    if len(h160) == 40:
         h160 = unhexlify(h160)
 
-    # Add the network version leading the previously calculated RIPEMD-160 hash.
-    vh160 = chr(v) + h160
-    # Double sha256.
-    h = sha256(sha256(vh160).digest()).digest()
-    # Add the two first bytes of the result as a checksum tailing the RIPEMD-160 hash.
-    addr = vh160 + h[0:4]
-    # Obtain the Bitcoin address by Base58 encoding the result
-    addr = b58encode(addr)
+    # Add the network version leading the previously calculated RIPEMD-160 hash, and obtain the Bitcoin address by
+    # Base58Check encoding the result (the first four bytes of its double sha256 are added as a checksum).
+    addr = encode_check(chr(v) + h160)
 
     return addr
 
 
 def btc_addr_to_hash_160(btc_addr):
-    """ Calculates the RIPEMD-160 hash from a given Bitcoin address
+    """ Calculates the RIPEMD-160 hash from a given Bitcoin address. An exception is raised if the checksum of the
+    address is not valid.
 
     :param btc_addr: Bitcoin address.
     :type btc_addr: str
@@ -76,13 +100,11 @@ def btc_addr_to_hash_160(btc_addr):
     :rtype: hex str
     """
 
-    # Base 58 decode the Bitcoin address.
-    decoded_addr = b58decode(btc_addr)
-    # Covert the address from bytes to hex.
-    decoded_addr_hex = hexlify(decoded_addr)
-    # Obtain the RIPEMD-160 hash by removing the first and four last bytes of the decoded address, corresponding to
-    # the network version and the checksum of the address.
-    h160 = decoded_addr_hex[2:-8]
+    # Base58Check decode the Bitcoin address (the checksum is verified and removed).
+    decoded_addr = decode_check(btc_addr)
+    # Obtain the RIPEMD-160 hash by removing the first byte of the decoded address, corresponding to the network
+    # version, and covert it from bytes to hex.
+    h160 = hexlify(decoded_addr[1:])
 
     return h160
 
@@ -117,6 +139,175 @@ def pk_to_btc_addr(pk, v='test'):
     return btc_addr
 
 
+def _pk_to_btc_addr_job(job):
+    """ Derives the address of a single job of pks_to_btc_addrs.
+
+    :param job: Serialized public key and network version.
+    :type job: tuple
+    :return: The corresponding Bitcoin address.
+    :rtype: str
+    """
+
+    pk, v = job
+
+    return hash_160_to_btc_address(_hash_160(pk), v)
+
+
+def pks_to_btc_addrs(pks, v='test', processes=None):
+    """ Batch version of pk_to_btc_addr, over serialized public keys as bytes (e.g. as read from the chainstate).
+    Repeated keys are hashed only once (results are also cached across calls), and the remaining keys are spread across
+    a pool of worker processes.
+
+    :param pks: Serialized elliptic curve public keys.
+    :type pks: list of bytes
+    :param v: version used to calculate the Bitcoin addresses (either 'main' or 'test').
+    :type v: str
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the addresses are
+    derived in the calling process.
+    :type processes: int
+    :return: The corresponding Bitcoin addresses, in the same order than the given keys.
+    :rtype: list of str
+    """
+
+    # Choose the proper version depending on the provided 'v'.
+    if v in ['mainnet', 'main']:
+        v = PUBKEY_HASH
+    elif v in ['testnet', 'test']:
+        v = TESTNET_PUBKEY_HASH
+    else:
+        raise Exception("Invalid version, use either 'main' or 'test'.")
+
+    return _cached_batch([(pk, v) for pk in pks], _btc_addrs, _pk_to_btc_addr_job, processes)
+
+
+def btc_addrs_to_hash_160s(btc_addrs, processes=None):
+    """ Batch version of btc_addr_to_hash_160. Repeated addresses are decoded only once (results are also cached across
+    calls), and the remaining ones are spread across a pool of worker processes.
+
+    :param btc_addrs: Bitcoin addresses.
+    :type btc_addrs: list of str
+    :param processes: Number of worker processes (all the available cores by default). If set to 1 the addresses are
+    decoded in the calling process.
+    :type processes: int
+    :return: The corresponding RIPEMD-160 hashes, in the same order than the given addresses.
+    :rtype: list of hex str
+    """
+
+    return _cached_batch(btc_addrs, _hash_160s, btc_addr_to_hash_160, processes)
+
+
+def _cached_batch(jobs, cache, f, processes=None):
+    """ Computes a function over a batch of jobs, only once per distinct job, reusing (and filling) a cache of results.
+    Jobs missing from the cache are computed in chunks by a pool of worker processes, as long as there are enough of
+    them to pay off the inter-process communication.
+
+    :param jobs: Jobs to be computed.
+    :type jobs: list of hashable
+    :param cache: Cache of results, identified by job.
+    :type cache: LRUCache
+    :param f: Function that computes a job (it must be defined at module level so it can be sent to the workers).
+    :type f: function
+    :param processes: Number of worker processes (all the available cores by default).
+    :type processes: int
+    :return: The result of every job, in the same order than the jobs.
+    :rtype: list
+    """
+
+    results = dict()
+    missing = []
+    for job in jobs:
+        if job not in results:
+            result = cache.get(job)
+            results[job] = result
+            if result is None:
+                missing.append(job)
+
+    if processes is None:
+        processes = cpu_count()
+
+    if processes == 1 or len(missing) < processes * 1000:
+        computed = [f(job) for job in missing]
+    else:
+        pool = Pool(processes)
+        try:
+            computed = pool.map(f, missing, len(missing) / (processes * 4) + 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for job, result in zip(missing, computed):
+        results[job] = result
+        cache.put(job, result)
+
+    return [results[job] for job in jobs]
+
+
+def _get_segwit_hrp(v):
+    """ Gets the human readable part of the segwit addresses of a given network.
+
+    :param v: network (either 'main' or 'test').
+    :type v: str
+    :return: The human readable part.
+    :rtype: str
+    """
+
+    if v in ['mainnet', 'main']:
+        return SEGWIT_HRP
+    elif v in ['testnet', 'test']:
+        return TESTNET_SEGWIT_HRP
+    else:
+        raise Exception("Invalid version, use either 'main' or 'test'.")
+
+
+def witness_program_to_btc_addr(witprog, witver=0, v='test'):
+    """ Calculates the segwit (bech32 / bech32m) address of a given witness program, e.g. the hash160 of a public key for
+    P2WPKH, the sha256 of a script for P2WSH or an x-only public key for P2TR.
+
+    :param witprog: Witness program.
+    :type witprog: hex str
+    :param witver: Witness version (0 for P2WPKH and P2WSH, 1 for P2TR).
+    :type witver: int
+    :param v: version used to calculate the address (either 'main' or 'test').
+    :type v: str
+    :return: The corresponding segwit address.
+    :rtype: str
+    """
+
+    return bech32.encode(_get_segwit_hrp(v), witver, unhexlify(witprog))
+
+
+def btc_addr_to_witness_program(btc_addr):
+    """ Calculates the witness version and program from a given segwit address, checking its checksum.
+
+    :param btc_addr: Segwit address (either mainnet or testnet).
+    :type btc_addr: str
+    :return: The corresponding witness version and program.
+    :rtype: int, hex str
+    """
+
+    hrp = SEGWIT_HRP if btc_addr.lower().startswith(SEGWIT_HRP + "1") else TESTNET_SEGWIT_HRP
+    witver, witprog = bech32.decode(hrp, btc_addr)
+
+    return witver, hexlify(witprog)
+
+
+def witness_programs_to_btc_addrs(witprogs, witver=0, v='test'):
+    """ Batch version of witness_program_to_btc_addr, for programs of the same version and length (e.g. the P2WPKH or
+    P2WSH outputs of the UTXO set). Addresses are computed vectorially (see core.bech32.encode_batch).
+
+    :param witprogs: Witness programs, either as a list of bytes or as a 2D numpy array (one program per row).
+    :type witprogs: list of bytes or numpy.ndarray of uint8
+    :param witver: Witness version (0 for P2WPKH and P2WSH, 1 for P2TR).
+    :type witver: int
+    :param v: version used to calculate the addresses (either 'main' or 'test').
+    :type v: str
+    :return: The corresponding segwit addresses, in the same order than the given programs.
+    :rtype: list of str
+    """
+
+    return bech32.encode_batch(_get_segwit_hrp(v), witver, witprogs)
+
+
 def generate_btc_addr(pk, v='test',  compressed=True):
     """ Calculates Bitcoin address associated to a given elliptic curve public key and a given network.
 
@@ -172,15 +363,13 @@ def sk_to_wif(sk, compressed=True, mode='image', v='test'):
     # Flag compressed pk when needed
     if compressed:
         e_pkey += unhexlify('01')
-    # Double sha256.
-    h = sha256(sha256(e_pkey).digest()).digest()
-    # Add the two first bytes of the result as a checksum tailing the encoded key.
-    wif = e_pkey + h[0:4]
-    # Enconde the result in base58.
-    wif = b58encode(wif)
+    # Encode the result in Base58Check (the first four bytes of its double sha256 are added as a checksum).
+    wif = encode_check(e_pkey)
 
     # Choose the proper return mode depending on 'mode'.
     if mode is 'image':
+        # qrcode (and Pillow) are only imported when an image is requested, so text WIFs never pay for them.
+        from qrcode import make as qr_make
         response = qr_make(wif)
     elif mode is 'text':
         response = wif
@@ -190,9 +379,11 @@ def sk_to_wif(sk, compressed=True, mode='image', v='test'):
     return response
 
 
-def generate_wif(btc_addr, sk, mode='image', v='test', vault_path=None):
+def generate_wif(btc_addr, sk, mode='image', v='test', vault_path=None, vault=None):
     """ Generates a Wallet Import Format (WIF) file into disk. Uses an elliptic curve private key from disk as an input
-    using the btc_addr associated to the public key of the same key pair as an identifier.
+    using the btc_addr associated to the public key of the same key pair as an identifier. If a single file vault is
+    given (see core.vault.KeyVault) the WIF is stored there as text, whatever the mode (images can be regenerated from
+    it with qrcode).
 
     :param btc_addr: Bitcoin address associated to the public key of the same key pair as the private key.
     :type btc_addr: hex str
@@ -204,10 +395,16 @@ def generate_wif(btc_addr, sk, mode='image', v='test', vault_path=None):
     :type v: str
     :param vault_path: Path where WIF file will be stored be stored. Defined in the config file by default.
     :type vault_path: str
+    :param vault: Vault where the WIF will be stored, instead of vault_path.
+    :type vault: KeyVault
     :return: None.
     :rtype: None
     """
 
+    if vault is not None:
+        vault.store_wif(btc_addr, sk_to_wif(serialize_sk(sk), mode='text', v=v))
+        return
+
     # Get a private key in hex format and create the WIF representation.
     wif = sk_to_wif(serialize_sk(sk), mode=mode, v=v)
 
@@ -225,3 +422,107 @@ def generate_wif(btc_addr, sk, mode='image', v='test', vault_path=None):
         f.write(wif)
     else:
         raise Exception("Invalid mode, used either 'image' or 'text'.")
+
+
+def sks_to_wifs(sks, compressed=True, v='test'):
+    """ Batch (text only) version of sk_to_wif.
+
+    :param sks: elliptic curve private keys.
+    :type sks: list of hex str
+    :param compressed: Whether the WIFs will be used with compressed or uncompressed public keys.
+    :type compressed: bool
+    :param v: version (prefix) used to calculate the WIFs, it depends on the type of network.
+    :type v: str
+    :return: The WIF representation of the private keys, in the same order than the given ones.
+    :rtype: list of str
+    """
+
+    # Choose the proper version depending on the provided 'v'.
+    if v in ['mainnet', 'main']:
+        v = WIF
+    elif v in ['testnet', 'test']:
+        v = TESTNET_WIF
+    else:
+        raise Exception("Invalid version, use either 'main' or 'test'.")
+
+    prefix = chr(v)
+    suffix = unhexlify('01') if compressed else ''
+
+    return encode_check_batch([prefix + unhexlify(sk) + suffix for sk in sks])
+
+
+def _save_wif_image_job(job):
+    """ Renders the QR code of a WIF and saves it into disk inside a worker process of generate_wifs.
+
+    :param job: WIF and path of the image file.
+    :type job: tuple
+    :return: None.
+    :rtype: None
+    """
+
+    from qrcode import make as qr_make
+
+    wif, file_path = job
+    qr_make(wif).save(file_path)
+
+
+def generate_wifs(keys, mode='image', v='test', vault_path=None, vault=None, processes=None):
+    """ Batch version of generate_wif. WIFs are computed in the calling process (it only takes hashing and base58
+    encoding), while QR images, if requested, are rendered by a pool of worker processes.
+
+    :param keys: Bitcoin address and private key of every key pair.
+    :type keys: list of (str, SigningKey)
+    :param mode: Whether WIFs are stored as QR images ('image') or text ('text').
+    :type mode: str
+    :param v: version (prefix) used to calculate the WIFs, it depends on the type of network.
+    :type v: str
+    :param vault_path: Path where WIF files will be stored. Defined in the config file by default.
+    :type vault_path: str
+    :param vault: Vault where the WIFs will be stored (as text, whatever the mode), instead of vault_path.
+    :type vault: KeyVault
+    :param processes: Number of worker processes rendering images (all the available cores by default). If set to 1
+    images are rendered in the calling process.
+    :type processes: int
+    :return: None.
+    :rtype: None
+    """
+
+    if mode not in ['image', 'text']:
+        raise Exception("Invalid mode, used either 'image' or 'text'.")
+
+    btc_addrs = [btc_addr for btc_addr, _ in keys]
+    wifs = sks_to_wifs([serialize_sk(sk) for _, sk in keys], v=v)
+
+    if vault is not None:
+        vault.store_wifs(dict(zip(btc_addrs, wifs)))
+        return
+
+    if vault_path is None:
+        vault_path = CFG.address_vault
+
+    for btc_addr in btc_addrs:
+        if not path.exists(vault_path + btc_addr):
+            mkdir(vault_path + btc_addr)
+
+    if mode == 'text':
+        for btc_addr, wif in zip(btc_addrs, wifs):
+            with open(vault_path + btc_addr + "/WIF.txt", 'w') as f:
+                f.write(wif)
+        return
+
+    jobs = [(wif, vault_path + btc_addr + "/WIF.png") for btc_addr, wif in zip(btc_addrs, wifs)]
+
+    if processes == 1 or len(jobs) <= 1:
+        for job in jobs:
+            _save_wif_image_job(job)
+        return
+
+    if processes is None:
+        processes = cpu_count()
+
+    pool = Pool(processes)
+    try:
+        pool.map(_save_wif_image_job, jobs, len(jobs) / (processes * 4) + 1)
+    finally:
+        pool.close()
+        pool.join()
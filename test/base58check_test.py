@@ -0,0 +1,74 @@
+from binascii import hexlify, unhexlify
+import os
+import unittest
+
+from bitcoin_tools.core.base58check import encode, decode, encode_check, decode_check, encode_check_batch, \
+    decode_check_batch, encode_check_stream, decode_check_stream
+from bitcoin_tools.wallet import btc_addr_to_hash_160, pk_to_btc_addr, sk_to_wif
+
+# Bitcoin Core's base58 encoding vectors (data, base58).
+VECTORS = [("", ""), ("61", "2g"), ("626262", "a3gV"), ("636363", "aPEr"),
+           ("73696d706c792061206c6f6e6720737472696e67", "2cFupjhnEsSn59qHXstmK2ffpLv2"),
+           ("00eb15231dfceb60925886b67d065299925915aeb172c06647", "1NS17iag9jJgTHD1VXjvLCEnZuQ3rJDE9L"),
+           ("516b6fcd0f", "ABnLTmg"), ("bf4f89001e670274dd", "3SEo3LWLoPntC"), ("572e4794", "3EFU7m"),
+           ("ecac89cad93923c02321", "EJDM8drfXA6uyA"), ("10c8511e", "Rt5zm"), ("00000000000000000000", "1111111111")]
+
+# Public key, hash160 and address of the Bitcoin wiki technical background example.
+PK = "0450863ad64a87ae8a2fe83c1af1a8403cb53f53e486d8511dad8a04887e5b23522cd470243453a299fa9e77237716103abc11a1df38855" \
+     "ed6f2ee187e9c582ba6"
+H160 = "010966776006953d5567439e5e39f86a0d273bee"
+BTC_ADDR = "16UwLL9Risc3QfPqBUvKofHmBQ7wMtjvM"
+
+# Private key and (uncompressed, mainnet) WIF of the Bitcoin wiki WIF example.
+SK = "0c28fca386c7a227600b2fe50b7cae11ec86d3bf1fbe471be89827e19d72aa1d"
+WIF = "5HueCGU8rMjxEXxiPuD5BDku4MkFqeZyd4dZ1jvhTVqvbTLvyTJ"
+
+
+class Base58CheckTest(unittest.TestCase):
+
+    def test_vectors(self):
+        for data, s in VECTORS:
+            self.assertEqual(encode(unhexlify(data)), s)
+            self.assertEqual(hexlify(decode(s)), data)
+
+    def test_round_trip(self):
+        for l in range(0, 80):
+            for zeros in range(3):
+                data = '\x00' * zeros + os.urandom(l)
+                self.assertEqual(decode(encode(data)), data)
+                self.assertEqual(decode_check(encode_check(data)), data)
+
+    def test_checksum(self):
+        s = encode_check(unhexlify("00" + H160))
+        self.assertEqual(s, BTC_ADDR)
+
+        # A mistyped character.
+        self.assertRaises(Exception, decode_check, s[:-1] + ("1" if s[-1] != "1" else "2"))
+        # Too short to hold a checksum.
+        self.assertRaises(Exception, decode_check, "1")
+
+    def test_batch(self):
+        payloads = [os.urandom(21) for _ in range(1000)]
+        strings = encode_check_batch(payloads)
+
+        self.assertEqual(strings, [encode_check(p) for p in payloads])
+        self.assertEqual(decode_check_batch(strings), payloads)
+
+    def test_stream(self):
+        payloads = [os.urandom(21) for _ in range(1000)]
+
+        chunks = list(encode_check_stream(iter(payloads), 300))
+        self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+        self.assertEqual(sum(decode_check_stream((s for chunk in chunks for s in chunk), 300), []), payloads)
+
+    def test_wallet(self):
+        self.assertEqual(pk_to_btc_addr(PK, 'main'), BTC_ADDR)
+        self.assertEqual(btc_addr_to_hash_160(BTC_ADDR), H160)
+        self.assertRaises(Exception, btc_addr_to_hash_160, BTC_ADDR[:-1] + "N")
+
+        self.assertEqual(sk_to_wif(SK, False, 'text', 'main'), WIF)
+        self.assertEqual(decode_check(WIF), "\x80" + unhexlify(SK))
+
+
+if __name__ == '__main__':
+    unittest.main()
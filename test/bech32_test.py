@@ -0,0 +1,79 @@
+from binascii import unhexlify
+import os
+import unittest
+
+from bitcoin_tools.core import bech32
+from bitcoin_tools.wallet import witness_program_to_btc_addr, btc_addr_to_witness_program, \
+    witness_programs_to_btc_addrs
+
+# BIP173 / BIP350 valid segwit addresses (address, scriptPubKey).
+VALID = [("BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4", "0014751e76e8199196d454941c45d1b3a323f1433bd6"),
+         ("tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7",
+          "00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262"),
+         ("bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kt5nd6y",
+          "5128751e76e8199196d454941c45d1b3a323f1433bd6751e76e8199196d454941c45d1b3a323f1433bd6"),
+         ("BC1SW50QGDZ25J", "6002751e"),
+         ("bc1zw508d6qejxtdg4y5r3zarvaryvaxxpcs", "5210751e76e8199196d454941c45d1b3a323"),
+         ("tb1qqqqqp399et2xygdj5xreqhjjvcmzhxw4aywxecjdzew6hylgvsesrxh6hy",
+          "0020000000c4a5cad46221b2a187905e5266362b99d5e91c6ce24d165dab93e86433"),
+         ("tb1pqqqqp399et2xygdj5xreqhjjvcmzhxw4aywxecjdzew6hylgvsesf3hn0c",
+          "5120000000c4a5cad46221b2a187905e5266362b99d5e91c6ce24d165dab93e86433"),
+         ("bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0",
+          "512079be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798")]
+
+# BIP350 invalid segwit addresses (and a BIP173 version 1 address, whose bech32 checksum is no longer valid).
+INVALID = ["tc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vq5zuyut",  # Invalid human readable part
+           "bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqh2y7hd",  # Version 1 with bech32 checksum
+           "tb1z0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqglt7rf",  # Version 2 with bech32 checksum
+           "BC1S0XLXVLHEMJA6C4DQV22UAPCTQUPFHLXM9H8Z3K2E72Q4K9HCZ7VQ54WELL",  # Version 16 with bech32 checksum
+           "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kemeawh",  # Version 0 with bech32m checksum
+           "tb1q0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vq24jc47",  # Version 0 with bech32m checksum
+           "bc1p38j9r5y49hruaue7wxjce0updqjuyyx0kh56v8s25huc6995vvpql3jow4",  # Invalid character
+           "BC130XLXVLHEMJA6C4DQV22UAPCTQUPFHLXM9H8Z3K2E72Q4K9HCZ7VQ7ZWS8R",  # Invalid version
+           "bc1pw5dgrnzv",  # Invalid program length (1 byte)
+           "bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7v8n0nx0muaewav253zgeav",  # 41 bytes
+           "BC1QR508D6QEJXTDG4Y5R3ZARVARYV98GJ9P",  # Invalid program length for version 0
+           "tb1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vq47Zagq",  # Mixed case
+           "bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7v07qwwzcrf",  # Zero padding of more than 4 bits
+           "tb1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vpggkg4j",  # Non-zero padding
+           "bc1gmk9yu",  # Empty data
+           "bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7k7grplx"]  # BIP173 version 1
+
+
+class Bech32Test(unittest.TestCase):
+
+    def test_valid(self):
+        for addr, script in VALID:
+            hrp = addr[:2].lower()
+            op = int(script[:2], 16)
+            witver, witprog = (op - 0x50 if op else 0), unhexlify(script[4:])
+
+            self.assertEqual(bech32.decode(hrp, addr), (witver, witprog))
+            self.assertEqual(bech32.encode(hrp, witver, witprog), addr.lower())
+            self.assertEqual(btc_addr_to_witness_program(addr), (witver, script[4:]))
+            self.assertEqual(witness_program_to_btc_addr(script[4:], witver, 'main' if hrp == 'bc' else 'test'),
+                             addr.lower())
+
+    def test_invalid(self):
+        for addr in INVALID:
+            for hrp in ['bc', 'tb']:
+                self.assertRaises(Exception, bech32.decode, hrp, addr)
+
+    def test_invalid_programs(self):
+        for witver, witprog in [(0, '\x00' * 21), (1, '\x00'), (1, '\x00' * 41), (17, '\x00' * 20)]:
+            self.assertRaises(Exception, bech32.encode, 'bc', witver, witprog)
+
+    def test_batch(self):
+        for witver, l in [(0, 20), (0, 32), (1, 32), (16, 2), (3, 40), (2, 13)]:
+            witprogs = [os.urandom(l) for _ in range(500)]
+            addrs = [bech32.encode('bc', witver, w) for w in witprogs]
+
+            self.assertEqual(bech32.encode_batch('bc', witver, witprogs), addrs)
+            self.assertEqual(witness_programs_to_btc_addrs(witprogs, witver, 'main'), addrs)
+            self.assertEqual([bech32.decode('bc', a) for a in addrs], [(witver, w) for w in witprogs])
+
+        self.assertEqual(bech32.encode_batch('bc', 0, []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
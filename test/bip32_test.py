@@ -0,0 +1,134 @@
+from binascii import hexlify, unhexlify
+import unittest
+
+from bitcoin_tools.core import bip32, ec_backend
+from bitcoin_tools.core.bip32 import HDNode, HARDENED, derive_children, derive_btc_addrs
+from bitcoin_tools.wallet import generate_btc_addr, pk_to_btc_addr
+
+# BIP32 test vector 1 (path, xpub, xprv).
+SEED_1 = "000102030405060708090a0b0c0d0e0f"
+VECTOR_1 = [("m", "xpub661MyMwAqRbcFtXgS5sYJABqqG9YLmC4Q1Rdap9gSE8NqtwybGhePY2gZ29ESFjqJoCu1Rupje8YtGqsefD265TMg7usUDFdp6W1"
+                  "EGMcet8",
+             "xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuG"
+             "BxrMPHi"),
+            ("m/0H", "xpub68Gmy5EdvgibQVfPdqkBBCHxA5htiqg55crXYuXoQRKfDBFA1WEjWgP6LHhwBZeNK1VTsfTFUHCdrfp1bgwQ9xv5ski8PX9r"
+                     "L2dZXvgGDnw",
+             "xprv9uHRZZhk6KAJC1avXpDAp4MDc3sQKNxDiPvvkX8Br5ngLNv1TxvUxt4cV1rGL5hj6KCesnDYUhd7oWgT11eZG7XnxHrnYeSvkzY7"
+             "d2bhkJ7"),
+            ("m/0H/1", "xpub6ASuArnXKPbfEwhqN6e3mwBcDTgzisQN1wXN9BJcM47sSikHjJf3UFHKkNAWbWMiGj7Wf5uMash7SyYq527Hqck2AxYy"
+                       "sAA7xmALppuCkwQ",
+             "xprv9wTYmMFdV23N2TdNG573QoEsfRrWKQgWeibmLntzniatZvR9BmLnvSxqu53Kw1UmYPxLgboyZQaXwTCg8MSY3H2EU4pWcQDnRnrV"
+             "A1xe8fs"),
+            ("m/0H/1/2H", "xpub6D4BDPcP2GT577Vvch3R8wDkScZWzQzMMUm3PWbmWvVJrZwQY4VUNgqFJPMM3No2dFDFGTsxxpG5uJh7n7epu4trk"
+                          "rX7x7DogT5Uv6fcLW5",
+             "xprv9z4pot5VBttmtdRTWfWQmoH1taj2axGVzFqSb8C9xaxKymcFzXBDptWmT7FwuEzG3ryjH4ktypQSAewRiNMjANTtpgP4mLTj34bh"
+             "nZX7UiM"),
+            ("m/0H/1/2H/2", "xpub6FHa3pjLCk84BayeJxFW2SP4XRrFd1JYnxeLeU8EqN3vDfZmbqBqaGJAyiLjTAwm6ZLRQUMv1ZACTj37sR62cf"
+                            "N7fe5JnJ7dh8zL4fiyLHV",
+             "xprvA2JDeKCSNNZky6uBCviVfJSKyQ1mDYahRjijr5idH2WwLsEd4Hsb2Tyh8RfQMuPh7f7RtyzTtdrbdqqsunu5Mm3wDvUAKRHSC34s"
+             "J7in334"),
+            ("m/0H/1/2H/2/1000000000", "xpub6H1LXWLaKsWFhvm6RVpEL9P4KfRZSW7abD2ttkWP3SSQvnyA8FSVqNTEcYFgJS2UaFcxupHiY"
+                                       "kro49S8yGasTvXEYBVPamhGW6cFJodrTHy",
+             "xprvA41z7zogVVwxVSgdKUHDy1SKmdb533PjDz7J6N6mV6uS3ze1ai8FHa8kmHScGpWmj4WggLyQjgPie1rFSruoUihUZREPSL39UNdE"
+             "3BBDu76")]
+
+BACKENDS = [ec_backend.ECDSA] + ([ec_backend.COINCURVE] if ec_backend.is_coincurve_installed() else [])
+
+
+class BIP32Test(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = ec_backend.get_backend()
+        bip32.clear_cache()
+
+    def tearDown(self):
+        ec_backend.set_backend(self.backend)
+        bip32.clear_cache()
+
+    def for_each_backend(self, test):
+        for backend in BACKENDS:
+            ec_backend.set_backend(backend)
+            bip32.clear_cache()
+            test()
+
+    def test_vector_1(self):
+        def test():
+            m = HDNode.from_seed(unhexlify(SEED_1))
+            for path, xpub, xprv in VECTOR_1:
+                node = m.derive(path)
+                self.assertEqual(node.to_xkey('main'), xprv)
+                self.assertEqual(node.to_xkey('main', private=False), xpub)
+                self.assertEqual(node.neuter().to_xkey('main'), xpub)
+
+        self.for_each_backend(test)
+
+    def test_xkeys(self):
+        def test():
+            for path, xpub, xprv in VECTOR_1:
+                self.assertEqual(HDNode.from_xkey(xprv).to_xkey('main'), xprv)
+                self.assertEqual(HDNode.from_xkey(xpub).to_xkey('main'), xpub)
+                self.assertFalse(HDNode.from_xkey(xpub).is_private())
+
+            self.assertRaises(Exception, HDNode.from_xkey, VECTOR_1[0][1][:-1] + "9")
+
+        self.for_each_backend(test)
+
+    def test_public_derivation(self):
+        def test():
+            # m/0H/1 and m/0H/1/2H/2/1000000000 from the public keys of their parents.
+            self.assertEqual(HDNode.from_xkey(VECTOR_1[1][1]).derive("1").to_xkey('main'), VECTOR_1[2][1])
+            self.assertEqual(HDNode.from_xkey(VECTOR_1[4][1]).derive("1000000000").to_xkey('main'), VECTOR_1[5][1])
+            self.assertRaises(Exception, HDNode.from_xkey(VECTOR_1[1][1]).child, HARDENED)
+
+        self.for_each_backend(test)
+
+    def test_cached_children(self):
+        def test():
+            private = HDNode.from_xkey(VECTOR_1[1][2])
+            public = private.neuter()
+
+            # Children cached from the public node get their private key when derived from the private one, and the
+            # other way around.
+            self.assertFalse(public.child(1).is_private())
+            self.assertEqual(private.child(1).to_xkey('main'), VECTOR_1[2][2])
+            self.assertFalse(public.child(1).is_private())
+            self.assertEqual(public.child(1).to_xkey('main'), VECTOR_1[2][1])
+
+            # Hardened children are not derived from public nodes, even if cached.
+            private.child(HARDENED)
+            self.assertRaises(Exception, public.child, HARDENED)
+
+        self.for_each_backend(test)
+
+    def test_no_cached_secrets(self):
+        def test():
+            m = HDNode.from_seed(unhexlify(SEED_1))
+            for path, xpub, xprv in VECTOR_1:
+                m.derive(path)
+
+            # Only the public part of the children is cached, while private nodes keep getting their private keys.
+            self.assertEqual(len(bip32._children), len(VECTOR_1) - 1)
+            self.assertFalse(any(child.is_private() for child in bip32._children._entries.values()))
+            for path, xpub, xprv in VECTOR_1:
+                self.assertEqual(m.derive(path).to_xkey('main'), xprv)
+
+        self.for_each_backend(test)
+
+    def test_batch(self):
+        def test():
+            node = HDNode.from_seed(unhexlify(SEED_1)).derive("m/0H/1")
+
+            children = derive_children(node.neuter(), range(50), processes=1)
+            self.assertEqual([c.pk for c in children], [node.child(i).pk for i in range(50)])
+            self.assertEqual([c.to_xkey('main') for c in derive_children(node, range(50), processes=1)],
+                             [node.child(i).to_xkey('main') for i in range(50)])
+
+            addrs = derive_btc_addrs(node.neuter(), range(50), 'main', processes=1)
+            self.assertEqual(addrs, [pk_to_btc_addr(hexlify(c.pk), 'main') for c in children])
+            self.assertEqual(generate_btc_addr(children[5].get_verifying_key(), 'main'), addrs[5])
+
+        self.for_each_backend(test)
+
+
+if __name__ == '__main__':
+    unittest.main()
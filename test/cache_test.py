@@ -0,0 +1,128 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+import ujson
+import unittest
+
+from bitcoin_tools.analysis.status import CFG, cache, utils
+from bitcoin_tools.analysis.status.cache import cached
+from bitcoin_tools.analysis.status.utils import aggregate_dust_np
+
+# Parameter read by count_above (given to cached as params).
+THRESHOLD = 10
+
+# Parameter read by the filters given to count_filtered.
+MIN_AMOUNT = 100
+
+# Calls that were actually computed (that is, not served from the cache).
+calls = []
+
+
+@cached('fin_name', params=lambda: {"THRESHOLD": THRESHOLD})
+def count_above(fin_name, attribute):
+    calls.append((fin_name, attribute))
+    return sum(1 for line in open(CFG.data_path + fin_name) if ujson.loads(line)[attribute] > THRESHOLD)
+
+
+@cached('fin_name')
+def count_filtered(fin_name, fltr):
+    calls.append((fin_name, fltr))
+    return sum(1 for line in open(CFG.data_path + fin_name) if fltr(ujson.loads(line)))
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.data_path = CFG.data_path
+        CFG.data_path = self.tmp_dir + "/"
+
+        del calls[:]
+        self.write("utxos.json", [5, 50, 500])
+
+    def tearDown(self):
+        global THRESHOLD, MIN_AMOUNT
+
+        THRESHOLD, MIN_AMOUNT = 10, 100
+        cache.set_enabled(True)
+        CFG.data_path = self.data_path
+        rmtree(self.tmp_dir)
+
+    def write(self, fin_name, amounts):
+        with open(CFG.data_path + fin_name, 'w') as fout:
+            for amount in amounts:
+                fout.write(ujson.dumps({"amount": amount, "dust": amount % 3, "non_profitable": amount % 5,
+                                        "non_profitable_est": amount % 7, "utxo_data_len": 1}) + "\n")
+
+    def test_hit(self):
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        self.assertEqual(len(calls), 1)
+
+        # Files regenerated with the same content keep their fingerprint.
+        self.write("utxos.json", [5, 50, 500])
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        self.assertEqual(len(calls), 1)
+
+    def test_changed_file(self):
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        self.write("utxos.json", [5, 50, 500, 5000])
+        self.assertEqual(count_above("utxos.json", "amount"), 3)
+        self.assertEqual(len(calls), 2)
+
+    def test_changed_argument(self):
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        self.assertEqual(count_above("utxos.json", "utxo_data_len"), 0)
+        self.assertEqual(len(calls), 2)
+
+    def test_changed_params(self):
+        global THRESHOLD
+
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        THRESHOLD = 100
+        self.assertEqual(count_above("utxos.json", "amount"), 1)
+        THRESHOLD = 10
+        self.assertEqual(count_above("utxos.json", "amount"), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_filters(self):
+        global MIN_AMOUNT
+
+        self.assertEqual(count_filtered("utxos.json", lambda x: x["amount"] >= MIN_AMOUNT), 1)
+        # Same filter, rebuilt.
+        self.assertEqual(count_filtered("utxos.json", lambda x: x["amount"] >= MIN_AMOUNT), 1)
+        self.assertEqual(len(calls), 1)
+
+        # Filters are keyed by the values they read from globals, enclose, or default to.
+        MIN_AMOUNT = 10
+        self.assertEqual(count_filtered("utxos.json", lambda x: x["amount"] >= MIN_AMOUNT), 2)
+        self.assertEqual(count_filtered("utxos.json", lambda x, t=5: x["amount"] >= t), 3)
+        fltrs = [lambda x, t=t: x["amount"] >= t for t in [5, 50]]
+        self.assertEqual([count_filtered("utxos.json", f) for f in fltrs], [3, 2])
+        # The first one matches the previous filter.
+        self.assertEqual(len(calls), 4)
+
+    def test_disabled(self):
+        cache.set_enabled(False)
+        count_above("utxos.json", "amount")
+        count_above("utxos.json", "amount")
+        self.assertEqual(len(calls), 2)
+
+    def test_dust_fee_range(self):
+        max_fee = utils.MAX_FEE_PER_BYTE
+
+        try:
+            dust = aggregate_dust_np("utxos.json")
+            self.assertEqual(sorted(dust["dust_utxos"]), range(utils.MIN_FEE_PER_BYTE, max_fee + 1, utils.FEE_STEP))
+
+            # The aggregate depends on the fee range, so changing it misses the cache.
+            utils.MAX_FEE_PER_BYTE = 10
+            dust = aggregate_dust_np("utxos.json")
+            self.assertEqual(sorted(dust["dust_utxos"]), range(utils.MIN_FEE_PER_BYTE, 11, utils.FEE_STEP))
+        finally:
+            utils.MAX_FEE_PER_BYTE = max_fee
+
+        self.assertEqual(len(aggregate_dust_np("utxos.json")["dust_utxos"]), max_fee + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+from binascii import hexlify
+from ecdsa import SigningKey, SECP256k1
+import unittest
+
+from bitcoin_tools.core.interpreter import verify_script, verify_scripts
+from bitcoin_tools.core.keys import serialize_pk
+from bitcoin_tools.core.script import InputScript, OutputScript, Script
+from bitcoin_tools.core.transaction import TX
+from bitcoin_tools.wallet import generate_btc_addr, hash_160
+
+PREV_TX_ID = "7767a9eb2c8adda3ffce86c06689007a903b6f7e78dbc049ef0dbaf9eeebe075"
+
+SKS = [SigningKey.from_secret_exponent(e, curve=SECP256k1) for e in [0x1234, 0x5678, 0x9abc]]
+PKS = [serialize_pk(sk.get_verifying_key()) for sk in SKS]
+
+
+def build_tx(prev_script, sk):
+    """ Builds a transaction that redeems a given script (with a single input), signed by the given key(s). """
+
+    tx = TX.build_from_io(PREV_TX_ID, 0, 1000, generate_btc_addr(SKS[0].get_verifying_key()))
+    tx.sign(sk, 0, orphan={0: prev_script})
+
+    return tx
+
+
+def tamper_sig(tx, f, index=0):
+    """ Replaces the first signature pushed by the scriptSig of a given input by f(signature). """
+
+    elements = tx.scriptSig[index].get_elements()
+    i = [i for i, e in enumerate(elements) if e.startswith("<30")][0]
+    elements[i] = "<" + f(elements[i].strip("<>")) + ">"
+
+    tx.scriptSig[index] = InputScript.from_hex(Script.serialize(" ".join(elements)))
+
+
+def flip_s(sig):
+    """ Flips the lowest bit of the S value of a signature (the byte right before the hash type). """
+
+    return sig[:-4] + format(int(sig[-4:-2], 16) ^ 1, '02x') + sig[-2:]
+
+
+def set_hashtype(hashtype):
+    return lambda sig: sig[:-2] + hashtype
+
+
+class InterpreterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.p2pkh = OutputScript.P2PKH(generate_btc_addr(SKS[0].get_verifying_key()))
+        self.p2pk = OutputScript.P2PK(PKS[0])
+        self.p2ms = OutputScript.P2MS(2, 3, PKS)
+
+    def test_p2pkh(self):
+        self.assertTrue(verify_script(build_tx(self.p2pkh, SKS[0]), 0, self.p2pkh))
+        # Signed by a key that does not match the address.
+        self.assertFalse(verify_script(build_tx(self.p2pkh, SKS[1]), 0, self.p2pkh))
+
+    def test_p2pk(self):
+        self.assertTrue(verify_script(build_tx(self.p2pk, SKS[0]), 0, self.p2pk))
+        self.assertFalse(verify_script(build_tx(self.p2pk, SKS[1]), 0, self.p2pk))
+
+    def test_p2ms(self):
+        self.assertTrue(verify_script(build_tx(self.p2ms, SKS[:2]), 0, self.p2ms))
+        self.assertTrue(verify_script(build_tx(self.p2ms, [SKS[0], SKS[2]]), 0, self.p2ms))
+        # Signatures must follow the order of the keys.
+        self.assertFalse(verify_script(build_tx(self.p2ms, [SKS[2], SKS[0]]), 0, self.p2ms))
+        # Not enough signatures.
+        self.assertFalse(verify_script(build_tx(self.p2ms, SKS[:1]), 0, self.p2ms))
+
+    def test_p2sh_multisig(self):
+        # Signatures are performed over the redeem script, which is pushed after them.
+        tx = build_tx(self.p2ms, SKS[1:])
+        tx.scriptSig[0] = InputScript.from_hex(tx.scriptSig[0].content +
+                                               Script.serialize("<" + self.p2ms.content + ">"))
+        p2sh = OutputScript.P2SH(hexlify(hash_160(self.p2ms.content)))
+
+        self.assertTrue(verify_script(tx, 0, p2sh))
+        # Without BIP16, only the hash of the redeem script is checked.
+        self.assertTrue(verify_script(tx, 0, p2sh, p2sh=False))
+        # A redeem script that does not match the hash.
+        self.assertFalse(verify_script(tx, 0, OutputScript.P2SH(hexlify(hash_160(self.p2pk.content)))))
+
+    def test_tampered_signature(self):
+        for prev_script, sk in [(self.p2pkh, SKS[0]), (self.p2pk, SKS[0]), (self.p2ms, SKS[:2])]:
+            tx = build_tx(prev_script, sk)
+            tamper_sig(tx, flip_s)
+            self.assertFalse(verify_script(tx, 0, prev_script))
+
+    def test_unsupported_hashtype(self):
+        for prev_script, sk in [(self.p2pkh, SKS[0]), (self.p2pk, SKS[0]), (self.p2ms, SKS[:2])]:
+            # SIGHASH_ALL | SIGHASH_ANYONECANPAY, and an undefined hash type.
+            for hashtype in ["81", "05"]:
+                tx = build_tx(prev_script, sk)
+                tamper_sig(tx, set_hashtype(hashtype))
+                self.assertFalse(verify_script(tx, 0, prev_script))
+
+    def test_sighash_single_without_output(self):
+        # The second input has no matching output.
+        tx = TX.build_from_io([PREV_TX_ID] * 2, [0, 1], [1000], generate_btc_addr(SKS[0].get_verifying_key()))
+        tx.sign(SKS[0], 0, orphan={0: self.p2pkh})
+        tx.scriptSig[1] = tx.scriptSig[0]
+        # SIGHASH_SINGLE.
+        tamper_sig(tx, set_hashtype("03"), index=1)
+
+        self.assertFalse(verify_script(tx, 1, self.p2pkh))
+
+    def test_batch(self):
+        valid = build_tx(self.p2pkh, SKS[0])
+        unsupported = build_tx(self.p2pkh, SKS[0])
+        tamper_sig(unsupported, set_hashtype("81"))
+        jobs = [(unsupported, 0, self.p2pkh), (valid, 0, self.p2pkh), (build_tx(self.p2ms, SKS[:2]), 0, self.p2ms)]
+
+        self.assertEqual(verify_scripts(jobs, processes=1), [False, True, True])
+        self.assertEqual(verify_scripts(jobs, processes=2), [False, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
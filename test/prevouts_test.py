@@ -0,0 +1,165 @@
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from json import dumps
+from os import listdir, path
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread, Lock
+from time import sleep
+from timeit import default_timer as timer
+import unittest
+
+from bitcoin_tools.core.prevouts import PooledHTTPProvider
+
+P2PKH_SCRIPT = "76a914" + "11" * 20 + "88ac"
+P2SH_SCRIPT = "a914" + "22" * 20 + "87"
+
+# Time the stub server takes to answer every query (so concurrent queries overlap).
+DELAY = 0.2
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """ Local stand-in for blockcypher's API. Transactions are served under /txs/<tx_id>, and failures can be injected
+    per transaction (see failures).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+
+        self.txs = dict()
+        # Failures to be returned by the next queries of each transaction: an HTTP status code or "drop" (the
+        # connection is closed without answering).
+        self.failures = dict()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = Lock()
+
+    def get_url(self):
+        return "http://127.0.0.1:" + str(self.server_address[1]) + "/txs/"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, as the ones of the actual API.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        tx_id = self.path.split("/")[-1]
+
+        with server.lock:
+            server.requests.append(tx_id)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            failures = server.failures.get(tx_id, [])
+            failure = failures.pop(0) if failures else None
+
+        try:
+            sleep(DELAY)
+
+            if failure == "drop":
+                self.close_connection = 1
+            elif failure is not None:
+                self._reply(failure, "error")
+            elif tx_id in server.txs:
+                self._reply(200, dumps({"outputs": [{"script": script} for script in server.txs[tx_id]]}))
+            else:
+                self._reply(404, "not found")
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledHTTPProviderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.server.txs = {format(i, '064x'): [P2PKH_SCRIPT, P2SH_SCRIPT] for i in range(8)}
+        Thread(target=self.server.serve_forever).start()
+
+        self.tmp_dir = mkdtemp()
+        # No trailing slash, and not created beforehand.
+        self.cache_dir = path.join(self.tmp_dir, "cache")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.tmp_dir)
+
+    def get_provider(self, **kwargs):
+        return PooledHTTPProvider(base_url=self.server.get_url(), cache_dir=self.cache_dir, **kwargs)
+
+    def test_concurrent(self):
+        provider = self.get_provider(max_connections=4)
+        tx_ids = sorted(self.server.txs)
+
+        start = timer()
+        provider.prefetch([(tx_id, 0) for tx_id in tx_ids])
+        elapsed = timer() - start
+
+        self.assertEqual(sorted(self.server.requests), tx_ids)
+        self.assertEqual(self.server.max_in_flight, 4)
+        # 8 transactions over 4 connections take two rounds of queries.
+        self.assertLess(elapsed, 3 * DELAY)
+
+        for tx_id in tx_ids:
+            self.assertEqual(provider.get_prev_script(tx_id, 0), (P2PKH_SCRIPT, "P2PKH"))
+            self.assertEqual(provider.get_prev_script(tx_id, 1), (P2SH_SCRIPT, "P2SH"))
+
+    def test_retries(self):
+        provider = self.get_provider(retries=3, backoff=0.1)
+        tx_id = format(0, '064x')
+        self.server.failures[tx_id] = [503, "drop", 429]
+
+        start = timer()
+        self.assertEqual(provider.get_prev_script(tx_id, 0), (P2PKH_SCRIPT, "P2PKH"))
+        elapsed = timer() - start
+
+        self.assertEqual(self.server.requests, [tx_id] * 4)
+        # Backoff doubles after every failed attempt: 0.1 + 0.2 + 0.4 seconds.
+        self.assertGreaterEqual(elapsed, 0.7 + 4 * DELAY)
+
+    def test_retries_exhausted(self):
+        provider = self.get_provider(retries=1, backoff=0.01)
+        tx_id = format(0, '064x')
+        self.server.failures[tx_id] = [500, 500]
+
+        self.assertRaises(Exception, provider.get_prev_script, tx_id, 0)
+        self.assertEqual(self.server.requests, [tx_id] * 2)
+
+    def test_client_errors_not_retried(self):
+        provider = self.get_provider(retries=3, backoff=0.01)
+        tx_id = format(100, '064x')
+
+        self.assertRaises(Exception, provider.get_prev_script, tx_id, 0)
+        self.assertEqual(self.server.requests, [tx_id])
+
+    def test_disk_cache(self):
+        tx_ids = sorted(self.server.txs)
+        self.get_provider().prefetch([(tx_id, 0) for tx_id in tx_ids])
+
+        self.assertEqual(sorted(listdir(self.cache_dir)), [tx_id + ".json" for tx_id in tx_ids])
+
+        # A new provider (with an empty in-memory cache) is served from disk.
+        self.server.requests = []
+        provider = self.get_provider()
+        provider.prefetch([(tx_id, 0) for tx_id in tx_ids])
+
+        for tx_id in tx_ids:
+            self.assertEqual(provider.get_prev_script(tx_id, 1), (P2SH_SCRIPT, "P2SH"))
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+import ujson
+import unittest
+
+from bitcoin_tools.analysis.status import CFG, NSPECIALSCRIPTS, synthetic
+from bitcoin_tools.analysis.status.synthetic import generate_chainstate, generate_utxos, OUT_TYPES
+from bitcoin_tools.analysis.status.utils import parse_ldb, get_chainstate_lastblock, encode_utxo
+from bitcoin_tools.core.script_types import get_script_type
+
+N_UTXOS = 3000
+SEED = 7
+
+# Every output type, equally likely and found at any height.
+TYPES = [(name, 1, 0) for name in OUT_TYPES]
+
+
+class SyntheticChainstateTest(unittest.TestCase):
+    """ Round trip of the synthetic chainstates: UTXOs written by generate_chainstate (obfuscated, and generated by
+    several processes) must be decoded by parse_ldb (hence decode_utxo) as the ones returned by generate_utxos.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = mkdtemp()
+        cls.data_path = CFG.data_path
+        CFG.data_path = cls.tmp_dir + "/"
+
+        # Small chunks, so the chainstate is generated by several jobs.
+        cls.chunk_size = synthetic.CHUNK_SIZE
+        synthetic.CHUNK_SIZE = 500
+
+        cls.chainstate = cls.tmp_dir + "/chainstate"
+        generate_chainstate(cls.chainstate, N_UTXOS, seed=SEED, types=TYPES, processes=3)
+        parse_ldb("/decoded_utxos.json", fin_name=cls.chainstate)
+
+        cls.decoded = [ujson.loads(line) for line in open(CFG.data_path + "/decoded_utxos.json")]
+        cls.generated = list(generate_utxos(N_UTXOS, seed=SEED, types=TYPES, processes=1))
+
+    @classmethod
+    def tearDownClass(cls):
+        CFG.data_path = cls.data_path
+        synthetic.CHUNK_SIZE = cls.chunk_size
+        rmtree(cls.tmp_dir)
+
+    def test_obfuscated(self):
+        import plyvel
+
+        db = plyvel.DB(self.chainstate, compression=None)
+        o_key = db.get(b'\x0e\x00obfuscate_key')
+        coin = next(db.iterator(prefix=b'C', include_key=False))
+        db.close()
+
+        self.assertEqual(len(o_key), 9)
+        self.assertNotEqual(o_key[1:], '\x00' * 8)
+        # Raw values are obfuscated, so they differ from their encoding.
+        self.assertNotIn(coin.encode('hex'), [encode_utxo(utxo)[1] for utxo in self.generated])
+
+        self.assertEqual(len(get_chainstate_lastblock(self.chainstate)), 64)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.decoded), N_UTXOS)
+
+        # The chainstate is sorted by outpoint, while UTXOs are generated by transaction.
+        generated = dict(((utxo['tx_id'], utxo['index']), utxo) for utxo in self.generated)
+        self.assertEqual(len(generated), N_UTXOS)
+
+        for utxo in self.decoded:
+            outpoint, coin = encode_utxo(generated[(utxo['tx_id'], utxo['index'])])
+            self.assertEqual(utxo.pop('len'), (len(outpoint) + len(coin)) / 2)
+            self.assertEqual(utxo, generated[(utxo['tx_id'], utxo['index'])])
+
+    def test_output_types(self):
+        out_types = set(utxo['out']['out_type'] for utxo in self.decoded)
+        # P2PKH, P2SH, compressed P2PK (even and odd) and uncompressed P2PK (even and odd).
+        self.assertTrue(set(range(NSPECIALSCRIPTS)).issubset(out_types))
+
+        # The rest of types are stored in full (random "unknown" scripts may also look like OP_RETURN ones).
+        script_types = set(get_script_type(utxo['out']['data']) for utxo in self.decoded
+                           if utxo['out']['out_type'] >= NSPECIALSCRIPTS)
+        self.assertTrue(set(["P2WPKH", "P2WSH", "P2TR", "P2MS", "unknown"]).issubset(script_types))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from bitcoin_tools.core.keys import serialize_pk
+from bitcoin_tools.core.script import InputScript, OutputScript
+from bitcoin_tools.core.transaction import verify_batch
+from bitcoin_tools.wallet import generate_btc_addr
+from interpreter_test import SKS, build_tx, flip_s, set_hashtype, tamper_sig
+
+
+class VerifyBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.p2pkh = OutputScript.P2PKH(generate_btc_addr(SKS[0].get_verifying_key()))
+        self.p2pk = OutputScript.P2PK(serialize_pk(SKS[0].get_verifying_key()))
+        self.p2ms = OutputScript.P2MS(2, 3, [serialize_pk(sk.get_verifying_key()) for sk in SKS])
+
+    def test_valid(self):
+        jobs = [(build_tx(self.p2pkh, SKS[0]), 0, self.p2pkh), (build_tx(self.p2pk, SKS[0]), 0, self.p2pk),
+                (build_tx(self.p2ms, SKS[:2]), 0, self.p2ms), (build_tx(self.p2ms, [SKS[2], SKS[0]]), 0, self.p2ms)]
+
+        self.assertEqual(verify_batch(jobs, processes=1), [True, True, True, False])
+
+    def test_invalid_signatures(self):
+        tampered = build_tx(self.p2pkh, SKS[0])
+        tamper_sig(tampered, flip_s)
+        empty = build_tx(self.p2pk, SKS[0])
+        empty.scriptSig[0] = InputScript.from_hex("00")
+        malformed = build_tx(self.p2pk, SKS[0])
+        tamper_sig(malformed, lambda sig: sig[:-6])
+        valid = build_tx(self.p2pkh, SKS[0])
+
+        jobs = [(tampered, 0, self.p2pkh), (empty, 0, self.p2pk), (malformed, 0, self.p2pk), (valid, 0, self.p2pkh)]
+        self.assertEqual(verify_batch(jobs, processes=1), [False, False, False, True])
+
+    def test_unsupported_hashtype(self):
+        for hashtype in ["81", "05"]:
+            unsupported = build_tx(self.p2pkh, SKS[0])
+            tamper_sig(unsupported, set_hashtype(hashtype))
+            multisig = build_tx(self.p2ms, SKS[:2])
+            tamper_sig(multisig, set_hashtype(hashtype))
+            jobs = [(unsupported, 0, self.p2pkh), (build_tx(self.p2pkh, SKS[0]), 0, self.p2pkh),
+                    (multisig, 0, self.p2ms)]
+
+            self.assertEqual(verify_batch(jobs, processes=1), [False, True, False])
+            self.assertEqual(verify_batch(jobs, processes=2), [False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
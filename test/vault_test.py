@@ -0,0 +1,100 @@
+from os import mkdir, path
+from shutil import rmtree
+from tempfile import mkdtemp
+import unittest
+
+from bitcoin_tools.core.keys import generate_keys, serialize_sk, store_keys
+from bitcoin_tools.core.vault import KeyVault, migrate_vault
+from bitcoin_tools.wallet import generate_btc_addr, sk_to_wif
+
+
+class KeyVaultTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.vault = KeyVault(path.join(self.tmp_dir, "vault.db"))
+
+        self.keys = [generate_keys() for _ in range(3)]
+        self.addrs = [generate_btc_addr(pk) for _, pk in self.keys]
+
+    def tearDown(self):
+        self.vault.close()
+        rmtree(self.tmp_dir)
+
+    def assertKeys(self, vault, btc_addr, keys):
+        sk, pk = vault.load_keys(btc_addr)
+        self.assertEqual(sk.to_string(), keys[0].to_string())
+        self.assertEqual(pk.to_string(), keys[1].to_string())
+
+    def test_store_load(self):
+        for (sk, pk), btc_addr in zip(self.keys, self.addrs):
+            self.vault.store_keys(sk, pk, btc_addr)
+
+        self.assertEqual(len(self.vault), 3)
+        self.assertEqual(sorted(self.vault.get_addresses()), sorted(self.addrs))
+
+        # Both from the cache of parsed keys and from the vault file.
+        for keys, btc_addr in zip(self.keys, self.addrs):
+            self.assertKeys(self.vault, btc_addr, keys)
+        vault = KeyVault(self.vault.db_path)
+        for keys, btc_addr in zip(self.keys, self.addrs):
+            self.assertKeys(vault, btc_addr, keys)
+        vault.close()
+
+        self.assertRaises(Exception, self.vault.load_keys, "unknown")
+
+    def test_import_replaces_cached_keys(self):
+        sk, pk = self.keys[0]
+        self.vault.store_keys(sk, pk, self.addrs[0])
+        self.assertKeys(self.vault, self.addrs[0], self.keys[0])
+
+        new_sk, new_pk = self.keys[1]
+        self.vault.import_keys([(self.addrs[0], new_sk.to_string(), new_pk.to_string())])
+
+        self.assertKeys(self.vault, self.addrs[0], self.keys[1])
+
+    def test_export_import(self):
+        wifs = dict()
+        for (sk, pk), btc_addr in zip(self.keys, self.addrs):
+            self.vault.store_keys(sk, pk, btc_addr)
+            wifs[btc_addr] = sk_to_wif(serialize_sk(sk), mode='text')
+        # The last address has no WIF.
+        del wifs[self.addrs[-1]]
+        self.vault.store_wifs(wifs)
+
+        exported = sorted(self.vault.export_keys())
+        self.assertEqual(exported, sorted((btc_addr, sk.to_string(), pk.to_string(), wifs.get(btc_addr))
+                                          for (sk, pk), btc_addr in zip(self.keys, self.addrs)))
+
+        vault = KeyVault(path.join(self.tmp_dir, "copy.db"))
+        vault.import_keys(exported)
+        self.assertEqual(sorted(vault.export_keys()), exported)
+
+        # Re-importing keys without their WIF keeps the stored one.
+        vault.import_keys([entry[:3] for entry in exported])
+        self.assertEqual(sorted(vault.export_keys()), exported)
+        for btc_addr in self.addrs:
+            self.assertEqual(vault.load_wif(btc_addr), wifs.get(btc_addr))
+
+        for keys, btc_addr in zip(self.keys, self.addrs):
+            self.assertKeys(vault, btc_addr, keys)
+        vault.close()
+
+    def test_migrate_into_open_vault(self):
+        vault_path = path.join(self.tmp_dir, "addresses") + "/"
+        mkdir(vault_path)
+
+        sk, pk = self.keys[0]
+        self.vault.store_keys(sk, pk, self.addrs[0])
+        self.assertKeys(self.vault, self.addrs[0], self.keys[0])
+
+        # The directory per address layout holds other keys for the same address.
+        new_sk, new_pk = self.keys[1]
+        store_keys(new_sk.to_pem(), new_pk.to_pem(), self.addrs[0], vault_path=vault_path)
+        self.assertIs(migrate_vault(vault_path, vault=self.vault), self.vault)
+
+        self.assertKeys(self.vault, self.addrs[0], self.keys[1])
+
+
+if __name__ == '__main__':
+    unittest.main()